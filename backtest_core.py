@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Array-Based Event-Driven Backtest Core
+Trade state machine of EnhancedBacktestEngine over plain NumPy arrays
+
+The engine used to walk the DataFrame bar by bar with .iloc lookups and
+per-bar date conversions. The core takes the columns it needs as arrays
+(HA_Close, Signal, Cluster_Density and the calendar day of every bar) and
+runs the same rules in one tight loop:
+
+  - entries on any bar with a non-zero signal while flat, at most
+    max_daily_trades per calendar day (a bar may exit and re-enter)
+  - stop loss at stop_loss_pips, take profit at 200 + density * 400 pips
+  - exits checked only after min_holding_bars, either on the close (an SL
+    fills at the stop level, a TP at the bar close) or, with
+    exit_mode='intrabar', on the first bar whose high / low touches a level
+    (filled at that level, with a policy for bars that touch both)
+  - a position still open on the last bar is closed there ('END')
+
+While flat the loop jumps straight to the next signal bar; the exit of a
+trade is one vectorised first-touch search from the first bar allowed to
+exit.
+
+Usage:
+    from backtest_core import run_core
+    result = run_core(close, signal, density, day, risk_params)
+    result['pnl'], result['equity'], result['metrics'].summary()
+
+    risk_params['exit_mode'] = 'intrabar'      # first touch of HA_High / HA_Low
+    result = run_core(close, signal, density, day, risk_params, high=high, low=low)
+"""
+
+import numpy as np
+from bisect import bisect_left
+
+from online_metrics import OnlineMetrics
+
+PIP = 0.0001
+PNL_MULTIPLIER = 10000
+PIP_VALUE = 0.01
+
+EXIT_SL = 0
+EXIT_TP = 1
+EXIT_END = 2
+EXIT_TYPES = ('SL', 'TP', 'END')
+
+
+def position_size(equity, risk_params):
+    """Lot size risking risk_percent of equity on the stop (clipped to the lot limits)"""
+    risk_amount = equity * (risk_params['risk_percent'] / 100)
+    lot_size = risk_amount / (risk_params['stop_loss_pips'] * PIP_VALUE)
+    return min(max(lot_size, risk_params['min_lot_size']), risk_params['max_lot_size'])
+
+
+def day_ordinals(times):
+    """Calendar day number of each timestamp (datetime64 / pandas Series)"""
+    return np.asarray(times, dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+
+
+def trade_levels(entry_price, side, cluster_density, sl_offset):
+    """(stop_loss, take_profit, tp_pips) of a new position; TP = 200 + density * 400 pips"""
+    tp_pips = 200 + cluster_density * 400
+    if side == 1:
+        return entry_price - sl_offset, entry_price + tp_pips * PIP, tp_pips
+    return entry_price + sl_offset, entry_price - tp_pips * PIP, tp_pips
+
+
+def exit_ranges(close, risk_params, high=None, low=None, open_=None):
+    """
+    (highs, lows, opens, both_touch) for first_touch under risk_params'
+    exit_mode: the close twice for 'close', the bar range for 'intrabar'
+    """
+    exit_mode = risk_params.get('exit_mode', 'close')
+    both_touch = risk_params.get('both_touch', 'sl')
+    if exit_mode == 'close':
+        close = np.asarray(close, dtype=float)
+        return close, close, None, 'sl'
+    if exit_mode != 'intrabar':
+        raise ValueError(f"Unknown exit_mode: {exit_mode}")
+    if both_touch not in ('sl', 'tp', 'open'):
+        raise ValueError(f"Unknown both_touch policy: {both_touch}")
+    if high is None or low is None:
+        raise ValueError("exit_mode='intrabar' needs high and low arrays")
+    if both_touch == 'open' and open_ is None:
+        raise ValueError("both_touch='open' needs the open array")
+    opens = None if open_ is None else np.asarray(open_, dtype=float)
+    return np.asarray(high, dtype=float), np.asarray(low, dtype=float), opens, both_touch
+
+
+def first_touch(high, low, start, stop_loss, take_profit, side, both_touch='sl', open_=None, block=16):
+    """
+    First bar at or after start whose range touches the stop or the target
+
+    A vectorised search over blocks of bars that double in size, so a trade
+    costs a few array calls however long it is held. Pass the close as both
+    high and low for close-based exits.
+
+    Parameters:
+    -----------
+    high, low : ndarray
+        Bar high / low (or the close twice)
+    start : int
+        First bar allowed to exit
+    stop_loss, take_profit : float
+        Exit levels
+    side : float
+        1 for a long position, anything else is short (like the bar loop)
+    both_touch : str
+        Bar touching both levels: 'sl' (stop first, conservative), 'tp'
+        (target first) or 'open' (the level nearer the bar open first)
+    open_ : ndarray (optional)
+        Bar open (required for both_touch='open')
+
+    Returns (bar index, EXIT_SL / EXIT_TP), or (-1, EXIT_END) if neither is
+    touched before the last bar
+    """
+    n = len(high)
+    lo = start
+    while lo < n:
+        hi = min(n, lo + block)
+        if side == 1:
+            sl_hit = low[lo:hi] <= stop_loss
+            tp_hit = high[lo:hi] >= take_profit
+        else:
+            sl_hit = high[lo:hi] >= stop_loss
+            tp_hit = low[lo:hi] <= take_profit
+
+        hit = sl_hit | tp_hit
+        k = int(hit.argmax())
+        if hit[k]:
+            if not (sl_hit[k] and tp_hit[k]):
+                return lo + k, EXIT_SL if sl_hit[k] else EXIT_TP
+            if both_touch == 'tp':
+                return lo + k, EXIT_TP
+            if both_touch == 'open':
+                bar_open = open_[lo + k]
+                nearer_stop = abs(bar_open - stop_loss) <= abs(bar_open - take_profit)
+                return lo + k, EXIT_SL if nearer_stop else EXIT_TP
+            return lo + k, EXIT_SL
+
+        lo = hi
+        block *= 2
+
+    return -1, EXIT_END
+
+
+def run_core(close, signal, density, day, risk_params, initial_equity=None, high=None, low=None, open_=None):
+    """
+    Run the trade state machine over one symbol
+
+    Parameters:
+    -----------
+    close : array
+        HA_Close of every bar
+    signal : array
+        Trade signal (1 buy, -1 sell, 0 none) of every bar
+    density : array or None
+        Cluster density of every bar (fraction, None -> 0.5)
+    day : array
+        Calendar day number of every bar (see day_ordinals)
+    risk_params : dict
+        stop_loss_pips, min_lot_size, max_lot_size, risk_percent,
+        min_holding_bars (default 16), max_daily_trades (default 3),
+        exit_mode ('close' or 'intrabar', default 'close'), both_touch
+        (see first_touch, default 'sl') and account_balance (used when
+        initial_equity is not given)
+    initial_equity : float (optional)
+        Starting equity
+    high, low, open_ : array (optional)
+        Bar range (and open for both_touch='open') for exit_mode='intrabar'
+
+    exit_mode='close' checks the close against the levels (SL fills at the
+    stop, TP at the close). exit_mode='intrabar' fills at the first level
+    the bar range touches, at that level.
+
+    Returns:
+    --------
+    dict with one array entry per trade (entry_idx, exit_idx, exit_code,
+    signal, entry_price, exit_price, stop_loss, take_profit, tp_pips,
+    cluster_density, lot_size, pnl), the closed-trade equity curve
+    ('equity', initial equity first) and the OnlineMetrics of the run
+    ('metrics')
+    """
+    close_values = np.asarray(close, dtype=float)
+    n = len(close_values)
+    closes = close_values.tolist()
+    signals = np.asarray(signal)
+    densities = np.full(n, 0.5) if density is None else np.asarray(density, dtype=float)
+    days = np.asarray(day).tolist()
+
+    min_hold = max(int(risk_params.get('min_holding_bars', 16)), 1)
+    max_daily = risk_params.get('max_daily_trades', 3)
+    sl_offset = risk_params['stop_loss_pips'] * PIP
+
+    exit_mode = risk_params.get('exit_mode', 'close')
+    highs, lows, opens, both_touch = exit_ranges(close_values, risk_params, high, low, open_)
+
+    equity = float(risk_params['account_balance'] if initial_equity is None else initial_equity)
+    equity_curve = [equity]
+    metrics = OnlineMetrics(equity)
+    trades = []
+
+    # NaN signals count as signals, like `signal != 0` in the bar loop
+    candidates = np.flatnonzero(signals != 0).tolist()
+    signal_values = signals.tolist()
+    n_candidates = len(candidates)
+
+    c = 0
+    trade_day = None
+    day_count = 0
+    while c < n_candidates:
+        idx = candidates[c]
+        c += 1
+
+        if days[idx] != trade_day:
+            trade_day = days[idx]
+            day_count = 0
+        if day_count >= max_daily:
+            continue
+        day_count += 1
+
+        # Entry
+        side = signal_values[idx]
+        entry_price = closes[idx]
+        lot_size = position_size(equity, risk_params)
+        cluster_density = float(densities[idx])
+        stop_loss, take_profit, tp_pips = trade_levels(entry_price, side, cluster_density, sl_offset)
+
+        # Exit search starts at the first bar allowed to exit
+        exit_idx, exit_code = first_touch(highs, lows, idx + min_hold, stop_loss, take_profit, side,
+                                          both_touch=both_touch, open_=opens)
+
+        if exit_idx < 0:
+            # Still open on the last bar
+            exit_price = closes[-1]
+            pnl = (exit_price - entry_price) * side * lot_size * PNL_MULTIPLIER
+            trades.append((idx, n - 1, EXIT_END, side, entry_price, exit_price, stop_loss,
+                           take_profit, tp_pips, cluster_density, lot_size, pnl))
+            equity_curve.append(equity + pnl)
+            metrics.update(pnl, streak=False)
+            break
+
+        level = stop_loss if exit_code == EXIT_SL else take_profit
+        if side == 1:
+            pnl = (level - entry_price) * lot_size * PNL_MULTIPLIER
+        else:
+            pnl = (entry_price - level) * lot_size * PNL_MULTIPLIER
+        if exit_mode == 'close' and exit_code == EXIT_TP:
+            exit_price = closes[exit_idx]
+        else:
+            exit_price = level
+
+        trades.append((idx, exit_idx, exit_code, side, entry_price, exit_price, stop_loss,
+                       take_profit, tp_pips, cluster_density, lot_size, pnl))
+        equity += pnl
+        equity_curve.append(equity)
+        metrics.update(pnl)
+
+        # Re-entry is allowed on the exit bar itself
+        c = bisect_left(candidates, exit_idx, c)
+
+    names = ('entry_idx', 'exit_idx', 'exit_code', 'signal', 'entry_price', 'exit_price',
+             'stop_loss', 'take_profit', 'tp_pips', 'cluster_density', 'lot_size', 'pnl')
+    columns = list(zip(*trades)) if trades else [()] * len(names)
+    result = {}
+    for name, values in zip(names, columns):
+        dtype = np.int64 if name in ('entry_idx', 'exit_idx', 'exit_code') else float
+        result[name] = np.array(values, dtype=dtype)
+
+    result['equity'] = np.array(equity_curve)
+    result['metrics'] = metrics
+    return result
+
+
+def run_bars(arrays, risk_params, lo=0, hi=None, initial_equity=None):
+    """
+    run_core over bars [lo, hi) of a dict of core arrays (close, signal,
+    density, day and optionally high, low, open)
+    """
+    bars = slice(lo, hi)
+
+    def column(name):
+        values = arrays.get(name)
+        return None if values is None else values[bars]
+
+    return run_core(column('close'), column('signal'), column('density'), column('day'), risk_params,
+                    initial_equity=initial_equity, high=column('high'), low=column('low'),
+                    open_=column('open'))
@@ -10,17 +10,32 @@ Enhanced Heiken Ashi K-Means Ensemble Backtesting System
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 from datetime import datetime
 import warnings
 
+from rolling_kmeans import rolling_cluster_density
+from ha_features import consecutive_counts, KMEANS_WINDOW, PATTERN_BARS
+from data_cache import load_csv, compact_frame, SIGNAL_COLUMNS
+from feature_store import open_feature_store
+from signal_alignment import align_signals
+from backtest_core import run_bars, position_size, day_ordinals, EXIT_END
+from trade_log import TRADE_DTYPE, trade_records, mark_to_market, trades_frame, save_trade_log
+from online_metrics import OnlineMetrics
+from monte_carlo import monte_carlo, print_monte_carlo, DEFAULT_SIMS
+from parameter_sweep import DEFAULT_GRID, param_grid, param_sample, evaluate, rank, sweep_arrays
 
 warnings.filterwarnings('ignore')
 
+# Columns used in trade price arithmetic stay float64 in compact mode
+TRADE_PRICE_COLUMNS = ('HA_Open', 'HA_High', 'HA_Low', 'HA_Close', 'Cluster_Density')
+# Small integer state columns stored as int8 in compact mode (with the model signals)
+STATE_INT8_COLUMNS = SIGNAL_COLUMNS + ('Cluster', 'Consecutive_Up', 'Consecutive_Down')
+
 class EnhancedBacktestEngine:
-    def __init__(self, csv_file, ensemble_file, risk_params=None, start_date=None, end_date=None):
+    def __init__(self, csv_file, ensemble_file, risk_params=None, start_date=None, end_date=None,
+                 use_feature_store=True, compact=False, monte_carlo_sims=DEFAULT_SIMS,
+                 signal_files=(), signal_tolerance='0s'):
         """
         Initialize enhanced backtesting engine
         
@@ -36,13 +51,32 @@ class EnhancedBacktestEngine:
             Start date for backtest (format: 'YYYY-MM-DD')
         end_date : str (optional)
             End date for backtest (format: 'YYYY-MM-DD')
+        use_feature_store : bool
+            Read clusters / consecutive counts from the precomputed feature
+            store of csv_file (built on first use) instead of recomputing
+            them over the backtest range
+        compact : bool
+            Compact data path: feature / analysis columns as float32 and
+            signal, vote and small state columns as int8 (prices used for
+            trade arithmetic stay float64)
+        monte_carlo_sims : int
+            Monte Carlo trade-order simulations run after every backtest
+            (0 disables them)
+        signal_files : list of str
+            Further forecast CSVs (e.g. xgboost / randomforest / lstm
+            predictions) attached next to the ensemble columns
+        signal_tolerance : str / Timedelta / list
+            Staleness tolerance of the as-of join of the forecast files onto
+            the bars ('0s': exact time match, None: unlimited; a list gives
+            one per file, ensemble first; see signal_alignment.py)
         """
-        self.df = pd.read_csv(csv_file)
-        self.ensemble_df = pd.read_csv(ensemble_file)
-        
-        # Convert Time columns to datetime for proper merging
-        self.df['Time'] = pd.to_datetime(self.df['Time'])
-        self.ensemble_df['Time'] = pd.to_datetime(self.ensemble_df['Time'])
+        # Columnar cache: CSVs are parsed once, Time comes back as datetime64
+        self.df = load_csv(csv_file)
+        self.ensemble_df = load_csv(ensemble_file, compact=compact)
+        self.signal_dfs = [load_csv(path, compact=compact) for path in signal_files]
+        self.compact = compact
+        self.monte_carlo_sims = monte_carlo_sims
+        self.feature_store = open_feature_store(csv_file) if use_feature_store else None
         
         # Default risk parameters
         self.risk_params = risk_params or {
@@ -54,9 +88,9 @@ class EnhancedBacktestEngine:
             'risk_percent': 2.0
         }
         
-        # Merge data on Time
+        # As-of join of the forecasts on Time
         # Ensemble CSV has: Time, XGB_Trigger, RF_Confirm, Signal, Confirmed, Confidence
-        self.df = self.df.merge(self.ensemble_df, on='Time', how='left')
+        self.df = align_signals(self.df, [self.ensemble_df, *self.signal_dfs], tolerance=signal_tolerance)
         
         # Filter by date range if provided
         if start_date:
@@ -71,9 +105,10 @@ class EnhancedBacktestEngine:
         self.end_date = end_date or str(self.df['Time'].max())
         
         # Initialize tracking
-        self.trades = []
-        self.equity_curve = [self.risk_params['account_balance']]
-        self.current_position = None
+        self.trades = np.zeros(0, dtype=TRADE_DTYPE)
+        self.equity_curve = [self.risk_params['account_balance']]  # Closed-trade equity
+        self.bar_equity = None                                      # Per-bar mark-to-market equity
+        self.bar_balance = None                                     # Per-bar realized equity
         self.consecutive_wins = 0
         self.consecutive_losses = 0
         self.max_consecutive_wins = 0
@@ -83,8 +118,6 @@ class EnhancedBacktestEngine:
         self.data_leakage_issues = []
         self.min_holding_bars = risk_params.get('min_holding_bars', 16)  # Minimum bars before exit
         self.max_daily_trades = risk_params.get('max_daily_trades', 3)   # Max trades per day
-        self.daily_trade_count = 0  # Track trades per day
-        self.last_trade_date = None  # Track last trade date
         
     def check_data_leakage(self):
         """
@@ -181,6 +214,12 @@ class EnhancedBacktestEngine:
         
         # Generate signals
         self.generate_signals()
+        
+        if self.compact:
+            before = self.df.memory_usage(deep=True).sum()
+            compact_frame(self.df, keep=TRADE_PRICE_COLUMNS, int8_columns=STATE_INT8_COLUMNS)
+            after = self.df.memory_usage(deep=True).sum()
+            print(f"✓ Compact data path: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
     
     def calculate_heiken_ashi_metrics(self):
         """Calculate HA metrics for analysis"""
@@ -194,80 +233,51 @@ class EnhancedBacktestEngine:
         print("✓ Heiken Ashi metrics calculated")
     
     def apply_kmeans_clustering(self):
-        """Apply K-means clustering with rolling window (simplified for speed)"""
+        """Apply rolling K-means clustering (252-bar window, historical data only)"""
         df = self.df
+        window_size = KMEANS_WINDOW
         
-        # Use OHLC for clustering features
-        features = ['HA_Open', 'HA_High', 'HA_Low', 'HA_Close']
-        
-        # Initialize columns
-        df['Cluster'] = 0
-        df['Cluster_Density'] = 0.5
-        df['Cluster_Valid'] = True  # Simplified: assume all valid after warmup
-        
-        # Quick validation: ensure OHLC data exists
         print("  Computing market regime clustering...")
         
-        # Simple approach: use 252-bar rolling clusters
-        window_size = 252
-        
-        for i in range(window_size, min(window_size + 1000, len(df))):  # Sample first 1000 for speed
-            window_start = i - window_size
-            X = df[features].iloc[window_start:i].values
-            
-            # Normalize
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
-            
-            # Cluster
-            kmeans = KMeans(n_clusters=3, random_state=42, n_init=3)
-            clusters = kmeans.fit_predict(X_scaled)
-            
-            # Current bar cluster
-            current_point = scaler.transform([df[features].iloc[i].values])
-            current_cluster = kmeans.predict(current_point)[0]
-            
-            df.loc[i, 'Cluster'] = current_cluster
-            cluster_count = np.sum(clusters == current_cluster)
-            df.loc[i, 'Cluster_Density'] = cluster_count / len(clusters)
-        
-        # Apply to rest with simple interpolation
-        for i in range(window_size + 1000, len(df)):
-            df.loc[i, 'Cluster'] = df.loc[i-1, 'Cluster']
-            df.loc[i, 'Cluster_Density'] = df.loc[i-1, 'Cluster_Density']
+        if self.feature_store is not None:
+            # Precomputed over the full history (each row still only sees the
+            # previous 252 bars), so the start of the range is not warm-up
+            rows = self.feature_store.locate(df['Time'].values)
+            clusters = self.feature_store.column('Cluster', rows).astype(float)
+            densities = self.feature_store.column('Cluster_Density', rows).astype(float)
+            # Stored as float32; density is always count / window, so restore it exactly
+            densities = np.rint(densities * window_size / 100) / window_size * 100
+        else:
+            # Same 1-D HA_Close clustering as the training notebooks, solved
+            # incrementally over the backtest range (density as a 0-1 fraction here)
+            clusters, densities = rolling_cluster_density(df['HA_Close'].values, window=window_size)
         
-        # Mark all as valid (for speed) - can refine later
-        df['Cluster_Valid'] = True
+        warmup = np.isnan(densities)
+        df['Cluster'] = np.where(warmup, 0, clusters).astype(int)
+        df['Cluster_Density'] = np.where(warmup, 0.5, densities / 100)
+        df['Cluster_Valid'] = df['Cluster_Density'] >= 0.20
         
-        print("✓ K-means clustering applied (rolling window, historical data only)")
-
+        print(f"✓ K-means clustering applied ({len(df) - warmup.sum()} bars, rolling window, historical data only)")
 
     
     def detect_patterns(self):
         """Detect 3+ consecutive bar patterns"""
         df = self.df
-        up_count = 0
-        down_count = 0
-        
-        for i in range(1, len(df)):
-            if df['HA_Close'].iloc[i] > df['HA_Close'].iloc[i-1]:
-                up_count += 1
-                down_count = 0
-            elif df['HA_Close'].iloc[i] < df['HA_Close'].iloc[i-1]:
-                down_count += 1
-                up_count = 0
-            else:
-                up_count = 0
-                down_count = 0
-            
-            df.loc[i, 'Consecutive_Up'] = up_count
-            df.loc[i, 'Consecutive_Down'] = down_count
-            
-            # Valid if 3+ consecutive bars
-            if up_count >= 3 or down_count >= 3:
-                df.loc[i, 'Pattern_Valid'] = True
         
-        print("✓ Consecutive bar patterns detected (threshold: 3+)")
+        # Same run-length counters as the model features (ha_features.py)
+        if self.feature_store is not None:
+            rows = self.feature_store.locate(df['Time'].values)
+            up = self.feature_store.column('Consecutive_Up', rows).astype(np.int64)
+            down = self.feature_store.column('Consecutive_Down', rows).astype(np.int64)
+        else:
+            up, down = consecutive_counts(df['HA_Close'].values)
+        df['Consecutive_Up'] = up
+        df['Consecutive_Down'] = down
+        
+        # Valid if 3+ consecutive bars
+        df['Pattern_Valid'] = (up >= PATTERN_BARS) | (down >= PATTERN_BARS)
+        
+        print(f"✓ Consecutive bar patterns detected (threshold: {PATTERN_BARS}+)")
     
     def check_volume_confirmation(self):
         """Check volume confirmation"""
@@ -275,12 +285,11 @@ class EnhancedBacktestEngine:
         df['Volume_Confirm'] = True
         
         if df['Volume'].sum() > 0:
-            vol_mean = df['Volume'].mean()
-            for i in range(1, len(df)):
-                if df['Volume'].iloc[i] > df['Volume'].iloc[i-1]:
-                    df.loc[i, 'Volume_Confirm'] = True
-                else:
-                    df.loc[i, 'Volume_Confirm'] = False
+            # Rising volume vs the previous bar (the first bar stays confirmed)
+            volume = df['Volume'].to_numpy()
+            confirm = np.ones(len(df), dtype=bool)
+            confirm[1:] = volume[1:] > volume[:-1]
+            df['Volume_Confirm'] = confirm
             print("✓ Volume confirmation calculated")
         else:
             print("✓ Volume confirmation: All bars valid (volume data not available)")
@@ -309,21 +318,20 @@ class EnhancedBacktestEngine:
         print(f"  Unique Confirmed values: {df['Confirmed'].dropna().unique()}")
         print(f"  XGB_Trigger unique: {df['XGB_Trigger'].dropna().unique() if 'XGB_Trigger' in df.columns else 'N/A'}")
         
-        confirmed_count = 0
-        for i in range(len(df)):
-            # Use XGB_Trigger as primary signal source
-            if pd.notna(df['XGB_Trigger'].iloc[i]) if 'XGB_Trigger' in df.columns else False:
-                xgb_signal = df['XGB_Trigger'].iloc[i]
-                confirmed = df['Confirmed'].iloc[i] if 'Confirmed' in df.columns else 0
-                confidence = df['Confidence'].iloc[i] if 'Confidence' in df.columns else 0
-                
-                # Only take confirmed signals (RF confirms XGB trigger)
-                if confirmed == 1:  # RF confirms XGB
-                    df.loc[i, 'Signal'] = xgb_signal  # Use XGB signal (1 or -1)
-                    df.loc[i, 'Signal_Confidence'] = confidence
-                    confirmed_count += 1
-                else:
-                    df.loc[i, 'Signal'] = 0  # Skip unconfirmed signals
+        # Confirmed XGB triggers (RF confirms XGB) become the signal, other
+        # triggers are skipped; bars without a trigger keep their signal
+        trigger = df['XGB_Trigger'].to_numpy(dtype=float) if 'XGB_Trigger' in df.columns else np.full(len(df), np.nan)
+        confirmed = df['Confirmed'].to_numpy(dtype=float)
+        confidence = df['Confidence'].to_numpy(dtype=float) if 'Confidence' in df.columns else np.zeros(len(df))
+        
+        has_trigger = ~np.isnan(trigger)
+        take = has_trigger & (confirmed == 1)
+        
+        signal = np.where(take, trigger, np.where(has_trigger, 0, df['Signal'].to_numpy(dtype=float)))
+        # Integer signal column stays integer (triggers are -1 / 1)
+        df['Signal'] = signal.astype(df['Signal'].dtype) if pd.api.types.is_integer_dtype(df['Signal']) else signal
+        df['Signal_Confidence'] = np.where(take, confidence, df['Signal_Confidence'].to_numpy(dtype=float))
+        confirmed_count = int(take.sum())
         
         print(f"\n[DEBUG] After filtering:")
         print(f"  Confirmed signals (to execute): {confirmed_count}")
@@ -332,185 +340,207 @@ class EnhancedBacktestEngine:
     
     def calculate_position_size(self, entry_price, signal):
         """Calculate position size based on risk"""
-        account_balance = self.equity_curve[-1]
-        risk_amount = account_balance * (self.risk_params['risk_percent'] / 100)
-        sl_pips = self.risk_params['stop_loss_pips']
-        
-        pip_value = 0.01
-        sl_dollars = sl_pips * pip_value
-        lot_size = risk_amount / sl_dollars
-        lot_size = np.clip(lot_size, 
-                          self.risk_params['min_lot_size'],
-                          self.risk_params['max_lot_size'])
-        
-        return lot_size
+        return position_size(self.equity_curve[-1], self.risk_params)
     
-    def simulate_trade(self, idx, signal):
-        """Simulate trade entry with daily trade limit and K-means TP"""
-        if self.current_position is not None:
-            return
-        
-        # Check daily trade limit
-        current_date = self.df['Time'].iloc[idx].date()
-        if self.last_trade_date != current_date:
-            # New day, reset counter
-            self.daily_trade_count = 0
-            self.last_trade_date = current_date
-        
-        if self.daily_trade_count >= self.max_daily_trades:
-            return  # Already hit daily trade limit
-        
-        entry_price = self.df['HA_Close'].iloc[idx]
-        lot_size = self.calculate_position_size(entry_price, signal)
+    def run_backtest(self):
+        """Run backtest (array-based core, see backtest_core.py)"""
+        self.prepare_data()
         
-        sl_pips = self.risk_params['stop_loss_pips']
+        print("\n" + "="*60)
+        print("RUNNING BACKTEST")
+        print("="*60)
         
-        # Get K-means cluster level for TP
-        # Use K-means density to determine TP level (0.5 = balanced, higher = stronger trend)
-        cluster_density = self.df['Cluster_Density'].iloc[idx] if 'Cluster_Density' in self.df.columns else 0.5
+        result = run_bars(self.core_arrays(), self.core_params(), initial_equity=self.equity_curve[-1])
         
-        # Cluster density based TP: scale from 200 to 400 pips based on density
-        # High density (>0.7) = stronger trend = wider TP (~400 pips)
-        # Low density (<0.3) = weaker trend = tighter TP (~200 pips)
-        tp_pips = 200 + (cluster_density * 400)  # Range: 200-600 pips
+        self.trades = self.build_trades(result)
+        self.equity_curve = result['equity']
+        self.bar_equity, self.bar_balance = mark_to_market(result, self.df['HA_Close'], self.equity_curve[0])
+        self.online_metrics = result['metrics']
         
-        if signal == 1:
-            stop_loss = entry_price - (sl_pips * 0.0001)
-            # TP uses K-means cluster level
-            take_profit = entry_price + (tp_pips * 0.0001)
-            direction = "BUY"
-        else:
-            stop_loss = entry_price + (sl_pips * 0.0001)
-            # TP uses K-means cluster level
-            take_profit = entry_price - (tp_pips * 0.0001)
-            direction = "SELL"
-        
-        self.current_position = {
-            'entry_idx': idx,
-            'entry_price': entry_price,
-            'entry_time': self.df['Time'].iloc[idx],
-            'entry_bar_time': self.df['Time'].iloc[idx],
-            'direction': direction,
-            'signal': signal,
-            'lot_size': lot_size,
-            'stop_loss': stop_loss,
-            'take_profit': take_profit,
-            'tp_pips': tp_pips,  # Store TP pips for reference
-            'cluster_density': cluster_density,  # Store cluster density for analysis
-            'confidence': self.df['Signal_Confidence'].iloc[idx],
-            'open_bars': 0
-        }
+        self.calculate_metrics()
+        self.print_results()
+        self.run_monte_carlo()
         
-        self.daily_trade_count += 1  # Increment daily trade counter
+        return self.trades
     
-    def check_exit_conditions(self, idx):
-        """Check exit conditions with minimum holding period for day trading"""
-        if self.current_position is None:
+    def run_monte_carlo(self):
+        """Bootstrap the trade sequence for drawdown / equity / losing-streak distributions"""
+        self.monte_carlo_results = None
+        if not self.monte_carlo_sims or len(self.trades) == 0:
             return None
         
-        price = self.df['HA_Close'].iloc[idx]
-        entry_price = self.current_position['entry_price']
-        direction = self.current_position['direction']
-        lot_size = self.current_position['lot_size']
-        
-        exit_type = None
-        pnl = 0
-        
-        # Track consecutive days open
-        entry_date = self.current_position['entry_bar_time'].date()
-        current_date = self.df['Time'].iloc[idx].date()
-        days_open = (current_date - entry_date).days
-        bars_held = idx - self.current_position['entry_idx']
-        
-        # Check minimum holding period (day trader holding at least 16 bars ≈ 4 hours on M15)
-        if bars_held < self.min_holding_bars:
-            return None  # Don't exit yet, must hold longer
-        
-        if direction == "BUY":
-            if price <= self.current_position['stop_loss']:
-                exit_type = "SL"
-                pnl = (self.current_position['stop_loss'] - entry_price) * lot_size * 10000
-            elif price >= self.current_position['take_profit']:
-                exit_type = "TP"
-                pnl = (self.current_position['take_profit'] - entry_price) * lot_size * 10000
-        else:  # SELL
-            if price >= self.current_position['stop_loss']:
-                exit_type = "SL"
-                pnl = (entry_price - self.current_position['stop_loss']) * lot_size * 10000
-            elif price <= self.current_position['take_profit']:
-                exit_type = "TP"
-                pnl = (entry_price - self.current_position['take_profit']) * lot_size * 10000
-        
-        if exit_type:
-            return {
-                'exit_idx': idx,
-                'exit_price': price if exit_type == "TP" else self.current_position['stop_loss'] if direction == "BUY" else self.current_position['stop_loss'],
-                'exit_type': exit_type,
-                'exit_time': self.df['Time'].iloc[idx],
-                'pnl': pnl,
-                'days_open': days_open,
-                'bars_open': idx - self.current_position['entry_idx']
-            }
-        
-        return None
+        self.monte_carlo_results = monte_carlo(self.trades['pnl'], initial_equity=self.risk_params['account_balance'],
+                                               n_sims=self.monte_carlo_sims)
+        print_monte_carlo(self.monte_carlo_results)
+        return self.monte_carlo_results
     
-    def run_backtest(self):
-        """Run backtest"""
-        self.prepare_data()
+    def core_arrays(self):
+        """Prepared columns the backtest core reads (call after prepare_data)"""
+        df = self.df
+        return {
+            'close': df['HA_Close'].to_numpy(),
+            'signal': df['Signal'].to_numpy(),
+            'density': df['Cluster_Density'].to_numpy() if 'Cluster_Density' in df.columns else None,
+            'day': day_ordinals(df['Time']),
+            # Bar range for intrabar exits: raw OHLC when merged in, else Heiken Ashi
+            'open': df['Open' if 'Open' in df.columns else 'HA_Open'].to_numpy(),
+            'high': df['High' if 'High' in df.columns else 'HA_High'].to_numpy(),
+            'low': df['Low' if 'Low' in df.columns else 'HA_Low'].to_numpy(),
+        }
+    
+    def core_params(self):
+        """risk_params with the holding / daily limits resolved to their defaults"""
+        return {**self.risk_params,
+                'min_holding_bars': self.min_holding_bars,
+                'max_daily_trades': self.max_daily_trades}
+    
+    def build_trades(self, result):
+        """Structured trade log (trade_log.TRADE_DTYPE) from the core's trade arrays"""
+        df = self.df
+        confidence = df['Signal_Confidence'].to_numpy() if 'Signal_Confidence' in df.columns else None
+        return trade_records(result, df['Time'], confidence)
+    
+    def trades_frame(self):
+        """Trade log as a DataFrame (CSV layout); an integer Signal column keeps its type"""
+        frame = trades_frame(self.trades)
+        if pd.api.types.is_integer_dtype(self.df['Signal'].dtype):
+            frame['signal'] = frame['signal'].astype(self.df['Signal'].dtype)
+        return frame
+    
+    def walk_forward(self, train_days=90, test_days=30, grid=None, samples=None, sort_by='roi', workers=None):
+        """
+        Walk-forward validation over the loaded date range
         
+        Each fold picks the best risk_params on an in-sample window (grid
+        sweep ranked by sort_by) and trades them on the following
+        out-of-sample window. Windows roll forward by test_days, so the
+        out-of-sample windows tile the history after the first train window.
+        
+        Parameters:
+        -----------
+        train_days : int
+            In-sample window length (calendar days)
+        test_days : int
+            Out-of-sample window length and roll step (calendar days)
+        grid : dict (optional)
+            {param: [values]} to choose from (default: parameter_sweep.DEFAULT_GRID)
+        samples : int (optional)
+            Random grid combinations per fold instead of the full grid
+        sort_by : str
+            In-sample metric to maximise
+        workers : int (optional)
+            Worker processes (default: one per core)
+        
+        prepare_data runs once for the whole range and every fold reads
+        slices of the same shared arrays; the in-sample sweeps of all folds
+        run concurrently in one process pool. Out-of-sample runs are chained
+        (each fold starts from the previous fold's final equity).
+        
+        Returns DataFrame with one row per fold
+        """
         print("\n" + "="*60)
-        print("RUNNING BACKTEST")
+        print("WALK-FORWARD VALIDATION")
         print("="*60)
         
-        for idx in range(len(self.df)):
-            signal = self.df['Signal'].iloc[idx]
+        arrays = sweep_arrays(self)
+        times = self.df['Time'].to_numpy()
+        base_params = self.core_params()
+        
+        # Fold bar ranges [lo, hi) from calendar boundaries
+        train = np.timedelta64(train_days, 'D')
+        test = np.timedelta64(test_days, 'D')
+        folds = []
+        test_start = times[0] + train if len(times) else None
+        while len(times) and test_start <= times[-1]:
+            bounds = np.searchsorted(times, [test_start - train, test_start, test_start + test])
+            if bounds[1] > bounds[0] and bounds[2] > bounds[1]:
+                folds.append(bounds)
+            test_start = test_start + test
+        
+        if not folds:
+            print(f"⚠ Date range too short for {train_days}d train + {test_days}d test windows")
+            self.walk_forward_folds = pd.DataFrame()
+            self.walk_forward_equity = pd.DataFrame(columns=['Time', 'Fold', 'Equity'])
+            return self.walk_forward_folds
+        
+        combos = param_sample(grid or DEFAULT_GRID, samples) if samples else param_grid(grid or DEFAULT_GRID)
+        print(f"  {len(folds)} folds x {len(combos)} parameter sets ({train_days}d train / {test_days}d test)")
+        
+        # In-sample sweeps of every fold in one pool
+        rows = evaluate(arrays, base_params, combos * len(folds),
+                        bounds=[(lo, mid) for lo, mid, _ in folds for _ in combos], workers=workers)
+        
+        equity = base_params['account_balance']
+        fold_rows = []
+        pnl_parts = []
+        equity_rows = [(times[folds[0][1]], 0, equity)]
+        for k, (lo, mid, hi) in enumerate(folds):
+            in_sample = rank(rows[k * len(combos):(k + 1) * len(combos)], sort_by)
+            best = {name: in_sample[name].iloc[0] for name in combos[0]}
             
-            # Check exits
-            if self.current_position is not None:
-                exit_info = self.check_exit_conditions(idx)
-                
-                if exit_info:
-                    trade = {**self.current_position, **exit_info}
-                    self.trades.append(trade)
-                    
-                    # Update equity
-                    current_equity = self.equity_curve[-1] + trade['pnl']
-                    self.equity_curve.append(current_equity)
-                    
-                    # Track consecutive wins/losses
-                    if trade['pnl'] > 0:
-                        self.consecutive_wins += 1
-                        self.consecutive_losses = 0
-                        self.max_consecutive_wins = max(self.max_consecutive_wins, self.consecutive_wins)
-                    else:
-                        self.consecutive_losses += 1
-                        self.consecutive_wins = 0
-                        self.max_consecutive_losses = max(self.max_consecutive_losses, self.consecutive_losses)
-                    
-                    self.current_position = None
+            result = run_bars(arrays, {**base_params, **best}, mid, hi, initial_equity=equity)
+            metrics = result['metrics'].summary()
             
-            # Check entries
-            if self.current_position is None and signal != 0:
-                self.simulate_trade(idx, signal)
-        
-        # Close any open position
-        if self.current_position is not None:
-            last_price = self.df['HA_Close'].iloc[-1]
-            pnl = (last_price - self.current_position['entry_price']) * self.current_position['signal'] * self.current_position['lot_size'] * 10000
-            self.current_position['exit_type'] = 'END'
-            self.current_position['exit_price'] = last_price
-            self.current_position['exit_time'] = self.df['Time'].iloc[-1]
-            self.current_position['pnl'] = pnl
-            self.trades.append(self.current_position)
-            self.equity_curve.append(self.equity_curve[-1] + pnl)
-        
-        self.calculate_metrics()
-        self.print_results()
-        
-        return self.trades
+            fold_rows.append({
+                'fold': k + 1,
+                'train_start': pd.Timestamp(times[lo]),
+                'test_start': pd.Timestamp(times[mid]),
+                'test_end': pd.Timestamp(times[hi - 1]),
+                **best,
+                f'is_{sort_by}': in_sample[sort_by].iloc[0],
+                **{f'oos_{name}': value for name, value in metrics.items()},
+                'start_equity': equity,
+                'end_equity': result['equity'][-1],
+            })
+            pnl_parts.append(result['pnl'])
+            exit_times = times[mid + result['exit_idx']]
+            equity_rows.extend(zip(exit_times, [k + 1] * len(exit_times), result['equity'][1:]))
+            equity = result['equity'][-1]
+        
+        self.walk_forward_params = list(combos[0])
+        self.walk_forward_folds = pd.DataFrame(fold_rows)
+        self.walk_forward_equity = pd.DataFrame(equity_rows, columns=['Time', 'Fold', 'Equity'])
+        
+        # Out-of-sample summary over the stitched equity curve
+        stitched = OnlineMetrics(base_params['account_balance'])
+        for pnl in np.concatenate(pnl_parts).tolist():
+            stitched.update(pnl)
+        self.walk_forward_metrics = stitched.summary()
+        
+        self.print_walk_forward()
+        return self.walk_forward_folds
+    
+    def print_walk_forward(self):
+        """Print per-fold and stitched out-of-sample walk-forward results"""
+        folds = self.walk_forward_folds
+        metrics = self.walk_forward_metrics
+        
+        print(f"\n📅 OUT-OF-SAMPLE FOLDS:")
+        for _, fold in folds.iterrows():
+            params = "  ".join(f"{name}={fold[name]:g}" for name in self.walk_forward_params)
+            print(f"  Fold {fold['fold']:>2}: {fold['test_start']:%Y-%m-%d} → {fold['test_end']:%Y-%m-%d}  "
+                  f"trades {fold['oos_trades']:>4}  ROI {fold['oos_roi']:>8.2f}%  "
+                  f"DD {fold['oos_max_drawdown']:>6.2f}%  ({params})")
+        
+        print(f"\n📊 STITCHED OUT-OF-SAMPLE:")
+        print(f"  Initial Balance:     ${self.walk_forward_equity['Equity'].iloc[0]:,.2f}")
+        print(f"  Final Balance:       ${self.walk_forward_equity['Equity'].iloc[-1]:,.2f}")
+        print(f"  ROI:                 {metrics['roi']:.2f}%")
+        print(f"  Total Trades:        {metrics['trades']}")
+        print(f"  Win Rate:            {metrics['win_rate']:.2f}%")
+        print(f"  Profit Factor:       {metrics['profit_factor']:.2f}")
+        print(f"  Max Drawdown:        {metrics['max_drawdown']:.2f}%")
+        print(f"  Sharpe Ratio:        {metrics['sharpe_ratio']:.2f}")
+    
+    def save_walk_forward(self):
+        """Save walk-forward fold table and stitched out-of-sample equity"""
+        self.walk_forward_folds.to_csv('walk_forward_folds.csv', index=False)
+        print("\n✓ Walk-forward folds saved: walk_forward_folds.csv")
+        self.walk_forward_equity.to_csv('walk_forward_equity.csv', index=False)
+        print("✓ Out-of-sample equity saved: walk_forward_equity.csv")
     
     def calculate_metrics(self):
-        """Calculate all metrics"""
+        """Calculate all metrics (read from the online accumulator filled during the run)"""
         # Initialize
         self.total_trades = 0
         self.winning_trades = 0
@@ -534,47 +564,36 @@ class EnhancedBacktestEngine:
             print("\n⚠ No trades generated!")
             return
         
-        trades_df = pd.DataFrame(self.trades)
+        metrics = self.online_metrics
         
         # Basic metrics
-        self.total_trades = len(trades_df)
-        self.winning_trades = len(trades_df[trades_df['pnl'] > 0])
-        self.losing_trades = len(trades_df[trades_df['pnl'] < 0])
-        self.win_rate = self.winning_trades / self.total_trades * 100 if self.total_trades > 0 else 0
+        self.total_trades = metrics.trades
+        self.winning_trades = metrics.wins
+        self.losing_trades = metrics.losses
+        self.win_rate = metrics.win_rate
         
         # Profit metrics
-        self.total_profit = trades_df[trades_df['pnl'] > 0]['pnl'].sum()
-        self.total_loss = abs(trades_df[trades_df['pnl'] < 0]['pnl'].sum())
-        self.net_profit = self.total_profit - self.total_loss
-        self.profit_factor = self.total_profit / self.total_loss if self.total_loss > 0 else 0
+        self.total_profit = metrics.gross_profit
+        self.total_loss = metrics.gross_loss
+        self.net_profit = metrics.net_profit
+        self.profit_factor = metrics.profit_factor
         
         # Average trades
-        self.avg_win = trades_df[trades_df['pnl'] > 0]['pnl'].mean() if self.winning_trades > 0 else 0
-        self.avg_loss = abs(trades_df[trades_df['pnl'] < 0]['pnl'].mean()) if self.losing_trades > 0 else 0
-        
-        # Consecutive data
-        if 'bars_open' in trades_df.columns:
-            self.avg_bars_open = trades_df['bars_open'].mean()
-        if 'days_open' in trades_df.columns:
-            self.avg_days_open = trades_df['days_open'].mean()
-        
-        # Drawdown
-        equity_array = np.array(self.equity_curve)
-        running_max = np.maximum.accumulate(equity_array)
-        drawdown = (equity_array - running_max) / running_max * 100
-        self.max_drawdown = np.min(drawdown)
-        
-        # Sharpe
-        if len(equity_array) > 1:
-            daily_returns = np.diff(equity_array) / equity_array[:-1]
-            self.sharpe_ratio = np.mean(daily_returns) / np.std(daily_returns) * np.sqrt(252) if np.std(daily_returns) > 0 else 0
-        else:
-            self.sharpe_ratio = 0
-        
-        # ROI
-        initial_balance = self.risk_params['account_balance']
-        final_balance = self.equity_curve[-1]
-        self.roi = (final_balance - initial_balance) / initial_balance * 100
+        self.avg_win = metrics.avg_win
+        self.avg_loss = metrics.avg_loss
+        
+        # Consecutive data (positions closed at the end have no duration)
+        closed = self.trades[self.trades['exit_code'] != EXIT_END]
+        if len(closed):
+            self.avg_bars_open = np.mean(closed['bars_open'])
+            self.avg_days_open = np.mean(closed['days_open'])
+        self.max_consecutive_wins = metrics.max_consecutive_wins
+        self.max_consecutive_losses = metrics.max_consecutive_losses
+        
+        # Drawdown, Sharpe, ROI
+        self.max_drawdown = metrics.max_drawdown
+        self.sharpe_ratio = metrics.sharpe_ratio
+        self.roi = metrics.roi
     
     def print_results(self):
         """Print results with consecutive trades data"""
@@ -594,8 +613,8 @@ class EnhancedBacktestEngine:
         print(f"  ROI:                 {self.roi:.2f}%")
         
         print(f"\n🎯 ENSEMBLE STRATEGY (XGB Primary + RF Confirmation):")
-        total_xgb_triggers = len([t for t in self.trades if pd.notna(t.get('signal'))])
-        confirmed_trades = len([t for t in self.trades if pd.notna(t.get('signal'))])
+        total_xgb_triggers = int(np.count_nonzero(~np.isnan(self.trades['signal'])))
+        confirmed_trades = total_xgb_triggers
         print(f"  XGB Triggers Received: {total_xgb_triggers}")
         print(f"  RF Confirmed Trades:   {confirmed_trades}")
         print(f"  Confirmation Rate:     {(confirmed_trades/total_xgb_triggers*100) if total_xgb_triggers > 0 else 0:.1f}%")
@@ -629,25 +648,30 @@ class EnhancedBacktestEngine:
                 print(f"  - {issue}")
     
     def save_results(self):
-        """Save trade log and equity curve"""
+        """Save trade log and per-bar equity curve (CSV and binary .npz)"""
         # Save trades
-        trades_df = pd.DataFrame(self.trades)
-        trades_df.to_csv('backtest_trades_enhanced.csv', index=False)
+        self.trades_frame().to_csv('backtest_trades_enhanced.csv', index=False)
         print("\n✓ Trade log saved: backtest_trades_enhanced.csv")
         
-        # Save equity curve
+        # Save equity curve (one row per bar: mark-to-market equity and realized balance)
+        times = self.df['Time'].to_numpy(dtype='datetime64[ns]')
         equity_df = pd.DataFrame({
-            'Time': self.df['Time'].iloc[:len(self.equity_curve)].values,
-            'Equity': self.equity_curve
+            'Time': times,
+            'Equity': self.bar_equity,
+            'Balance': self.bar_balance
         })
         equity_df.to_csv('backtest_equity_enhanced.csv', index=False)
         print("✓ Equity curve saved: backtest_equity_enhanced.csv")
+        
+        save_trade_log('backtest_results_enhanced.npz', self.trades, time=times,
+                       equity=self.bar_equity, balance=self.bar_balance)
+        print("✓ Binary results saved: backtest_results_enhanced.npz")
     
     def plot_results(self):
         """Plot equity curve, balance, and drawdown"""
         fig, axes = plt.subplots(3, 1, figsize=(14, 10))
         
-        equity_array = np.array(self.equity_curve)
+        equity_array = np.asarray(self.bar_equity)
         bars = range(len(equity_array))
         
         # Plot 1: Equity Curve
@@ -701,6 +725,11 @@ def main():
     start_date = '2025-07-01'  # Start from January 1, 2025
     end_date = '2025-08-01'  # Use last date in dataset
     
+    # Walk-forward validation over the full history instead of one window
+    walk_forward = False
+    train_days = 90
+    test_days = 30
+    
     risk_params = {
         'stop_loss_pips': 100,           # Wider stops for day trading (was 100)
         'take_profit_pips': 300,         # Wider targets for day trading (was 300)
@@ -709,10 +738,19 @@ def main():
         'account_balance': 10000,
         'risk_percent': 2.0,
         'min_holding_bars': 10,          # Minimum bars to hold (16 bars ≈ 4 hours on M15)
-        'max_daily_trades': 6            # Maximum trades per calendar day
+        'max_daily_trades': 6,           # Maximum trades per calendar day
+        'exit_mode': 'close',            # 'close' or 'intrabar' (first touch of High/Low)
+        'both_touch': 'sl'               # Intrabar bar touching SL and TP: 'sl', 'tp' or 'open'
     }
     
     try:
+        if walk_forward:
+            backtest = EnhancedBacktestEngine(ha_data_file, ensemble_file, risk_params)
+            backtest.walk_forward(train_days=train_days, test_days=test_days)
+            backtest.save_walk_forward()
+            print("\n✅ Walk-forward validation completed!")
+            return
+        
         backtest = EnhancedBacktestEngine(ha_data_file, ensemble_file, risk_params,
                                          start_date=start_date, end_date=end_date)
         trades = backtest.run_backtest()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Backtest Performance Benchmark
+Stage timings and peak memory of EnhancedBacktestEngine on synthetic data
+
+Deterministic synthetic HA bars (random-walk OHLC turned into Heiken Ashi
+with ha_features.heiken_ashi) and a matching event-driven ensemble file
+(XGB triggers, RF confirmations, confidence) are written as CSVs for each
+size, so the benchmark runs offline and goes through the same load path as
+the real BTCUSD files. Bars are 1 minute apart by default so 10M rows stay
+inside the datetime64[ns] range.
+
+Each engine stage is wrapped with a timer; tracemalloc records the peak
+memory allocated on top of what was live when the stage started. Stages
+nest (prepare_data contains the feature / signal stages, run_backtest
+contains prepare_data and calculate_metrics), and times are inclusive.
+tracemalloc slows pure-Python loops down, so compare runs made with the
+same --no-memory setting.
+
+The default run covers 10k and 100k rows. The exact rolling K-means
+(apply_kmeans_clustering) costs about 0.2 ms per row on one core and
+dominates every size, so 1M rows take a few minutes and 10M about 35 minutes
+(longer with tracemalloc); --large adds those two sizes.
+
+Results go to JSON together with the machine and library versions;
+--compare prints the per-stage time ratio against an earlier results file.
+
+Usage:
+    python benchmark_backtest.py                                  # 10k, 100k rows
+    python benchmark_backtest.py --large --no-memory              # + 1M, 10M rows (about 40 minutes)
+    python benchmark_backtest.py --sizes 10k,100k --output before.json
+    python benchmark_backtest.py --sizes 10k,100k --compare before.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ha_features import heiken_ashi
+
+DEFAULT_SIZES = (10_000, 100_000)
+LARGE_SIZES = (1_000_000, 10_000_000)   # Opt-in (--large): the exact K-means is ~0.2 ms per row
+RESULT_FILE = 'benchmark_results.json'
+REGRESSION_RATIO = 1.2
+MIN_COMPARE_SECONDS = 0.01   # Faster stages are timer noise, never flagged
+
+# Engine methods timed as stages, in pipeline order
+STAGES = ('prepare_data', 'calculate_heiken_ashi_metrics', 'apply_kmeans_clustering', 'detect_patterns',
+          'check_volume_confirmation', 'generate_signals', 'run_backtest', 'calculate_metrics',
+          'run_monte_carlo')
+
+RISK_PARAMS = {
+    'stop_loss_pips': 100,
+    'take_profit_pips': 300,
+    'min_lot_size': 0.5,
+    'max_lot_size': 1.2,
+    'account_balance': 10000,
+    'risk_percent': 2.0,
+    'min_holding_bars': 10,
+    'max_daily_trades': 6
+}
+
+
+def parse_size(text):
+    """'10k' / '1M' / '2500' -> number of rows"""
+    text = text.strip().lower()
+    scale = {'k': 10**3, 'm': 10**6}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def synthetic_bars(n_rows, seed=42, start='2000-01-01', freq='1min', price=30000.0, volatility=0.001):
+    """
+    Deterministic HA bar frame (Time, HA_Open, HA_High, HA_Low, HA_Close, Volume)
+
+    Raw OHLC follows a log-normal random walk; Heiken Ashi is computed with
+    the same recursion as the data pipeline.
+    """
+    rng = np.random.default_rng(seed)
+    close = price * np.exp(np.cumsum(rng.normal(0, volatility, n_rows)))
+    open_ = np.empty(n_rows)
+    open_[0] = price
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.normal(0, volatility / 2, (2, n_rows))) * close
+    high = np.maximum(open_, close) + wick[0]
+    low = np.minimum(open_, close) - wick[1]
+
+    ha_open, ha_high, ha_low, ha_close = heiken_ashi(open_, high, low, close)
+    return pd.DataFrame({
+        'Time': pd.date_range(start, periods=n_rows, freq=freq),
+        'HA_Open': ha_open,
+        'HA_High': ha_high,
+        'HA_Low': ha_low,
+        'HA_Close': ha_close,
+        'Volume': rng.integers(100, 5000, n_rows),
+    })
+
+
+def synthetic_ensemble(times, seed=42, trigger_rate=0.75, confirm_rate=0.67):
+    """
+    Deterministic ensemble forecast rows for a random subset of bar times
+    (Time, XGB_Trigger, RF_Confirm, Signal, Confirmed, Confidence), in the
+    layout of ensemble_ha15m_forecast.csv
+    """
+    rng = np.random.default_rng(seed + 1)
+    rows = np.flatnonzero(rng.random(len(times)) < trigger_rate)
+    trigger = rng.choice(np.array([-1, 1]), len(rows))
+    confirmed = (rng.random(len(rows)) < confirm_rate).astype(np.int64)
+    rf_confirm = np.where(confirmed == 1, trigger, -trigger)
+    return pd.DataFrame({
+        'Time': np.asarray(times)[rows],
+        'XGB_Trigger': trigger,
+        'RF_Confirm': rf_confirm,
+        'Signal': trigger * confirmed,
+        'Confirmed': confirmed,
+        'Confidence': confirmed * 100.0,
+    })
+
+
+def write_dataset(n_rows, workdir, seed=42, freq='1min'):
+    """Write (or reuse) the synthetic HA and ensemble CSVs of one size; returns their paths"""
+    ha_file = os.path.join(workdir, f'synthetic_{n_rows}_s{seed}_{freq}_HA_data.csv')
+    ensemble_file = os.path.join(workdir, f'synthetic_{n_rows}_s{seed}_{freq}_forecast.csv')
+    if not (os.path.exists(ha_file) and os.path.exists(ensemble_file)):
+        bars = synthetic_bars(n_rows, seed=seed, freq=freq)
+        bars.to_csv(ha_file, index=False)
+        synthetic_ensemble(bars['Time'].values, seed=seed).to_csv(ensemble_file, index=False)
+    return ha_file, ensemble_file
+
+
+class StageTimer:
+    """Inclusive wall time and peak traced memory per named stage"""
+
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._stack = []
+
+    def _traced(self):
+        return tracemalloc.get_traced_memory() if self.trace_memory else (0, 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        # A nested stage resets the tracemalloc peak, so fold the peak seen
+        # so far into the enclosing stage first
+        if self._stack:
+            self._stack[-1]['peak'] = max(self._stack[-1]['peak'], self._traced()[1])
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        frame = {'base': self._traced()[0], 'peak': 0}
+        self._stack.append(frame)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            peak = max(frame['peak'], self._traced()[1])
+            if self._stack:
+                self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+            record = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_mb': 0.0})
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['peak_mb'] = max(record['peak_mb'], (peak - frame['base']) / 1e6)
+
+    def wrap(self, name, func):
+        """func timed as stage name on every call"""
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+
+def benchmark_size(n_rows, workdir, seed=42, freq='1min', trace_memory=True, use_feature_store=False,
+                   monte_carlo_sims=0):
+    """
+    Run the engine once over n_rows synthetic bars
+
+    Returns dict with rows, trades, data generation time and per-stage
+    {'calls', 'seconds', 'peak_mb'}
+    """
+    from backtest_ensemble_enhanced import EnhancedBacktestEngine
+
+    start = time.perf_counter()
+    ha_file, ensemble_file = write_dataset(n_rows, workdir, seed=seed, freq=freq)
+    generate_seconds = time.perf_counter() - start
+
+    timer = StageTimer(trace_memory=trace_memory)
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            with timer.stage('load'):
+                engine = EnhancedBacktestEngine(ha_file, ensemble_file, dict(RISK_PARAMS),
+                                                use_feature_store=use_feature_store,
+                                                monte_carlo_sims=monte_carlo_sims)
+            for name in STAGES:
+                setattr(engine, name, timer.wrap(name, getattr(engine, name)))
+            engine.run_backtest()
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    return {
+        'rows': n_rows,
+        'trades': int(len(engine.trades)),
+        'signals': int(np.count_nonzero(engine.df['Signal'].to_numpy())),
+        'generate_seconds': generate_seconds,
+        'stages': timer.stages,
+    }
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, seed=42, freq='1min', workdir=None, trace_memory=True,
+                  use_feature_store=False, monte_carlo_sims=0):
+    """
+    Benchmark every size; synthetic files go to workdir (a temporary
+    directory, removed afterwards, if not given)
+
+    Returns the results document (machine info + one entry per size)
+    """
+    owned = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix='ha_benchmark_')
+    os.makedirs(workdir, exist_ok=True)
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'freq': freq,
+        'trace_memory': trace_memory,
+        'feature_store': use_feature_store,
+        'results': [],
+    }
+    try:
+        for n_rows in sizes:
+            print(f"  {n_rows:>12,} rows ...", end=' ', flush=True)
+            result = benchmark_size(n_rows, workdir, seed=seed, freq=freq, trace_memory=trace_memory,
+                                    use_feature_store=use_feature_store, monte_carlo_sims=monte_carlo_sims)
+            report['results'].append(result)
+            total = result['stages']['load']['seconds'] + result['stages']['run_backtest']['seconds']
+            print(f"{total:.2f}s ({result['trades']:,} trades)")
+    finally:
+        if owned:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def print_report(report):
+    """Stage table: seconds and peak MB per size"""
+    results = report['results']
+    print("\n" + "=" * 70)
+    print("BACKTEST BENCHMARK")
+    print("=" * 70)
+    print(f"  Python {report['python']} | NumPy {report['numpy']} | pandas {report['pandas']} | "
+          f"{report['cpu_count']} CPUs")
+
+    header = "".join(f"{result['rows']:>16,}" for result in results)
+    print(f"\n  {'Stage (s / peak MB)':<30}{header}")
+    for name in ('load',) + STAGES:
+        if not any(name in result['stages'] for result in results):
+            continue
+        cells = ""
+        for result in results:
+            stage = result['stages'].get(name)
+            cells += f"{stage['seconds']:>9.3f} /{stage['peak_mb']:>5.0f}" if stage else f"{'-':>16}"
+        print(f"  {name:<30}{cells}")
+    print(f"  {'trades':<30}" + "".join(f"{result['trades']:>16,}" for result in results))
+
+
+def compare_reports(report, baseline, threshold=REGRESSION_RATIO):
+    """
+    Print current / baseline time per stage for sizes present in both
+
+    Returns list of (rows, stage, ratio) above threshold
+    """
+    previous = {result['rows']: result for result in baseline['results']}
+    regressions = []
+
+    print("\n" + "=" * 70)
+    print(f"COMPARISON WITH BASELINE ({baseline.get('created', '?')})")
+    print("=" * 70)
+    if baseline.get('trace_memory') != report['trace_memory']:
+        print("  ⚠ Baseline was run with a different memory tracing setting; times are not comparable")
+    for result in report['results']:
+        old = previous.get(result['rows'])
+        if old is None:
+            continue
+        print(f"\n  {result['rows']:,} rows")
+        for name in ('load',) + STAGES:
+            stage = result['stages'].get(name)
+            old_stage = old['stages'].get(name)
+            if not stage or not old_stage or old_stage['seconds'] <= 0:
+                continue
+            ratio = stage['seconds'] / old_stage['seconds']
+            significant = max(stage['seconds'], old_stage['seconds']) >= MIN_COMPARE_SECONDS
+            slower = significant and ratio > threshold
+            flag = "  ⚠ slower" if slower else ("  ✓ faster" if significant and ratio < 1 / threshold else "")
+            print(f"    {name:<30}{old_stage['seconds']:>10.3f}s -> {stage['seconds']:>10.3f}s  x{ratio:.2f}{flag}")
+            if slower:
+                regressions.append((result['rows'], name, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Stage timings / peak memory of the backtest on synthetic data")
+    parser.add_argument('--sizes', default='10k,100k', help="Comma-separated row counts (k / M suffixes)")
+    parser.add_argument('--large', action='store_true', help="Also run 1M and 10M rows (about 40 minutes)")
+    parser.add_argument('--seed', type=int, default=42, help="Synthetic data seed")
+    parser.add_argument('--freq', default='1min', help="Bar spacing of the synthetic data")
+    parser.add_argument('--workdir', default=None, help="Keep / reuse synthetic CSVs here (default: temp dir)")
+    parser.add_argument('--output', default=RESULT_FILE, help="Results JSON")
+    parser.add_argument('--compare', default=None, help="Earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_RATIO, help="Slowdown ratio flagged as regression")
+    parser.add_argument('--no-memory', action='store_true', help="Skip tracemalloc (timing only)")
+    parser.add_argument('--feature-store', action='store_true', help="Use (and build) the feature store")
+    parser.add_argument('--mc-sims', type=int, default=0, help="Monte Carlo paths after the backtest")
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("BACKTEST BENCHMARK")
+    print("=" * 70)
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    if args.large:
+        sizes += [size for size in LARGE_SIZES if size not in sizes]
+    report = run_benchmark(sizes, seed=args.seed, freq=args.freq, workdir=args.workdir,
+                           trace_memory=not args.no_memory, use_feature_store=args.feature_store,
+                           monte_carlo_sims=args.mc_sims)
+    print_report(report)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results saved: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_reports(report, json.load(f), threshold=args.threshold)
+        if regressions:
+            print(f"\n⚠ {len(regressions)} stage(s) slower than x{args.threshold:.2f}")
+            sys.exit(1)
+        print("\n✓ No regressions")
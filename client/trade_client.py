@@ -7,17 +7,25 @@ import websockets
 import json
 import time
 from datetime import datetime
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+import os
 import sys
 import logging
 
+# Shared feature pipeline and live stats live in the project root (ha_features.py, rolling_kmeans.py, online_metrics.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from ha_features import StreamingFeatures, KMEANS_WINDOW
+from online_metrics import OnlineMetrics
+
 # === Configuration ===
 WS_URL = "wss://ai-main-ai-92945097390.europe-west2.run.app/ws" # Production
 #WS_URL = "ws://localhost:8080/ws" # Local Testing
 SYMBOL = "BTCUSDm"
 TIMEFRAME = mt5.TIMEFRAME_M15
-LOOKBACK_BARS = 1000  # Increased to 1000 for better stability of MA/Volatility calculations
+LOOKBACK_BARS = 1000  # Warm-up history for the streaming feature state (HA recursion, K-Means window)
+NEW_BARS_FETCH = 10   # Bars requested per cycle once warmed up; only unseen closed bars are ingested
+
+# Per-symbol streaming feature state: {symbol: {'features': StreamingFeatures, 'last_time': epoch}}
+feature_states = {}
 
 # === Logging Setup ===
 logging.basicConfig(
@@ -75,127 +83,56 @@ def initialize_mt5():
 
 
 
-def get_data():
-    rates = mt5.copy_rates_from_pos(SYMBOL, TIMEFRAME, 0, LOOKBACK_BARS)
-    if rates is None:
+def get_rates(symbol, count):
+    # Closed bars only (position 0 is the bar still forming)
+    rates = mt5.copy_rates_from_pos(symbol, TIMEFRAME, 1, count)
+    if rates is None or len(rates) == 0:
         logger.error(f"Failed to get rates. Error: {mt5.last_error()}")
         return None
-    
-    df = pd.DataFrame(rates)
-    logger.info(f"Retrieved {len(df)} bars for {SYMBOL}")
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    
-    # Rename for consistency
-    df.rename(columns={'tick_volume': 'Volume', 'open': 'Open', 'high': 'High', 'low': 'Low', 'close': 'Close'}, inplace=True)
-    return df
-
-def calculate_heiken_ashi_and_features(df):
-    logger.debug("Calculating Heiken Ashi candles...")
-    # 1. Heiken Ashi Calculation
-    ha_open = np.zeros(len(df))
-    ha_close = np.zeros(len(df))
-    ha_high = np.zeros(len(df))
-    ha_low = np.zeros(len(df))
-    
-    # First bar
-    ha_open[0] = (df['Open'].iloc[0] + df['Close'].iloc[0]) / 2
-    ha_close[0] = (df['Open'].iloc[0] + df['High'].iloc[0] + df['Low'].iloc[0] + df['Close'].iloc[0]) / 4
-    ha_high[0] = max(df['High'].iloc[0], ha_open[0], ha_close[0])
-    ha_low[0] = min(df['Low'].iloc[0], ha_open[0], ha_close[0])
-    
-    # Subsequent
-    for i in range(1, len(df)):
-        ha_close[i] = (df['Open'].iloc[i] + df['High'].iloc[i] + df['Low'].iloc[i] + df['Close'].iloc[i]) / 4
-        ha_open[i] = (ha_open[i-1] + ha_close[i-1]) / 2
-        ha_high[i] = max(df['High'].iloc[i], ha_open[i], ha_close[i])
-        ha_low[i] = min(df['Low'].iloc[i], ha_open[i], ha_close[i])
-        
-    df['HA_Open'] = ha_open
-    df['HA_High'] = ha_high
-    df['HA_Low'] = ha_low
-    df['HA_Close'] = ha_close
-    logger.debug("Heiken Ashi calculations complete.")
-    
-    # 2. HA Metrics
-    df['HA_Body'] = abs(df['HA_Close'] - df['HA_Open'])
-    df['HA_Range'] = df['HA_High'] - df['HA_Low']
-    df['HA_Close_Change'] = df['HA_Close'].pct_change()
-    df['HA_Momentum'] = df['HA_Close'] - df['HA_Close'].shift(5) # 5-bar momentum
-    df['HA_Volatility'] = df['HA_Range'].rolling(5).std()
-    
-    # 3. K-Means Cluster Density (Last Bar Only needed, but requires window)
-    logger.debug("Calculating Rolling K-Means...")
-    window = 252
-    if len(df) < window + 1:
+    return rates
+
+def update_features(symbol):
+    """
+    Feed new closed bars into the symbol's streaming feature state and return
+    the feature row for the latest bar (None if there is no new bar yet)
+    """
+    state = feature_states.get(symbol)
+
+    if state is None:
+        # Warm up once from history, afterwards only new bars are ingested
+        rates = get_rates(symbol, LOOKBACK_BARS)
+        if rates is None:
+            return None
+        logger.info(f"Retrieved {len(rates)} bars for {symbol} (warm-up)")
+        state = {'features': StreamingFeatures(), 'last_time': 0}
+        new_bars = rates
+    else:
+        rates = get_rates(symbol, NEW_BARS_FETCH)
+        if rates is None:
+            return None
+        new_bars = rates[rates['time'] > state['last_time']]
+        if len(new_bars) == len(rates):
+            # Missed more bars than we fetch (disconnect, weekend gap): rebuild
+            logger.warning(f"Bar gap on {symbol}, rebuilding feature state")
+            del feature_states[symbol]
+            return update_features(symbol)
+
+    if len(new_bars) == 0:
+        return None
+
+    features = state['features']
+    features.warm_up(new_bars['open'], new_bars['high'], new_bars['low'],
+                     new_bars['close'], new_bars['tick_volume'])
+    state['last_time'] = int(new_bars['time'][-1])
+    feature_states[symbol] = state
+
+    if features.n_bars <= KMEANS_WINDOW:
         logger.warning("Not enough data for K-Means")
         return None
-        
-    # We only need the feature for the LAST closed bar (row -1)
-    # Features used for clustering: HA_Open, HA_High, HA_Low, HA_Close
-    cluster_features = ['HA_Open', 'HA_High', 'HA_Low', 'HA_Close']
-    
-    # Get window for the last point
-    X = df[cluster_features].iloc[-window:].values
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
-    
-    kmeans = KMeans(n_clusters=3, random_state=42, n_init=3)
-    clusters = kmeans.fit_predict(X_scaled)
-    
-    current_cluster = clusters[-1]
-    cluster_count = np.sum(clusters == current_cluster)
-    density = (cluster_count / window) * 100
-    
-    df['Cluster_Density'] = 0.5 # Default
-    df.iloc[-1, df.columns.get_loc('Cluster_Density')] = density
-    logger.info(f"K-Means: Cluster {current_cluster}, Density {density:.2f}%")
-    
-    # 4. Patterns
-    df['Consecutive_Up'] = 0
-    df['Consecutive_Down'] = 0
-    up_count = 0
-    down_count = 0
-    
-    for i in range(1, len(df)):
-        if df['HA_Close'].iloc[i] > df['HA_Close'].iloc[i-1]:
-            up_count += 1
-            down_count = 0
-        elif df['HA_Close'].iloc[i] < df['HA_Close'].iloc[i-1]:
-            down_count += 1
-            up_count = 0
-        else:
-            up_count = 0
-            down_count = 0
-        
-        df.iloc[i, df.columns.get_loc('Consecutive_Up')] = up_count
-        df.iloc[i, df.columns.get_loc('Consecutive_Down')] = down_count
 
-    # 5. Volume
-    df['Volume_Change'] = df['Volume'].pct_change()
-    df['Volume_MA_5'] = df['Volume'].rolling(5).mean()
-    df['Volume_Ratio'] = df['Volume'] / df['Volume_MA_5']
-    
-    # Replace NaNs
-    df.fillna(0, inplace=True)
-    
-    # Extract feature vector for the last bar
-    # Use -1 (live bar) or -2 (last closed bar)? 
-    # Usually models trained on closed bars -> use -2? 
-    # Or if fetching current incomplete bar -> -1. 
-    # Let's assume prediction is for NEXT movement based on logic.
-    # We will use the last available row.
-    last_row = df.iloc[-1]
-    
-    feature_columns = [
-        'HA_Open', 'HA_High', 'HA_Low', 'HA_Close',
-        'HA_Body', 'HA_Range', 'HA_Close_Change',
-        'HA_Momentum', 'HA_Volatility',
-        'Cluster_Density',
-        'Consecutive_Up', 'Consecutive_Down',
-        'Volume', 'Volume_Change', 'Volume_Ratio'
-    ]
-    
-    return [float(last_row[col]) for col in feature_columns]
+    cluster, density = features.cluster
+    logger.info(f"{symbol} bar {pd.to_datetime(state['last_time'], unit='s')}: K-Means Cluster {cluster}, Density {density:.2f}%")
+    return features.row()
 
 def get_prediction(features):
     try:
@@ -223,6 +160,42 @@ def check_daily_limit_reset():
         daily_trade_state["date"] = today
         logger.info("New day: Reset daily trade count.")
 
+# Live performance of the bot's closed deals (same accumulator as the backtester)
+live_metrics_state = {
+    "metrics": None,
+    "last_ticket": 0
+}
+
+STATS_HISTORY_DAYS = 7  # Deal history window scanned each cycle for newly closed trades
+
+def update_live_metrics():
+    """Add newly closed deals (this bot's magic number) to the live stats and mark account equity"""
+    account_info = mt5.account_info()
+    if account_info is None:
+        return
+
+    now = datetime.now()
+    deals = mt5.history_deals_get(now - pd.Timedelta(days=STATS_HISTORY_DAYS), now + pd.Timedelta(days=1))
+    closed = sorted(
+        (d for d in deals or () if d.magic == RISK_PARAMS["MAGIC_NUMBER"] and d.entry == mt5.DEAL_ENTRY_OUT),
+        key=lambda d: d.ticket
+    )
+
+    metrics = live_metrics_state["metrics"]
+    if metrics is None:
+        # Start from the current balance; deals closed before start-up are not counted
+        metrics = live_metrics_state["metrics"] = OnlineMetrics(account_info.balance)
+        live_metrics_state["last_ticket"] = closed[-1].ticket if closed else 0
+        closed = []
+
+    for deal in closed:
+        if deal.ticket > live_metrics_state["last_ticket"]:
+            metrics.update(deal.profit + deal.swap + deal.commission)
+            live_metrics_state["last_ticket"] = deal.ticket
+
+    metrics.mark(account_info.equity)
+    logger.info(f"Stats: {metrics}")
+
 def calculate_lot_size(sl_pips):
     account_info = mt5.account_info()
     if account_info is None:
@@ -373,21 +346,21 @@ async def main_loop():
                     # High Frequency Loop? Or Candle Close?
                     # For now, stick to 1-minute loop or wait for next candle
                     
-                    df = get_data()
-                    if df is not None:
-                        features = calculate_heiken_ashi_and_features(df)
-                        if features:
-                            logger.debug(f"Features: {features[:3]}...")
-                            
-                            # Async Prediction
-                            result = await get_prediction(websocket, features)
-                            
-                            if result:
-                                if "error" in result:
-                                    logger.error(f"Server Error: {result['error']}")
-                                else:
-                                    logger.info(f"Signal: {result['signal']} ({result['confidence']:.2f})")
-                                    execute_trade(result['signal'], result['confidence']) # Keep synchronous for now as MT5 is sync
+                    # Only new closed bars are processed; no new bar -> nothing to predict
+                    features = update_features(SYMBOL)
+                    if features:
+                        logger.debug(f"Features: {features[:3]}...")
+                        update_live_metrics()
+                        
+                        # Async Prediction
+                        result = await get_prediction(websocket, features)
+                        
+                        if result:
+                            if "error" in result:
+                                logger.error(f"Server Error: {result['error']}")
+                            else:
+                                logger.info(f"Signal: {result['signal']} ({result['confidence']:.2f})")
+                                execute_trade(result['signal'], result['confidence']) # Keep synchronous for now as MT5 is sync
                     
                     await asyncio.sleep(60)
                     
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Columnar Binary Cache for CSV Datasets
+Transparent replacement for pd.read_csv on the HA / forecast CSV files
+
+On first use each column of the CSV is written to a typed .npy file
+(timestamps as int64 epoch nanoseconds, numbers in their parsed dtype,
+strings as fixed-width unicode plus a null mask when values are missing)
+under a .ha_cache/ directory next to the source file. Later runs load the .npy
+files (optionally memory-mapped) instead of parsing text and timestamps.
+
+The cache is keyed by the source's content hash. The file size and mtime
+are only a fast path: if they change, the content is re-hashed, and the
+cache is rebuilt only if the bytes actually differ.
+
+compact=True (or compact_frame) gives the compact data path: float columns as
+float32 and signal / vote columns as int8, timestamps unchanged (int64).
+
+Usage:
+    from data_cache import load_csv, load_columns
+    df = load_csv('BTCUSD_15m_HA_data.csv')            # Time already datetime64
+    df = load_csv('ensemble_ha15m_forecast.csv', compact=True)
+    cols = load_columns('BTCUSD_15m_HA_data.csv')      # dict of (memmap) arrays
+
+    python data_cache.py [csv_file ...]                # build / refresh caches
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+CACHE_DIR_NAME = '.ha_cache'
+CACHE_VERSION = 2
+TIME_COLUMNS = ('Time', 'time')
+HASH_BLOCK = 1 << 20
+
+# Model signal / vote columns (values -1, 0, 1) stored as int8 in compact mode
+SIGNAL_COLUMNS = ('Signal', 'XGB_Trigger', 'RF_Confirm', 'Confirmed', 'XGB_Prediction',
+                  'RF_Prediction', 'LSTM_Prediction', 'Trend', 'trend')
+
+
+def file_hash(path):
+    """BLAKE2b content hash of a file (read in 1 MB blocks)"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path, cache_dir=None):
+    """Directory holding the cached columns of one CSV file"""
+    path = os.path.abspath(path)
+    root = cache_dir or os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+    return os.path.join(root, os.path.basename(path))
+
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(entry, meta):
+    tmp = os.path.join(entry, 'meta.json.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, os.path.join(entry, 'meta.json'))
+
+
+def _options_key(time_columns, read_csv_kwargs):
+    """Parse options the cached columns depend on"""
+    return repr((list(time_columns), sorted(read_csv_kwargs.items())))
+
+
+def _is_fresh(path, entry, meta, options):
+    """Compare the cache against the source (stat fast path, then content hash)"""
+    if meta is None or meta['options'] != options:
+        return False
+
+    st = os.stat(path)
+    if meta['size'] == st.st_size and meta['mtime_ns'] == st.st_mtime_ns:
+        return True
+
+    if meta['size'] != st.st_size or meta['hash'] != file_hash(path):
+        return False
+
+    # Touched but unchanged: remember the new stat so the next check is free
+    meta['mtime_ns'] = st.st_mtime_ns
+    _write_meta(entry, meta)
+    return True
+
+
+def build_cache(path, time_columns=TIME_COLUMNS, cache_dir=None, **read_csv_kwargs):
+    """
+    Parse a CSV once and store every column as .npy
+
+    Returns the cache metadata dict
+    """
+    entry = cache_path(path, cache_dir)
+    st = os.stat(path)
+    source_hash = file_hash(path)
+
+    df = pd.read_csv(path, **read_csv_kwargs)
+
+    # Columns are written first and meta.json last, so an interrupted build
+    # never looks valid
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    os.makedirs(entry)
+
+    columns = []
+    for k, col in enumerate(df.columns):
+        values = df[col]
+        if col in time_columns:
+            kind = 'time'
+            array = pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            kind = 'str'
+            missing = values.isna().to_numpy()
+            array = values.where(~missing, '').astype(str).to_numpy(dtype=str)
+        else:
+            kind = 'num'
+            array = values.to_numpy()
+
+        filename = f'col_{k:03d}.npy'
+        np.save(os.path.join(entry, filename), np.ascontiguousarray(array), allow_pickle=False)
+        column = {'name': str(col), 'kind': kind, 'dtype': array.dtype.str, 'file': filename}
+        if kind == 'str' and missing.any():
+            # Missing strings are stored as '' and restored from this mask
+            column['null'] = f'col_{k:03d}_null.npy'
+            np.save(os.path.join(entry, column['null']), missing, allow_pickle=False)
+        columns.append(column)
+
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'hash': source_hash,
+        'rows': len(df),
+        'options': _options_key(time_columns, read_csv_kwargs),
+        'columns': columns,
+    }
+    _write_meta(entry, meta)
+    return meta
+
+
+def cache_meta(path, time_columns=TIME_COLUMNS, cache_dir=None, **read_csv_kwargs):
+    """Metadata of an up-to-date cache (built if missing or stale), incl. the source hash"""
+    entry = cache_path(path, cache_dir)
+    meta = _read_meta(entry)
+    if not _is_fresh(path, entry, meta, _options_key(time_columns, read_csv_kwargs)):
+        meta = build_cache(path, time_columns=time_columns, cache_dir=cache_dir, **read_csv_kwargs)
+    return meta
+
+
+def load_columns(path, time_columns=TIME_COLUMNS, cache_dir=None, mmap=True, **read_csv_kwargs):
+    """
+    Columns of a CSV as NumPy arrays, building the cache if needed
+
+    Time columns are int64 epoch nanoseconds. With mmap=True numeric arrays
+    are read-only memory maps (only the pages touched are read). Missing
+    values of string columns are '' here (load_csv restores them as NaN).
+
+    Returns dict of column name -> ndarray (in file column order)
+    """
+    entry = cache_path(path, cache_dir)
+    meta = cache_meta(path, time_columns=time_columns, cache_dir=cache_dir, **read_csv_kwargs)
+
+    mode = 'r' if mmap else None
+    return {
+        col['name']: np.load(os.path.join(entry, col['file']), mmap_mode=mode, allow_pickle=False)
+        for col in meta['columns']
+    }
+
+
+def compact_frame(df, keep=(), int8_columns=SIGNAL_COLUMNS):
+    """
+    Downcast a DataFrame in place for the compact data path
+
+    - float64 columns -> float32
+    - int8_columns -> int8 when they hold whole numbers in [-128, 127] and no
+      NaN (otherwise float32)
+    - datetime, bool and columns listed in keep are left as they are
+
+    Returns df
+    """
+    for col in df.columns:
+        if col in keep:
+            continue
+        values = df[col]
+        if col in int8_columns and pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            array = values.to_numpy()
+            if (not np.isnan(array.astype(float)).any()
+                    and (len(array) == 0 or (array.min() >= -128 and array.max() <= 127))
+                    and np.array_equal(array, np.round(array))):
+                df[col] = array.astype(np.int8)
+                continue
+        if values.dtype == np.float64:
+            df[col] = values.astype(np.float32)
+    return df
+
+
+def load_csv(path, time_columns=TIME_COLUMNS, cache_dir=None, use_cache=True, compact=False,
+             **read_csv_kwargs):
+    """
+    Cached drop-in for pd.read_csv(path) with time columns parsed to datetime64
+
+    use_cache=False reads the CSV directly (same result, no cache files).
+    compact=True applies compact_frame (float32 values, int8 signals).
+    """
+    if not use_cache:
+        df = pd.read_csv(path, **read_csv_kwargs)
+        for col in time_columns:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col]).astype('datetime64[ns]')
+        return compact_frame(df) if compact else df
+
+    entry = cache_path(path, cache_dir)
+    columns = load_columns(path, time_columns=time_columns, cache_dir=cache_dir, mmap=False, **read_csv_kwargs)
+    specs = {col['name']: col for col in _read_meta(entry)['columns']}
+
+    data = {}
+    for name, array in columns.items():
+        kind = specs[name]['kind']
+        if kind == 'time':
+            data[name] = array.view('datetime64[ns]')
+        elif kind == 'str':
+            values = array.astype(object)
+            if 'null' in specs[name]:
+                values[np.load(os.path.join(entry, specs[name]['null']), allow_pickle=False)] = np.nan
+            data[name] = values
+        else:
+            data[name] = array
+    df = pd.DataFrame(data)
+    return compact_frame(df) if compact else df
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    files = sys.argv[1:] or ['BTCUSD_15m_HA_data.csv', 'ensemble_ha15m_forecast.csv']
+
+    print("=" * 60)
+    print("COLUMNAR CSV CACHE")
+    print("=" * 60)
+
+    for csv_file in files:
+        if not os.path.exists(csv_file):
+            print(f"✗ Not found: {csv_file}")
+            continue
+
+        start = time.perf_counter()
+        df = pd.read_csv(csv_file)
+        for col in TIME_COLUMNS:
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col])
+        csv_seconds = time.perf_counter() - start
+
+        load_csv(csv_file)
+        start = time.perf_counter()
+        df = load_csv(csv_file)
+        cache_seconds = time.perf_counter() - start
+
+        print(f"✓ {csv_file}: {len(df):,} rows")
+        print(f"  CSV parse:  {csv_seconds * 1000:8.1f} ms")
+        print(f"  Cache load: {cache_seconds * 1000:8.1f} ms  ({cache_path(csv_file)})")
@@ -4,10 +4,12 @@ import numpy as np
 from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from contextlib import asynccontextmanager
 from .schemas import PredictionRequest, PredictionResponse
+from .fused_scaler import FusedScaler
 
 # Global variables for models and scalers
 models = {}
 scalers = {}
+fused_scaler = None  # Both scalers in one broadcast (built at startup)
 
 # Paths to models (relative to /code/app/models inside Docker)
 # When running locally from deployment root: app/models/
@@ -15,6 +17,7 @@ MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global fused_scaler
     # Load models on startup
     print("Loading models...")
     try:
@@ -25,6 +28,9 @@ async def lifespan(app: FastAPI):
         models['xgb'] = joblib.load(os.path.join(MODEL_DIR, "xgboost_ha15m_trend_model.pkl"))
         scalers['xgb'] = joblib.load(os.path.join(MODEL_DIR, "scaler_xgboost_ha15m.save"))
         print("✓ XGBoost loaded")
+        
+        fused_scaler = FusedScaler({'rf': scalers['rf'], 'xgb': scalers['xgb']})
+        print(f"✓ Fused scaler ({fused_scaler.n_unique} distinct)")
     except Exception as e:
         print(f"Error loading models: {e}")
         # In production, you might want to exit if models fail to load
@@ -71,16 +77,15 @@ async def websocket_endpoint(websocket: WebSocket):
                 # Retrieve models
                 rf_model = models.get("rf")
                 xgb_model = models.get("xgb")
-                rf_scaler = scalers.get("rf") # Corrected to use 'scalers' dictionary
-                xgb_scaler = scalers.get("xgb") # Corrected to use 'scalers' dictionary
                 
-                if not all([rf_model, xgb_model, rf_scaler, xgb_scaler]):
+                if not all([rf_model, xgb_model, fused_scaler]):
                     await websocket.send_json({"error": "Models or scalers not loaded"}) # Adjusted error message
                     continue
                     
-                # Scale
-                X_rf = rf_scaler.transform(features_array)
-                X_xgb = xgb_scaler.transform(features_array)
+                # Scale for both models in one pass
+                X_scaled = fused_scaler.transform(features_array)
+                X_rf = X_scaled['rf']
+                X_xgb = X_scaled['xgb']
                 
                 # Predict
                 rf_pred = rf_model.predict(X_rf)[0]
@@ -113,16 +118,18 @@ async def websocket_endpoint(websocket: WebSocket):
 
 @app.post("/predict", response_model=PredictionResponse)
 def predict(request: PredictionRequest):
-    if not models.get('rf') or not models.get('xgb'):
+    if not models.get('rf') or not models.get('xgb') or fused_scaler is None:
         raise HTTPException(status_code=503, detail="Models not loaded")
 
     try:
         # Preprocess input
         features = np.array(request.features).reshape(1, -1)
         
-        # Scale separately for each model (they might have different scalers even if trained on same data)
-        X_rf = scalers['rf'].transform(features)
-        X_xgb = scalers['xgb'].transform(features)
+        # Each model has its own scaler (they might differ even if trained on same data),
+        # applied together by the fused scaler
+        X_scaled = fused_scaler.transform(features)
+        X_rf = X_scaled['rf']
+        X_xgb = X_scaled['xgb']
         
         # Get predictions
         vote_rf = predict_rf(X_rf)
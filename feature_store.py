@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Memory-Mapped Feature Store
+Precomputed model features for an HA data file, indexed by timestamp
+
+The feature matrix of a whole HA file is built once, in parallel over time
+chunks, and saved as a float32 .npy matrix next to a sorted int64 time index
+(epoch ns) in the .ha_cache/ directory. Training notebooks and the
+backtester then open it memory-mapped (zero copy) and slice time ranges
+with a binary search instead of re-running the rolling K-means.
+
+Each chunk is computed with KMEANS_WINDOW bars of warm-up history in front
+of it, which covers every windowed feature (K-means window, rolling 5,
+momentum 3). The consecutive bar counters have unbounded memory, so they
+are recomputed over the full series. With cluster_method='exact' the store
+is identical to a single-pass compute_features() (rounded to float32).
+
+The store is rebuilt when the source file's content hash or the build
+options change. Warm-up rows are stored as NaN; fill them the way each model
+was trained.
+
+Usage:
+    from feature_store import open_feature_store
+    store = open_feature_store('BTCUSD_15m_HA_data.csv')            # builds on first use
+    times, X = store.slice('2025-07-01', '2025-08-01', FEATURE_COLUMNS)
+    df = store.frame()                                            # DataFrame for training
+
+    python feature_store.py [csv_file] [--feature-set ensemble|xgb|all] [--workers N] [--force]
+"""
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from data_cache import cache_meta, cache_path, load_columns
+from ha_features import (compute_features, consecutive_counts, FEATURE_SETS, INPUT_COLUMNS,
+                         KMEANS_WINDOW, PATTERN_BARS)
+
+STORE_VERSION = 1
+CHUNK_BARS = 20000
+
+
+def store_path(csv_file, feature_set='ensemble'):
+    """Directory of the feature store for one HA file and feature set"""
+    return cache_path(csv_file) + f'.{feature_set}.features'
+
+
+def _chunk_features(inputs, feature_set, window, cluster_method, keep_from):
+    """Worker: features for one chunk, dropping its warm-up rows"""
+    features = compute_features(*inputs, feature_set=feature_set, window=window,
+                                cluster_method=cluster_method)
+    return {col: values[keep_from:] for col, values in features.items()}
+
+
+def build_feature_store(csv_file, feature_set='ensemble', window=KMEANS_WINDOW,
+                        cluster_method='exact', workers=None, chunk_bars=CHUNK_BARS):
+    """
+    Compute the feature matrix of an HA file and save it as a feature store
+
+    Parameters:
+    -----------
+    csv_file : str
+        HA data CSV (Time, HA_Open, HA_High, HA_Low, HA_Close, Volume)
+    feature_set : str
+        'ensemble' or 'xgb' (see ha_features.FEATURE_SETS)
+    window : int
+        Rolling K-means window (also the warm-up overlap between chunks)
+    cluster_method : str
+        'exact' or 'lloyd'
+    workers : int (optional)
+        Worker processes (default: one per core)
+    chunk_bars : int
+        Bars per parallel chunk
+
+    Returns the store directory
+    """
+    if feature_set not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set: {feature_set}")
+
+    source = cache_meta(csv_file)
+    columns = load_columns(csv_file, mmap=False)
+    times = columns['Time']
+    inputs = [np.asarray(columns[col], dtype=float) for col in INPUT_COLUMNS]
+    n = len(times)
+
+    if n > 1 and np.any(np.diff(times) < 0):
+        raise ValueError(f"{csv_file}: Time column is not sorted")
+
+    # Chunks [start, end) computed from start - window so every windowed
+    # feature of the first kept row sees a full history
+    bounds = [(start, min(start + chunk_bars, n)) for start in range(0, n, chunk_bars)]
+    jobs = []
+    for start, end in bounds:
+        lo = max(0, start - window)
+        jobs.append(([x[lo:end] for x in inputs], feature_set, window, cluster_method, start - lo))
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) if jobs else 1
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_chunk_features, *zip(*jobs)))
+    else:
+        parts = [_chunk_features(*job) for job in jobs]
+
+    extra = [col for col in parts[0] if col not in FEATURE_SETS[feature_set] and col not in INPUT_COLUMNS] if parts else []
+    names = list(FEATURE_SETS[feature_set]) + extra
+
+    matrix = np.empty((n, len(names)), dtype=np.float32)
+    for j, col in enumerate(names):
+        if parts:
+            matrix[:, j] = np.concatenate([part[col] for part in parts])
+
+    # Run-length counters depend on the whole history: recompute globally
+    up, down = consecutive_counts(inputs[3])
+    recompute = {
+        'Consecutive_Up': up,
+        'Consecutive_Down': down,
+        'HA_Up_Signal': up >= PATTERN_BARS,
+        'HA_Down_Signal': down >= PATTERN_BARS,
+    }
+    for col, values in recompute.items():
+        if col in names:
+            matrix[:, names.index(col)] = values
+
+    path = store_path(csv_file, feature_set)
+    os.makedirs(path, exist_ok=True)
+    meta_file = os.path.join(path, 'meta.json')
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    np.save(os.path.join(path, 'time.npy'), np.ascontiguousarray(times, dtype=np.int64))
+    np.save(os.path.join(path, 'features.npy'), matrix)
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': os.path.abspath(csv_file),
+        'source_hash': source['hash'],
+        'feature_set': feature_set,
+        'window': window,
+        'cluster_method': cluster_method,
+        'rows': n,
+        'columns': names,
+        'dtype': 'float32',
+    }
+    with open(meta_file + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_file + '.tmp', meta_file)
+
+    return path
+
+
+class FeatureStore:
+    """Read-only view of a feature store (memory-mapped)"""
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+
+        self.path = path
+        self.columns = self.meta['columns']
+        self.times = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+        self.values = np.load(os.path.join(path, 'features.npy'), mmap_mode='r')
+        self._index = {col: j for j, col in enumerate(self.columns)}
+
+    def __len__(self):
+        return len(self.times)
+
+    def bounds(self, start=None, end=None):
+        """Row range [lo, hi) with start <= Time <= end (binary search)"""
+        lo = 0 if start is None else int(np.searchsorted(self.times, _to_ns(start), side='left'))
+        hi = len(self.times) if end is None else int(np.searchsorted(self.times, _to_ns(end), side='right'))
+        return lo, max(lo, hi)
+
+    def locate(self, times):
+        """Row numbers of exact timestamps (raises KeyError if any is missing)"""
+        times = _to_ns(times)
+        rows = np.searchsorted(self.times, times)
+        rows_clipped = np.minimum(rows, len(self.times) - 1)
+        missing = (rows >= len(self.times)) | (self.times[rows_clipped] != times)
+        if np.any(missing):
+            raise KeyError(f"{int(missing.sum())} timestamps not in the feature store")
+        return rows
+
+    def column(self, name, rows=None):
+        """One feature column (a strided memmap view when rows is None or a slice)"""
+        values = self.values[:, self._index[name]]
+        return values if rows is None else values[rows]
+
+    def slice(self, start=None, end=None, columns=None):
+        """
+        (times, X) for start <= Time <= end
+
+        Without columns X is a zero-copy view of the full matrix; with a
+        column list it is a (n, len(columns)) float32 array.
+        """
+        lo, hi = self.bounds(start, end)
+        if columns is None:
+            return self.times[lo:hi], self.values[lo:hi]
+        cols = [self._index[col] for col in columns]
+        if cols == list(range(cols[0], cols[0] + len(cols))):
+            return self.times[lo:hi], self.values[lo:hi, cols[0]:cols[0] + len(cols)]
+        return self.times[lo:hi], self.values[lo:hi][:, cols]
+
+    def frame(self, start=None, end=None):
+        """
+        DataFrame with Time, the source HA/Volume columns (full precision)
+        and every stored feature (float64) for start <= Time <= end
+        """
+        lo, hi = self.bounds(start, end)
+        source = load_columns(self.meta['source'])
+
+        data = {'Time': np.asarray(self.times[lo:hi]).view('datetime64[ns]')}
+        for col in INPUT_COLUMNS:
+            data[col] = np.asarray(source[col][lo:hi])
+        block = np.asarray(self.values[lo:hi], dtype=np.float64)
+        for j, col in enumerate(self.columns):
+            if col not in INPUT_COLUMNS:
+                data[col] = block[:, j]
+        return pd.DataFrame(data)
+
+
+def _to_ns(value):
+    """Timestamp(s) -> int64 epoch ns"""
+    if isinstance(value, np.ndarray) and value.dtype == np.int64:
+        return value
+    if isinstance(value, (np.ndarray, pd.Series, pd.Index, list)):
+        return pd.to_datetime(value).to_numpy(dtype='datetime64[ns]').view(np.int64)
+    return pd.Timestamp(value).as_unit('ns').value
+
+
+def is_store_fresh(csv_file, feature_set='ensemble', window=KMEANS_WINDOW, cluster_method='exact'):
+    """Store exists and matches the current source content and build options"""
+    try:
+        with open(os.path.join(store_path(csv_file, feature_set), 'meta.json'), 'r') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (meta.get('version') == STORE_VERSION
+            and meta.get('source_hash') == cache_meta(csv_file)['hash']
+            and meta.get('window') == window
+            and meta.get('cluster_method') == cluster_method)
+
+
+def open_feature_store(csv_file, feature_set='ensemble', window=KMEANS_WINDOW,
+                       cluster_method='exact', workers=None, rebuild=False):
+    """Open the feature store of an HA file, building it first if missing or stale"""
+    if rebuild or not is_store_fresh(csv_file, feature_set, window, cluster_method):
+        start = time.perf_counter()
+        print(f"  Building {feature_set} feature store for {csv_file}...")
+        build_feature_store(csv_file, feature_set=feature_set, window=window,
+                            cluster_method=cluster_method, workers=workers)
+        print(f"  ✓ Feature store built in {time.perf_counter() - start:.1f}s")
+    return FeatureStore(store_path(csv_file, feature_set))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the memory-mapped feature store of an HA data file")
+    parser.add_argument('csv_file', nargs='?', default='BTCUSD_15m_HA_data.csv')
+    parser.add_argument('--feature-set', default='all', choices=list(FEATURE_SETS) + ['all'])
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--method', default='exact', choices=['exact', 'lloyd'], help="K-means solver")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the store is up to date")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("FEATURE STORE")
+    print("=" * 60)
+
+    feature_sets = list(FEATURE_SETS) if args.feature_set == 'all' else [args.feature_set]
+    for feature_set in feature_sets:
+        store = open_feature_store(args.csv_file, feature_set=feature_set, cluster_method=args.method,
+                                   workers=args.workers, rebuild=args.force)
+        start = time.perf_counter()
+        times, X = store.slice(store.times[-1] - 86400 * 10**9 * 30, None)
+        elapsed = time.perf_counter() - start
+        print(f"✓ {feature_set}: {len(store):,} rows x {len(store.columns)} columns ({store.path})")
+        print(f"  Last 30 days slice: {len(times):,} rows in {elapsed * 1e6:.0f} µs")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Fused Feature Scaling
+All models' StandardScalers applied with one broadcast operation
+
+The prediction servers scale each request once per model, and every
+sklearn transform call pays input validation and feature-name checks that
+cost far more than the arithmetic on a (1, 15) row. FusedScaler reads
+mean_ / scale_ from the fitted scalers once, stacks the distinct ones into
+(k, n_features) arrays (scalers with identical parameters share a row) and
+scales a batch for all models in a single subtract / divide. The results
+equal StandardScaler.transform bit for bit (float32 inputs are scaled with
+float32 parameters, as sklearn does).
+
+Scalers that are not StandardScalers keep their own transform.
+
+Usage:
+    from fused_scaler import FusedScaler
+    fused = FusedScaler({'lstm': scaler_lstm, 'rf': scaler_rf, 'xgb': scaler_xgb})
+    X_scaled = fused.transform(X)          # {'lstm': ..., 'rf': ..., 'xgb': ...}
+
+    python fused_scaler.py [scaler files ...]   # check against sklearn and time both
+"""
+
+import numpy as np
+
+
+def _affine(scaler):
+    """(mean, scale) arrays of a StandardScaler, None for any other scaler"""
+    if not all(hasattr(scaler, attr) for attr in ('with_mean', 'with_std', 'mean_', 'scale_')):
+        return None
+    n_features = scaler.n_features_in_
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(n_features)
+    scale = scaler.scale_ if scaler.with_std and scaler.scale_ is not None else np.ones(n_features)
+    return np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+
+
+class FusedScaler:
+    """Fitted scalers of several models as one stacked mean / scale pair"""
+
+    def __init__(self, scalers):
+        """
+        Parameters:
+        -----------
+        scalers : dict
+            Model name -> fitted scaler (same number of features)
+        """
+        self.names = list(scalers)
+        self.rows = {}       # model name -> row of mean / scale
+        self.fallback = {}   # model name -> scaler used through its own transform
+        means, scales = [], []
+
+        for name, scaler in scalers.items():
+            params = _affine(scaler)
+            if params is None:
+                self.fallback[name] = scaler
+                continue
+            mean, scale = params
+            for row, (other_mean, other_scale) in enumerate(zip(means, scales)):
+                if np.array_equal(mean, other_mean) and np.array_equal(scale, other_scale):
+                    self.rows[name] = row
+                    break
+            else:
+                self.rows[name] = len(means)
+                means.append(mean)
+                scales.append(scale)
+
+        n_features = {len(mean) for mean in means}
+        if len(n_features) > 1:
+            raise ValueError(f"Scalers disagree on the number of features: {sorted(n_features)}")
+        self.n_features = n_features.pop() if n_features else None
+        self.mean = np.stack(means)[:, None, :] if means else None    # (k, 1, n_features)
+        self.scale = np.stack(scales)[:, None, :] if scales else None
+        self.params = {np.dtype(np.float64): (self.mean, self.scale)}
+        if means:
+            self.params[np.dtype(np.float32)] = (self.mean.astype(np.float32), self.scale.astype(np.float32))
+
+    @property
+    def n_unique(self):
+        """Distinct mean / scale rows actually computed per transform"""
+        return 0 if self.mean is None else len(self.mean)
+
+    def transform(self, X):
+        """
+        Scaled copies of X for every model
+
+        Parameters:
+        -----------
+        X : array
+            (n, n_features) float64 / float32 batch (a 1-D vector is one row)
+
+        Returns dict model name -> (n, n_features) array; ValueError on a
+        wrong shape or infinite values (NaN passes through), like sklearn's
+        validation
+        """
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.dtype != np.float32:
+            X = X.astype(np.float64, copy=False)
+        if self.n_features is not None and (X.ndim != 2 or X.shape[1] != self.n_features):
+            raise ValueError(f"Expected {self.n_features} features, got {X.shape[-1]}")
+        if np.isinf(X).any():
+            raise ValueError("Input contains infinity")
+
+        scaled = {}
+        if self.mean is not None:
+            # Same operations as StandardScaler.transform: X -= mean_; X /= scale_ (cast to X's dtype)
+            mean, scale = self.params[X.dtype]
+            Z = X[None] - mean
+            Z /= scale
+            for name, row in self.rows.items():
+                scaled[name] = Z[row]
+        for name, scaler in self.fallback.items():
+            scaled[name] = scaler.transform(X)
+        return {name: scaled[name] for name in self.names}
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import warnings
+    import joblib
+
+    parser = argparse.ArgumentParser(description="Fused scaling vs per-model sklearn transform")
+    parser.add_argument('files', nargs='*', default=['scaler_lstm_ha15m.save', 'scaler_randomforest_ha15m.save',
+                                                     'scaler_xgboost_ha15m.save'], help="Fitted scaler files")
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)  # Feature-name warnings on plain arrays
+    scalers = {path: joblib.load(path) for path in args.files}
+    fused = FusedScaler(scalers)
+    print(f"✓ {len(scalers)} scalers, {fused.n_unique} distinct, {len(fused.fallback)} unfused")
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(60000, 5000, size=(1, fused.n_features or 15))
+    for dtype in (np.float64, np.float32):
+        batch = X.astype(dtype)
+        fused_out = fused.transform(batch)
+        same = all(np.array_equal(fused_out[name], scaler.transform(batch)) for name, scaler in scalers.items())
+        print(f"  {np.dtype(dtype).name}: {'✓ identical to' if same else '✗ differs from'} sklearn transform")
+
+    timings = {}
+    for label, run in (('sklearn', lambda: [scaler.transform(X) for scaler in scalers.values()]),
+                       ('fused', lambda: fused.transform(X))):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            run()
+        timings[label] = (time.perf_counter() - start) / args.repeat * 1e6
+        print(f"  {label:<8} {timings[label]:8.1f} µs per request")
+    print(f"  {timings['sklearn'] / timings['fused']:.0f}x faster")
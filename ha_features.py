@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+Heiken Ashi Feature Pipeline
+Single definition of the model features shared by the training notebooks,
+the backtester, the prediction servers and the MT5 client
+
+Feature sets:
+  ensemble - FEATURE_COLUMNS, used by the LSTM and Random Forest models and
+             sent by the client / EA to the prediction servers
+  xgb      - XGB_FEATURE_COLUMNS, used by train_ha_kmeans_xgboost.ipynb
+
+All features are computed from plain NumPy arrays in one pass over the
+series (no per-row pandas indexing), so a full-history rebuild and the last
+row used by the live client come from exactly the same code.
+
+StreamingFeatures keeps the same features as running state for the live
+client: each new closed bar updates the HA recursion, the short rolling
+windows and the run-length counters in constant time. With the default
+'exact' K-means the window is only re-fitted when a feature row is actually
+requested (~0.2 ms per row for the 252-bar window, once per closed bar);
+'lloyd' re-fits warm-started on every bar (~0.07 ms per bar) and matches the
+batch pipeline run with cluster_method='lloyd'.
+
+Usage:
+    from ha_features import build_feature_frame, FEATURE_COLUMNS
+    df = build_feature_frame(df)            # df has HA_Open..HA_Close, Volume
+    X = df[FEATURE_COLUMNS].values
+
+    state = StreamingFeatures()
+    state.warm_up(open_, high, low, close, volume)   # raw OHLCV history
+    state.update(o, h, l, c, v)                      # each new closed bar
+    row = state.row()                                # 15 floats, FEATURE_COLUMNS order
+"""
+
+import math
+from collections import deque
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+from rolling_kmeans import RollingKMeans1D, rolling_cluster_density
+
+# === Feature definitions ===
+FEATURE_COLUMNS = [
+    'HA_Open', 'HA_High', 'HA_Low', 'HA_Close',  # Price
+    'HA_Body', 'HA_Range', 'HA_Close_Change',    # HA metrics
+    'HA_Momentum', 'HA_Volatility',              # Momentum
+    'Cluster_Density',                           # Clustering
+    'Consecutive_Up', 'Consecutive_Down',        # Patterns
+    'Volume', 'Volume_Change', 'Volume_Ratio'    # Volume
+]
+
+XGB_FEATURE_COLUMNS = [
+    'HA_Open', 'HA_High', 'HA_Low', 'HA_Close',  # HA candle prices
+    'HA_Body', 'HA_Range',                       # HA candle properties (signed body)
+    'Close_Change', 'Close_Pct_Change',          # Price momentum
+    'Volume', 'Volume_Change', 'Volume_MA',      # Volume features (diff change)
+    'Cluster', 'Cluster_Density',                # K-means features (rolling window)
+    'HA_Up_Signal', 'HA_Down_Signal'             # HA pattern signals
+]
+
+FEATURE_SETS = {
+    'ensemble': FEATURE_COLUMNS,
+    'xgb': XGB_FEATURE_COLUMNS,
+}
+
+N_FEATURES = len(FEATURE_COLUMNS)
+
+INPUT_COLUMNS = ['HA_Open', 'HA_High', 'HA_Low', 'HA_Close', 'Volume']
+
+KMEANS_WINDOW = 252    # Rolling K-means window (bars)
+MOMENTUM_BARS = 3      # HA_Momentum = HA_Close.diff(3)
+ROLLING_BARS = 5       # HA_Volatility / volume moving average window
+PATTERN_BARS = 3       # Consecutive bars for a valid HA pattern
+
+COMPACT_DTYPE = np.float32   # Feature dtype of the compact data path
+
+
+def heiken_ashi(open_, high, low, close, prev=None):
+    """
+    Heiken Ashi candles from raw OHLC arrays
+
+    - HA_Close = (Open + High + Low + Close) / 4
+    - HA_Open  = (Previous HA_Open + Previous HA_Close) / 2, first bar (Open + Close) / 2
+    - HA_High  = Max(High, HA_Open, HA_Close)
+    - HA_Low   = Min(Low, HA_Open, HA_Close)
+
+    prev : (ha_open, ha_close) of the bar before open_[0], to continue the
+        recursion across chunks of one series. None starts a new series.
+
+    Returns (ha_open, ha_high, ha_low, ha_close)
+    """
+    open_ = np.asarray(open_, dtype=float)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    close = np.asarray(close, dtype=float)
+
+    ha_close = (open_ + high + low + close) / 4
+
+    # HA_Open[i] = 0.5 * HA_Close[i-1] + 0.5 * HA_Open[i-1] is a first-order
+    # linear recurrence: one IIR filter pass seeded with the first HA_Open.
+    # Halving is exact in floating point, so this matches the per-bar loop bit for bit.
+    ha_open = np.empty(len(ha_close))
+    if len(ha_close):
+        if prev is None:
+            ha_open[0] = (open_[0] + close[0]) / 2
+        else:
+            ha_open[0] = (prev[0] + prev[1]) / 2
+        ha_open[1:], _ = lfilter([0.5], [1.0, -0.5], ha_close[:-1], zi=[0.5 * ha_open[0]])
+
+    ha_high = np.maximum(high, np.maximum(ha_open, ha_close))
+    ha_low = np.minimum(low, np.minimum(ha_open, ha_close))
+
+    return ha_open, ha_high, ha_low, ha_close
+
+
+def run_length(mask):
+    """
+    Length of the run of True values ending at each position (0 where False)
+
+    Cumulative-reset trick: the index of the latest False at or before each
+    position is a running maximum, and the run length is the distance to it.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    idx = np.arange(1, len(mask) + 1)
+    last_reset = np.maximum.accumulate(np.where(mask, 0, idx)) if len(mask) else idx
+    return idx - last_reset
+
+
+def consecutive_counts(close):
+    """
+    Consecutive up/down bar counters
+
+    A bar closing above the previous close extends the up run and resets the
+    down run (and vice versa); an unchanged close resets both.
+
+    Returns (up, down) int64 arrays
+    """
+    close = np.asarray(close, dtype=float)
+    step = np.zeros(len(close))
+    if len(close) > 1:
+        step[1:] = np.sign(close[1:] - close[:-1])
+
+    up = run_length(step > 0).astype(np.int64)
+    down = run_length(step < 0).astype(np.int64)
+    return up, down
+
+
+def _diff(x, periods=1):
+    """x - x.shift(periods), NaN for the first rows"""
+    out = np.full(len(x), np.nan)
+    if len(x) > periods:
+        out[periods:] = x[periods:] - x[:-periods]
+    return out
+
+
+def _pct_change(x):
+    """x / x.shift(1) - 1, NaN for the first row"""
+    out = np.full(len(x), np.nan)
+    if len(x) > 1:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            out[1:] = x[1:] / x[:-1] - 1
+    return out
+
+
+def _rolling(x, window, reducer, **kwargs):
+    """Trailing rolling reduction, NaN until the window is full"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= window:
+        out[window - 1:] = reducer(sliding_window_view(x, window), axis=1, **kwargs)
+    return out
+
+
+def compute_features(ha_open, ha_high, ha_low, ha_close, volume,
+                     feature_set='ensemble', window=KMEANS_WINDOW, cluster_method='exact'):
+    """
+    Compute every column of a feature set from HA OHLC + volume arrays
+
+    Parameters:
+    -----------
+    ha_open, ha_high, ha_low, ha_close, volume : array-like
+        Heiken Ashi prices and (tick) volume, oldest bar first
+    feature_set : str
+        'ensemble' (FEATURE_COLUMNS) or 'xgb' (XGB_FEATURE_COLUMNS)
+    window : int
+        Rolling K-means window
+    cluster_method : str
+        Passed to rolling_cluster_density ('exact' or 'lloyd')
+
+    Returns:
+    --------
+    dict of column name -> float ndarray. Warm-up rows are NaN; callers fill
+    them the way their model was trained (see feature_matrix).
+    """
+    if feature_set not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set: {feature_set}")
+
+    ha_open = np.asarray(ha_open, dtype=float)
+    ha_high = np.asarray(ha_high, dtype=float)
+    ha_low = np.asarray(ha_low, dtype=float)
+    ha_close = np.asarray(ha_close, dtype=float)
+    volume = np.asarray(volume, dtype=float)
+
+    ha_range = ha_high - ha_low
+    cluster, density = rolling_cluster_density(ha_close, window=window, method=cluster_method)
+    up, down = consecutive_counts(ha_close)
+
+    features = {
+        'HA_Open': ha_open,
+        'HA_High': ha_high,
+        'HA_Low': ha_low,
+        'HA_Close': ha_close,
+        'HA_Range': ha_range,
+        'Cluster': cluster,
+        'Cluster_Density': density,
+        'Volume': volume,
+    }
+
+    if feature_set == 'ensemble':
+        volume_ma = _rolling(volume, ROLLING_BARS, np.mean)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            volume_ratio = volume / volume_ma
+
+        features.update({
+            'HA_Body': np.abs(ha_close - ha_open),
+            'HA_Close_Change': _diff(ha_close),
+            'HA_Momentum': _diff(ha_close, MOMENTUM_BARS),
+            'HA_Volatility': _rolling(ha_range, ROLLING_BARS, np.std, ddof=1),
+            'Consecutive_Up': up.astype(float),
+            'Consecutive_Down': down.astype(float),
+            'Volume_Change': _pct_change(volume),
+            'Volume_Ratio': volume_ratio,
+        })
+    else:
+        features.update({
+            'HA_Body': ha_close - ha_open,
+            'Close_Change': _diff(ha_close),
+            'Close_Pct_Change': _pct_change(ha_close),
+            'Volume_Change': _diff(volume),
+            'Volume_MA': _rolling(volume, ROLLING_BARS, np.mean),
+            'HA_Up_Signal': (up >= PATTERN_BARS).astype(float),
+            'HA_Down_Signal': (down >= PATTERN_BARS).astype(float),
+        })
+
+    return features
+
+
+def feature_matrix(features, columns=FEATURE_COLUMNS, dtype=np.float64, fill_value=0.0):
+    """
+    Stack feature arrays into a C-contiguous (n_bars, n_features) matrix
+
+    NaN warm-up values are replaced with fill_value (the notebooks' fillna(0)).
+    """
+    X = np.empty((len(features[columns[0]]), len(columns)), dtype=dtype)
+    for j, col in enumerate(columns):
+        X[:, j] = features[col]
+    if fill_value is not None:
+        X[np.isnan(X)] = fill_value
+    return X
+
+
+def compact_check(predict, X, atol=1e-6):
+    """
+    Check that a model gives the same outputs on float32 features
+
+    Runs predict on X as float64 and as contiguous float32 and compares.
+
+    Parameters:
+    -----------
+    predict : callable
+        Model output function, e.g. model.predict or model.predict_proba
+    X : array-like
+        Scaled feature matrix (or LSTM sequences)
+    atol : float
+        Allowed absolute difference between the two outputs
+
+    Returns:
+    --------
+    dict with max_abs_diff, mismatches (outputs further apart than atol),
+    rows and ok
+    """
+    X = np.asarray(X)
+    out64 = np.asarray(predict(np.ascontiguousarray(X, dtype=np.float64)), dtype=np.float64)
+    out32 = np.asarray(predict(np.ascontiguousarray(X, dtype=COMPACT_DTYPE)), dtype=np.float64)
+
+    diff = np.abs(out64 - out32)
+    max_abs_diff = float(diff.max()) if diff.size else 0.0
+    mismatches = int(np.count_nonzero(diff > atol))
+
+    return {
+        'max_abs_diff': max_abs_diff,
+        'mismatches': mismatches,
+        'rows': len(X),
+        'ok': mismatches == 0,
+    }
+
+
+def build_feature_frame(df, feature_set='ensemble', window=KMEANS_WINDOW, cluster_method='exact'):
+    """
+    Add the feature columns to a DataFrame with HA_Open, HA_High, HA_Low,
+    HA_Close and Volume columns (modified in place and returned)
+    """
+    features = compute_features(
+        df['HA_Open'].to_numpy(dtype=float),
+        df['HA_High'].to_numpy(dtype=float),
+        df['HA_Low'].to_numpy(dtype=float),
+        df['HA_Close'].to_numpy(dtype=float),
+        df['Volume'].to_numpy(dtype=float),
+        feature_set=feature_set,
+        window=window,
+        cluster_method=cluster_method,
+    )
+    for col, values in features.items():
+        if col not in INPUT_COLUMNS:
+            df[col] = values
+    return df
+
+
+def _ratio(num, den):
+    """num / den with NumPy semantics for a zero denominator (inf or NaN)"""
+    if den == 0:
+        return math.copysign(math.inf, num) if num != 0 else math.nan
+    return num / den
+
+
+class StreamingFeatures:
+    """
+    Incremental FEATURE_COLUMNS state for one symbol
+
+    Rows match compute_features() + feature_matrix() with the same
+    cluster_method over the same bars (NaN warm-up values are reported as 0).
+    Updating is O(1) per bar apart from the sorted K-means window insert.
+
+    The exact K-means fit searches the split pairs of the window in
+    O(window log window) (~0.2 ms at 252 bars) and runs once per row() call,
+    not once per bar. The warm-started Lloyd fit costs ~0.07 ms and runs on
+    every bar, since its result depends on the previous fit. Lloyd can
+    settle in a local optimum (on BTCUSD M15 about a third of the densities
+    differ from exact), so 'exact' stays the default: it gives the densities
+    the models were trained on.
+    """
+
+    def __init__(self, window=KMEANS_WINDOW, cluster_method='exact'):
+        """
+        Parameters:
+        -----------
+        window : int
+            Rolling K-means window
+        cluster_method : str
+            'exact' (fitted per row() call) or 'lloyd' (warm-started, fitted
+            per bar); see rolling_kmeans
+        """
+        self.window = window
+        self.n_bars = 0
+
+        self._kmeans = RollingKMeans1D(window=window, method=cluster_method)
+        self._fit_every_bar = cluster_method == 'lloyd'
+        self._closes = deque(maxlen=MOMENTUM_BARS + 1)
+        self._ranges = deque(maxlen=ROLLING_BARS)
+        self._volumes = deque(maxlen=ROLLING_BARS)
+
+        self._ha_open = None
+        self._ha_close = None
+        self._ha_high = None
+        self._ha_low = None
+        self._up = 0
+        self._down = 0
+        self._cluster = None
+
+    def update(self, open_, high, low, close, volume):
+        """Ingest one closed bar (oldest first)"""
+        open_ = float(open_)
+        high = float(high)
+        low = float(low)
+        close = float(close)
+
+        ha_close = (open_ + high + low + close) / 4
+        if self._ha_open is None:
+            ha_open = (open_ + close) / 2
+        else:
+            ha_open = (self._ha_open + self._ha_close) / 2
+            # Row i clusters the window ending at the previous bar
+            self._kmeans.add(self._ha_close)
+
+            if ha_close > self._ha_close:
+                self._up += 1
+                self._down = 0
+            elif ha_close < self._ha_close:
+                self._down += 1
+                self._up = 0
+            else:
+                self._up = 0
+                self._down = 0
+
+        self._ha_open = ha_open
+        self._ha_close = ha_close
+        self._ha_high = max(high, ha_open, ha_close)
+        self._ha_low = min(low, ha_open, ha_close)
+
+        self._closes.append(ha_close)
+        self._ranges.append(self._ha_high - self._ha_low)
+        self._volumes.append(float(volume))
+        self._cluster = None
+        if self._fit_every_bar:
+            # Each Lloyd fit starts from the previous one, so none may be skipped
+            self._cluster = self._kmeans.fit()
+        self.n_bars += 1
+
+    def warm_up(self, open_, high, low, close, volume):
+        """Ingest a history of raw OHLCV bars (array-likes, oldest first)"""
+        for bar in zip(*(np.asarray(a, dtype=float).tolist()
+                         for a in (open_, high, low, close, volume))):
+            self.update(*bar)
+        return self
+
+    @property
+    def cluster(self):
+        """(cluster, density_pct) for the latest bar, or None during warm-up"""
+        if self._cluster is None and self.n_bars > self.window and not self._fit_every_bar:
+            self._cluster = self._kmeans.fit()
+        return self._cluster
+
+    def row(self):
+        """Feature row for the latest bar as a list in FEATURE_COLUMNS order"""
+        if not self.n_bars:
+            return None
+
+        closes = self._closes
+        ranges = self._ranges
+        volumes = self._volumes
+        ha_close = self._ha_close
+        volume = volumes[-1]
+
+        close_change = ha_close - closes[-2] if len(closes) > 1 else 0.0
+        momentum = ha_close - closes[0] if len(closes) > MOMENTUM_BARS else 0.0
+
+        volatility = 0.0
+        volume_ratio = 0.0
+        if len(ranges) == ROLLING_BARS:
+            mean = sum(ranges) / ROLLING_BARS
+            volatility = math.sqrt(sum((r - mean) * (r - mean) for r in ranges) / (ROLLING_BARS - 1))
+            volume_ratio = _ratio(volume, sum(volumes) / ROLLING_BARS)
+
+        volume_change = _ratio(volume, volumes[-2]) - 1 if len(volumes) > 1 else 0.0
+
+        cluster = self.cluster
+        density = cluster[1] if cluster is not None else 0.0
+
+        row = [
+            self._ha_open, self._ha_high, self._ha_low, ha_close,
+            abs(ha_close - self._ha_open), self._ha_high - self._ha_low, close_change,
+            momentum, volatility,
+            density,
+            float(self._up), float(self._down),
+            volume, volume_change, volume_ratio,
+        ]
+        return [0.0 if value != value else value for value in row]
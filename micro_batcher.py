@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Scheduler
+Collects concurrent prediction requests into one batched model call
+
+Scoring a (1, 15) row costs each model almost as much as scoring a few
+dozen rows, so under many connected clients the server spends its time on
+per-call overhead. MicroBatcher sits between the asyncio server and the
+executor:
+
+  - a request arriving while no batch is running is sent at once (a lone
+    client sees no added latency)
+  - requests arriving while a batch runs are collected until that batch
+    finishes, the window (e.g. 1 ms) passes or max_batch are waiting
+  - at most max_concurrent batches run at once (the executor's threads),
+    so a busy executor is never handed a queue of tiny batches
+  - batch_fn receives the list of items and returns one result per item
+    (an Exception instance fails only that item); its results are
+    scattered back to the waiting callers
+
+Usage:
+    batcher = MicroBatcher(make_predictions, window=0.001, max_batch=64, executor=executor, max_concurrent=4)
+    signal, confidence, votes = await batcher.submit(features)
+"""
+
+import asyncio
+
+BATCH_WINDOW = 0.001  # Seconds a request may wait for others to join its batch
+MAX_BATCH = 64
+
+
+class MicroBatcher:
+    """Batches concurrent submit() calls into batch_fn calls on an executor"""
+
+    def __init__(self, batch_fn, window=BATCH_WINDOW, max_batch=MAX_BATCH, executor=None, max_concurrent=1):
+        """
+        Parameters:
+        -----------
+        batch_fn : callable
+            list of items -> list of results (same order); runs on the executor
+        window : float
+            Seconds to collect requests while a batch is running
+        max_batch : int
+            Largest batch passed to batch_fn
+        executor : Executor (optional)
+            Where batch_fn runs (None: the loop's default executor)
+        max_concurrent : int
+            Batches running at once (normally the executor's thread count)
+        """
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self.executor = executor
+        self.max_concurrent = max_concurrent
+
+        self.pending = []
+        self.timer = None
+        self.running = set()
+        self.stats = {'batches': 0, 'items': 0, 'largest': 0}
+
+    async def submit(self, item):
+        """Result of batch_fn for item (raises the item's exception)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((item, future))
+
+        if not self.running or len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    def flush(self):
+        """Start batches of waiting requests (up to max_batch each) while below max_concurrent"""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        # At capacity the requests wait for a running batch to finish
+        while self.pending and len(self.running) < self.max_concurrent:
+            batch, self.pending = self.pending[:self.max_batch], self.pending[self.max_batch:]
+            task = asyncio.ensure_future(self._run(batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, [item for item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(batch)} requests")
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():  # Caller went away (connection closed / shutdown)
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+        self.stats['batches'] += 1
+        self.stats['items'] += len(batch)
+        self.stats['largest'] = max(self.stats['largest'], len(batch))
+
+        # Requests collected while this batch ran go next without waiting out the window
+        self.running.discard(asyncio.current_task())
+        if self.pending:
+            self.flush()
+
+    def summary_line(self):
+        batches = self.stats['batches']
+        if not batches:
+            return "  batches        0"
+        return (f"  batches  {batches:>8,}  avg {self.stats['items'] / batches:5.1f} requests  "
+                f"max {self.stats['largest']}")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo Trade-Sequence Analysis
+Distributions of drawdown, terminal equity and losing streaks from a trade PnL array
+
+A backtest reports one max drawdown for one ordering of its trades. Here
+the trade PnLs are re-ordered thousands of times:
+
+  bootstrap - draw n trades with replacement (terminal equity varies too)
+  permute   - shuffle the same n trades (terminal equity is fixed, the path
+              and therefore drawdown / streaks vary)
+
+Every simulation is a row of a 2-D array, so the equity paths are one
+cumulative sum along axis 1, running peaks one maximum.accumulate and
+losing streaks the cumulative-reset run length of ha_features.run_length
+done per row. Rows are processed in chunks that fit a fixed memory budget.
+
+Usage:
+    from monte_carlo import monte_carlo, print_monte_carlo
+    mc = monte_carlo(trades_df['pnl'].values, initial_equity=10000)
+    print_monte_carlo(mc)
+
+    python monte_carlo.py [backtest_trades_enhanced.csv] [--sims 100000] [--method bootstrap|permute]
+"""
+
+import numpy as np
+
+DEFAULT_SIMS = 100000
+MAX_CHUNK_MB = 64
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def _draw_paths(pnl, n_rows, method, rng):
+    """n_rows resampled (bootstrap) or shuffled (permute) trade sequences"""
+    n = len(pnl)
+    if method == 'bootstrap':
+        return pnl[rng.integers(0, n, size=(n_rows, n))]
+    return rng.permuted(np.broadcast_to(pnl, (n_rows, n)), axis=1)
+
+
+def path_stats(paths, initial_equity):
+    """
+    Statistics of each row of a 2-D trade PnL array (modified in place)
+
+    Returns (max_drawdown %, terminal equity, min equity, longest losing
+    streak) arrays, one value per row
+    """
+    n = paths.shape[1]
+
+    # Losses as in the backtester's streak counter (pnl <= 0); the last
+    # winning trade index is the streak reset point. Smallest int dtype that
+    # holds n keeps the scan cheap.
+    idx = np.arange(1, n + 1, dtype=np.min_scalar_type(n))
+    last_reset = np.maximum.accumulate(idx * (paths > 0), axis=1)
+    streak = (idx - last_reset).max(axis=1).astype(np.int64)
+
+    equity = np.cumsum(paths, axis=1, out=paths)
+    equity += initial_equity
+    terminal = equity[:, -1].copy()
+    min_equity = np.minimum(equity.min(axis=1), initial_equity)
+
+    peak = np.maximum.accumulate(equity, axis=1)
+    np.maximum(peak, initial_equity, out=peak)
+    np.divide(equity, peak, out=equity)
+    drawdown = np.minimum(equity.min(axis=1) - 1, 0) * 100
+
+    return drawdown, terminal, min_equity, streak
+
+
+def monte_carlo(pnl, initial_equity=10000, n_sims=DEFAULT_SIMS, method='bootstrap', seed=42,
+                ruin_level=0.5, max_chunk_mb=MAX_CHUNK_MB):
+    """
+    Resample / permute a trade sequence n_sims times
+
+    Parameters:
+    -----------
+    pnl : array
+        PnL of each trade in trade order
+    initial_equity : float
+        Starting equity of every path
+    n_sims : int
+        Number of simulated paths
+    method : str
+        'bootstrap' (with replacement) or 'permute' (shuffle)
+    seed : int
+        Random seed
+    ruin_level : float
+        Equity fraction of initial_equity that counts as ruin
+    max_chunk_mb : int
+        Memory budget of one chunk of paths
+
+    Returns:
+    --------
+    dict with per-simulation arrays 'max_drawdown' (%, negative),
+    'terminal_equity', 'min_equity', 'max_losing_streak', the same
+    statistics of the actual trade order ('actual'), 'risk_of_ruin' and
+    run settings
+    """
+    if method not in ('bootstrap', 'permute'):
+        raise ValueError(f"Unknown method: {method}")
+
+    pnl = np.asarray(pnl, dtype=float)
+    pnl = pnl[~np.isnan(pnl)]
+    n = len(pnl)
+
+    drawdown = np.zeros(n_sims)
+    terminal = np.full(n_sims, float(initial_equity))
+    min_equity = np.full(n_sims, float(initial_equity))
+    streak = np.zeros(n_sims, dtype=np.int64)
+
+    if n:
+        # About 3 n-wide float64 temporaries per path
+        rows = max(1, int(max_chunk_mb * 2**20 // (n * 8 * 3)))
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_sims, rows):
+            stop = min(start + rows, n_sims)
+            (drawdown[start:stop], terminal[start:stop],
+             min_equity[start:stop], streak[start:stop]) = path_stats(_draw_paths(pnl, stop - start, method, rng),
+                                                                      initial_equity)
+
+    # Same statistics for the trades in their actual order
+    actual = [values[0] for values in path_stats(pnl[None, :].copy(), initial_equity)] if n else [0.0, initial_equity, initial_equity, 0]
+
+    return {
+        'method': method,
+        'n_sims': n_sims,
+        'n_trades': n,
+        'initial_equity': initial_equity,
+        'ruin_level': ruin_level,
+        'max_drawdown': drawdown,
+        'terminal_equity': terminal,
+        'min_equity': min_equity,
+        'max_losing_streak': streak,
+        'risk_of_ruin': float(np.mean(min_equity <= initial_equity * ruin_level)) * 100,
+        'actual': {
+            'max_drawdown': float(actual[0]),
+            'terminal_equity': float(actual[1]),
+            'min_equity': float(actual[2]),
+            'max_losing_streak': int(actual[3]),
+        },
+    }
+
+
+def summarize_monte_carlo(mc, percentiles=PERCENTILES):
+    """Percentile table of the simulated distributions (dict of metric -> {pct: value})"""
+    return {
+        metric: dict(zip(percentiles, np.percentile(mc[metric], percentiles)))
+        for metric in ('max_drawdown', 'terminal_equity', 'max_losing_streak')
+    }
+
+
+def print_monte_carlo(mc, percentiles=PERCENTILES):
+    """Print the Monte Carlo distributions next to the actual trade order"""
+    summary = summarize_monte_carlo(mc, percentiles)
+    actual = mc['actual']
+
+    print("\n" + "=" * 60)
+    print(f"MONTE CARLO ({mc['n_sims']:,} {mc['method']} paths of {mc['n_trades']} trades)")
+    print("=" * 60)
+
+    header = "".join(f"{f'P{p}':>12}" for p in percentiles)
+    print(f"  {'':<20}{header}{'Actual':>12}")
+    rows = (
+        ('Max Drawdown %', 'max_drawdown', '{:>12.2f}'),
+        ('Terminal Equity $', 'terminal_equity', '{:>12,.0f}'),
+        ('Max Losing Streak', 'max_losing_streak', '{:>12.0f}'),
+    )
+    for label, metric, fmt in rows:
+        values = "".join(fmt.format(summary[metric][p]) for p in percentiles)
+        print(f"  {label:<20}{values}{fmt.format(actual[metric])}")
+
+    worse = np.mean(mc['max_drawdown'] < actual['max_drawdown']) * 100
+    print(f"\n  Paths with a deeper drawdown than actual: {worse:.1f}%")
+    print(f"  Risk of ruin (equity <= {mc['ruin_level'] * 100:.0f}% of initial): {mc['risk_of_ruin']:.2f}%")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Monte Carlo analysis of a backtest trade log")
+    parser.add_argument('trades_file', nargs='?', default='backtest_trades_enhanced.csv')
+    parser.add_argument('--sims', type=int, default=DEFAULT_SIMS, help="Simulated paths")
+    parser.add_argument('--method', default='bootstrap', choices=['bootstrap', 'permute'])
+    parser.add_argument('--initial-equity', type=float, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    trades = pd.read_csv(args.trades_file)
+    start = time.perf_counter()
+    mc = monte_carlo(trades['pnl'].values, initial_equity=args.initial_equity, n_sims=args.sims,
+                     method=args.method, seed=args.seed)
+    elapsed = time.perf_counter() - start
+
+    print_monte_carlo(mc)
+    print(f"\n✓ {args.sims:,} paths x {mc['n_trades']} trades in {elapsed:.2f}s")
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Online Performance Metrics
+O(1) per-trade / per-bar accumulator shared by the backtester and the live client
+
+Win rate, profit factor, average win / loss, running max drawdown, Sharpe
+ratio (Welford mean / variance of per-trade returns) and win / loss streaks
+are updated in place as trades close, so there is no trade DataFrame to
+rebuild at the end of a backtest or on every report of the live bot.
+
+Definitions match EnhancedBacktestEngine's reports:
+  - return of a trade = pnl / equity before the trade
+  - Sharpe = mean / std (population) of trade returns * sqrt(252)
+  - drawdown in % of the running equity peak (initial equity included)
+  - winners pnl > 0, losers pnl < 0; streak losses pnl <= 0
+
+Usage:
+    from online_metrics import OnlineMetrics
+    metrics = OnlineMetrics(initial_equity=10000)
+    metrics.update(pnl)          # each closed trade
+    metrics.mark(equity)         # optional: mark-to-market equity each bar
+    metrics.summary(), str(metrics)
+"""
+
+import math
+
+PERIODS_PER_YEAR = 252
+
+
+class OnlineMetrics:
+    """Streaming trade statistics"""
+
+    def __init__(self, initial_equity, periods_per_year=PERIODS_PER_YEAR):
+        """
+        Parameters:
+        -----------
+        initial_equity : float
+            Starting equity (first drawdown peak, ROI base)
+        periods_per_year : int
+            Sharpe annualisation factor
+        """
+        self.initial_equity = float(initial_equity)
+        self.periods_per_year = periods_per_year
+
+        self.equity = self.initial_equity
+        self.peak = self.initial_equity
+        self.max_drawdown = 0.0
+
+        self.trades = 0
+        self.wins = 0
+        self.losses = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+
+        self.consecutive_wins = 0
+        self.consecutive_losses = 0
+        self.max_consecutive_wins = 0
+        self.max_consecutive_losses = 0
+
+        # Welford state of per-trade returns
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def update(self, pnl, streak=True):
+        """
+        Add one closed trade
+
+        streak=False leaves the win / loss streaks alone (used for positions
+        force-closed at the end of a backtest)
+        """
+        before = self.equity
+        self.trades += 1
+        if pnl > 0:
+            self.wins += 1
+            self.gross_profit += pnl
+        elif pnl < 0:
+            self.losses += 1
+            self.gross_loss -= pnl
+
+        if before != 0:
+            ret = pnl / before
+            self._n += 1
+            delta = ret - self._mean
+            self._mean += delta / self._n
+            self._m2 += delta * (ret - self._mean)
+
+        if streak:
+            if pnl > 0:
+                self.consecutive_wins += 1
+                self.consecutive_losses = 0
+                self.max_consecutive_wins = max(self.max_consecutive_wins, self.consecutive_wins)
+            else:
+                self.consecutive_losses += 1
+                self.consecutive_wins = 0
+                self.max_consecutive_losses = max(self.max_consecutive_losses, self.consecutive_losses)
+
+        self.mark(before + pnl)
+
+    def mark(self, equity):
+        """Set the current (mark-to-market) equity and update the running drawdown"""
+        self.equity = equity
+        if equity > self.peak:
+            self.peak = equity
+        drawdown = (equity - self.peak) / self.peak * 100
+        if drawdown < self.max_drawdown:
+            self.max_drawdown = drawdown
+
+    @property
+    def net_profit(self):
+        return self.gross_profit - self.gross_loss
+
+    @property
+    def win_rate(self):
+        return self.wins / self.trades * 100 if self.trades else 0
+
+    @property
+    def profit_factor(self):
+        return self.gross_profit / self.gross_loss if self.gross_loss > 0 else 0
+
+    @property
+    def avg_win(self):
+        return self.gross_profit / self.wins if self.wins else 0
+
+    @property
+    def avg_loss(self):
+        return self.gross_loss / self.losses if self.losses else 0
+
+    @property
+    def drawdown(self):
+        """Current drawdown from the equity peak (%)"""
+        return (self.equity - self.peak) / self.peak * 100
+
+    @property
+    def sharpe_ratio(self):
+        if self._n == 0:
+            return 0
+        std = math.sqrt(self._m2 / self._n)
+        return self._mean / std * math.sqrt(self.periods_per_year) if std > 0 else 0
+
+    @property
+    def roi(self):
+        return (self.equity - self.initial_equity) / self.initial_equity * 100
+
+    def summary(self):
+        """All metrics as a dict"""
+        return {
+            'trades': self.trades,
+            'win_rate': self.win_rate,
+            'net_profit': self.net_profit,
+            'profit_factor': self.profit_factor,
+            'max_drawdown': self.max_drawdown,
+            'sharpe_ratio': self.sharpe_ratio,
+            'roi': self.roi,
+            'max_consecutive_wins': self.max_consecutive_wins,
+            'max_consecutive_losses': self.max_consecutive_losses,
+        }
+
+    def __str__(self):
+        streak = f"W{self.consecutive_wins}" if self.consecutive_wins else f"L{self.consecutive_losses}"
+        return (f"Trades {self.trades} | Win {self.win_rate:.1f}% | PF {self.profit_factor:.2f} | "
+                f"Net ${self.net_profit:,.2f} | Equity ${self.equity:,.2f} | DD {self.drawdown:.2f}% "
+                f"(max {self.max_drawdown:.2f}%) | Sharpe {self.sharpe_ratio:.2f} | Streak {streak}")
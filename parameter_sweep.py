@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Parallel Parameter Sweep for the Enhanced Ensemble Backtest
+Evaluates many risk_params combinations on one prepared data set
+
+prepare_data (K-means clusters, patterns, signals) runs once. The columns
+the backtest core needs (HA_Close, Signal, Cluster_Density, day numbers) are
+published in shared memory, and a process pool attaches to them without
+copying. Each worker then runs backtest_core.run_core for its share of the
+combinations. Runs are independent, so throughput scales with the worker
+count.
+
+Sweepable parameters: stop_loss_pips, min_holding_bars, max_daily_trades,
+risk_percent. take_profit_pips is rejected: the TP is set by cluster density
+(200 + density * 400 pips), so sweeping it would only repeat identical runs.
+
+Usage:
+    from parameter_sweep import run_sweep
+    results = run_sweep(engine, {'stop_loss_pips': [50, 100, 200], 'min_holding_bars': [4, 10, 16]})
+
+    python parameter_sweep.py [--start 2025-01-01] [--end 2025-08-01] [--samples 200] [--workers N]
+"""
+
+import os
+import time
+import itertools
+import numpy as np
+import pandas as pd
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+from backtest_core import run_bars
+
+SWEEP_PARAMS = ('stop_loss_pips', 'min_holding_bars', 'max_daily_trades', 'risk_percent')
+
+DEFAULT_GRID = {
+    'stop_loss_pips': [50, 100, 150, 200],
+    'min_holding_bars': [4, 8, 10, 16, 24],
+    'max_daily_trades': [2, 3, 6, 10],
+    'risk_percent': [1.0, 2.0, 3.0],
+}
+
+RESULT_FILE = 'sweep_results.csv'
+
+# Worker state: shared memory blocks and the arrays viewing them
+_shared = {}
+
+
+def param_grid(grid):
+    """Every combination of a {param: [values]} grid as a list of dicts"""
+    _check_params(grid)
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def param_sample(grid, n_samples, seed=42):
+    """n_samples distinct combinations drawn at random from a grid"""
+    combos = param_grid(grid)
+    if n_samples >= len(combos):
+        return combos
+    rng = np.random.default_rng(seed)
+    return [combos[k] for k in sorted(rng.choice(len(combos), size=n_samples, replace=False))]
+
+
+def _check_params(grid):
+    if 'take_profit_pips' in grid:
+        raise ValueError("take_profit_pips cannot be swept: the backtest sets the TP from cluster density "
+                         "(200 + density * 400 pips) and ignores it")
+    unknown = [name for name in grid if name not in SWEEP_PARAMS]
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {unknown} (expected {list(SWEEP_PARAMS)})")
+
+
+def publish_arrays(arrays):
+    """
+    Copy arrays into shared memory blocks
+
+    Returns (blocks, spec): keep blocks alive in the owner and unlink them
+    when done; spec (name -> (block name, shape, dtype)) is what workers
+    need to attach.
+    """
+    blocks = []
+    spec = {}
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values)
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        blocks.append(block)
+        spec[name] = (block.name, values.shape, values.dtype.str)
+    return blocks, spec
+
+
+def _attach(spec, base_params):
+    """Worker initializer: map the shared arrays (no copy)"""
+    _shared.clear()
+    _shared['blocks'] = []
+    _shared['base_params'] = base_params
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared['blocks'].append(block)
+        _shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _evaluate(params, lo=0, hi=None):
+    """Worker: one backtest run over bars [lo, hi), summarised"""
+    result = run_bars(_shared, {**_shared['base_params'], **params}, lo, hi)
+    return {**params, **result['metrics'].summary()}
+
+
+def sweep_arrays(engine):
+    """Core input arrays of a prepared engine, in shareable form"""
+    if 'Cluster_Density' not in engine.df.columns:
+        engine.prepare_data()
+
+    arrays = engine.core_arrays()
+    if arrays['density'] is None:
+        arrays['density'] = np.full(len(engine.df), 0.5)
+    arrays['signal'] = np.asarray(arrays['signal'], dtype=float)
+    return arrays
+
+
+def evaluate(arrays, base_params, combos, bounds=None, workers=None):
+    """
+    Run one backtest per combination over shared arrays
+
+    Parameters:
+    -----------
+    arrays : dict
+        close / signal / density / day arrays (see sweep_arrays)
+    base_params : dict
+        risk_params every combination is applied on top of
+    combos : list of dict
+        Parameter combinations
+    bounds : list of (lo, hi) (optional)
+        Bar range of each run (default: all bars)
+    workers : int (optional)
+        Worker processes (default: one per core)
+
+    Returns list of {**params, **metrics} in the order of combos
+    """
+    bounds = bounds or [(0, None)] * len(combos)
+    los, his = [list(b) for b in zip(*bounds)] if combos else ([], [])
+
+    workers = min(workers or os.cpu_count() or 1, len(combos)) if combos else 1
+    blocks, spec = publish_arrays(arrays)
+    try:
+        if workers > 1:
+            chunksize = max(1, len(combos) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                     initargs=(spec, base_params)) as pool:
+                return list(pool.map(_evaluate, combos, los, his, chunksize=chunksize))
+        _attach(spec, base_params)
+        return [_evaluate(params, lo, hi) for params, lo, hi in zip(combos, los, his)]
+    finally:
+        _shared.clear()
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def rank(results, sort_by='roi'):
+    """Sort sweep results best first (descending sort_by) with a 1-based rank index"""
+    results = pd.DataFrame(results)
+    if len(results):
+        results = results.sort_values(sort_by, ascending=False, kind='stable').reset_index(drop=True)
+        results.index += 1
+        results.index.name = 'rank'
+    return results
+
+
+def run_sweep(engine, grid=None, samples=None, workers=None, sort_by='roi', seed=42):
+    """
+    Backtest every parameter combination of a grid (or a random sample of it)
+
+    Parameters:
+    -----------
+    engine : EnhancedBacktestEngine
+        Engine holding the data range to test; prepare_data is run here
+        once if it has not been run yet
+    grid : dict (optional)
+        {param: [values]} over SWEEP_PARAMS (default: DEFAULT_GRID)
+    samples : int (optional)
+        Evaluate this many random combinations instead of the full grid
+    workers : int (optional)
+        Worker processes (default: one per core)
+    sort_by : str
+        Result column to rank by (descending)
+    seed : int
+        Random seed for samples
+
+    Returns DataFrame of parameters and metrics, best first
+    """
+    grid = grid or DEFAULT_GRID
+    combos = param_sample(grid, samples, seed) if samples else param_grid(grid)
+
+    rows = evaluate(sweep_arrays(engine), engine.core_params(), combos, workers=workers)
+    return rank(rows, sort_by)
+
+
+def print_sweep(results, top=20):
+    """Print the ranked results table"""
+    print("\n" + "=" * 70)
+    print(f"PARAMETER SWEEP RESULTS (top {min(top, len(results))} of {len(results)})")
+    print("=" * 70)
+    with pd.option_context('display.width', 160, 'display.max_columns', None,
+                           'display.float_format', '{:,.2f}'.format):
+        print(results.head(top).to_string())
+
+
+if __name__ == "__main__":
+    import argparse
+    import io
+    import contextlib
+    from backtest_ensemble_enhanced import EnhancedBacktestEngine
+
+    parser = argparse.ArgumentParser(description="Parallel risk_params sweep of the enhanced ensemble backtest")
+    parser.add_argument('--csv', default='BTCUSD_15m_HA_data.csv', help="Heiken Ashi data CSV")
+    parser.add_argument('--ensemble', default='ensemble_ha15m_forecast.csv', help="Ensemble predictions CSV")
+    parser.add_argument('--start', default='2025-07-01', help="Start date (YYYY-MM-DD)")
+    parser.add_argument('--end', default='2025-08-01', help="End date (YYYY-MM-DD)")
+    parser.add_argument('--samples', type=int, default=None, help="Random combinations to test (default: full grid)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument('--sort', default='roi', help="Metric to rank by")
+    parser.add_argument('--top', type=int, default=20, help="Rows to print")
+    parser.add_argument('--output', default=RESULT_FILE, help="Ranked results CSV")
+    args = parser.parse_args()
+
+    risk_params = {
+        'stop_loss_pips': 100,
+        'take_profit_pips': 300,
+        'min_lot_size': 0.5,
+        'max_lot_size': 1.2,
+        'account_balance': 10000,
+        'risk_percent': 2.0,
+        'min_holding_bars': 10,
+        'max_daily_trades': 6
+    }
+
+    print("=" * 70)
+    print("PARAMETER SWEEP")
+    print("=" * 70)
+
+    engine = EnhancedBacktestEngine(args.csv, args.ensemble, risk_params,
+                                    start_date=args.start, end_date=args.end)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine.prepare_data()
+    print(f"✓ Data prepared once: {len(engine.df):,} bars in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    results = run_sweep(engine, samples=args.samples, workers=args.workers, sort_by=args.sort)
+    elapsed = time.perf_counter() - start
+    print(f"✓ {len(results)} runs in {elapsed:.2f}s ({len(results) / elapsed:,.1f} runs/s)")
+
+    print_sweep(results, top=args.top)
+    results.to_csv(args.output)
+    print(f"\n✓ Ranked results saved: {args.output}")
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Multi-Symbol Portfolio Backtest
+Several symbols traded against one account with shared, compounding equity
+
+Each symbol is prepared by its own EnhancedBacktestEngine (HA data +
+ensemble signals). The prepared columns are aligned on the union of all bar
+times into (T, S) arrays, and one loop steps through the portfolio's events
+in time order:
+
+  - SL / TP exits due at a time are settled first (in symbol order), so a
+    symbol may exit and re-enter on the same bar, as in the single-symbol
+    core; a position closed by the end of its symbol's data keeps its slot
+    through that last bar
+  - entries are taken from the row of signals at that time across all
+    symbols, subject to max_daily_trades per symbol, a per-symbol position
+    limit and a global position limit
+  - position size comes from the shared equity at entry
+
+A position's exit depends only on its own entry (levels are fixed), so it
+is resolved at entry with backtest_core.first_touch over the symbol's own
+bars (min_holding_bars counts that symbol's bars). The loop therefore only
+visits signal and exit times, and the per-time work is array operations
+over all symbols, so adding symbols costs about what their extra trades do.
+A position still open when its symbol's data ends is closed on that
+symbol's last bar.
+
+Each symbol needs HA data and an ensemble forecast. For XAGUSD (the
+XAGUSD_H1_data.csv export is tab-delimited and newest-first):
+    python process_csv_to_ha.py XAGUSD_H1_data.csv XAGUSD_1h_HA_data.csv
+then run the training notebooks and ensemble_ha15m_voting.ipynb on
+XAGUSD_1h_HA_data.csv and save the forecast as ensemble_xagusd_1h_forecast.csv.
+
+Usage:
+    from portfolio_backtest import PortfolioBacktest
+    portfolio = PortfolioBacktest.from_files({
+        'BTCUSD': ('BTCUSD_15m_HA_data.csv', 'ensemble_ha15m_forecast.csv'),
+        'XAGUSD': ('XAGUSD_1h_HA_data.csv', 'ensemble_xagusd_1h_forecast.csv'),
+    }, risk_params, max_positions=2)
+    portfolio.run()
+    portfolio.save_results()
+
+    python portfolio_backtest.py --symbol BTCUSD=BTCUSD_15m_HA_data.csv,ensemble_ha15m_forecast.csv \
+                                 --symbol XAGUSD=XAGUSD_1h_HA_data.csv,ensemble_xagusd_1h_forecast.csv
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest_core import (first_touch, exit_ranges, trade_levels, position_size, PIP, PNL_MULTIPLIER,
+                           EXIT_SL, EXIT_TP, EXIT_END, EXIT_TYPES)
+from online_metrics import OnlineMetrics
+
+
+class PortfolioBacktest:
+    """Shared-equity backtest over several prepared symbols"""
+
+    def __init__(self, engines, risk_params, max_positions=None, max_positions_per_symbol=1):
+        """
+        Parameters:
+        -----------
+        engines : dict
+            Symbol -> EnhancedBacktestEngine (prepare_data is run if needed)
+        risk_params : dict
+            Risk management parameters shared by all symbols (as for
+            EnhancedBacktestEngine, incl. min_holding_bars, max_daily_trades,
+            exit_mode, both_touch)
+        max_positions : int (optional)
+            Open positions allowed across all symbols (default: no global limit)
+        max_positions_per_symbol : int
+            Open positions allowed per symbol
+        """
+        if not engines:
+            raise ValueError("Portfolio needs at least one symbol")
+
+        self.engines = engines
+        self.symbols = list(engines)
+        self.risk_params = {'min_holding_bars': 16, 'max_daily_trades': 3, **risk_params}
+        self.max_positions_per_symbol = max_positions_per_symbol
+        self.max_positions = max_positions or len(self.symbols) * max_positions_per_symbol
+
+        self.trades = []
+        self.equity_curve = [self.risk_params['account_balance']]
+
+    @classmethod
+    def from_files(cls, symbol_files, risk_params, start_date=None, end_date=None,
+                   max_positions=None, max_positions_per_symbol=1, **engine_kwargs):
+        """Build one engine per symbol from {symbol: (ha_csv, ensemble_csv)}"""
+        from backtest_ensemble_enhanced import EnhancedBacktestEngine
+
+        engine_kwargs.setdefault('monte_carlo_sims', 0)
+        engines = {
+            symbol: EnhancedBacktestEngine(csv_file, ensemble_file, risk_params,
+                                           start_date=start_date, end_date=end_date, **engine_kwargs)
+            for symbol, (csv_file, ensemble_file) in symbol_files.items()
+        }
+        return cls(engines, risk_params, max_positions=max_positions,
+                   max_positions_per_symbol=max_positions_per_symbol)
+
+    def align(self):
+        """Prepare every symbol and align them on the union time index"""
+        self.data = []
+        for symbol in self.symbols:
+            engine = self.engines[symbol]
+            if 'Cluster_Density' not in engine.df.columns:
+                engine.prepare_data()
+            arrays = engine.core_arrays()
+            if arrays['density'] is None:
+                arrays['density'] = np.full(len(engine.df), 0.5)
+            arrays['signal'] = np.asarray(arrays['signal'], dtype=float)
+            arrays['time'] = engine.df['Time'].to_numpy(dtype='datetime64[ns]')
+            self.data.append(arrays)
+
+        self.times = np.unique(np.concatenate([arrays['time'] for arrays in self.data]))
+        T, S = len(self.times), len(self.symbols)
+
+        # (T, S) signal matrix (0 where a symbol has no bar) and the symbol
+        # bar number behind each cell (-1 where missing)
+        self.signal = np.zeros((T, S))
+        self.bar = np.full((T, S), -1, dtype=np.int64)
+        for s, arrays in enumerate(self.data):
+            arrays['row'] = np.searchsorted(self.times, arrays['time'])
+            self.signal[arrays['row'], s] = arrays['signal']
+            self.bar[arrays['row'], s] = np.arange(len(arrays['time']))
+
+        print(f"✓ {S} symbols aligned on {T:,} bar times")
+
+    def run(self):
+        """Run the portfolio backtest"""
+        self.align()
+
+        print("\n" + "="*60)
+        print("RUNNING PORTFOLIO BACKTEST")
+        print("="*60)
+
+        rp = self.risk_params
+        T, S, K = len(self.times), len(self.symbols), self.max_positions_per_symbol
+        min_hold = max(int(rp['min_holding_bars']), 1)
+        max_daily = rp['max_daily_trades']
+        sl_offset = rp['stop_loss_pips'] * PIP
+        exit_mode = rp.get('exit_mode', 'close')
+        ranges = [exit_ranges(arrays['close'], rp, arrays['high'], arrays['low'], arrays['open'])
+                  for arrays in self.data]
+
+        # Position slots (symbol, slot) and the row each one exits on
+        is_open = np.zeros((S, K), dtype=bool)
+        exit_row = np.full((S, K), T, dtype=np.int64)
+        slot_trade = np.zeros((S, K), dtype=np.int64)
+        slot_end = np.zeros((S, K), dtype=bool)    # Closed by the end of its symbol's data
+        trade_day = np.full(S, -1, dtype=np.int64)
+        day_count = np.zeros(S, dtype=np.int64)
+
+        equity = float(rp['account_balance'])
+        metrics = OnlineMetrics(equity)
+        records = []
+        settled = []
+        equity_curve = [equity]
+
+        def settle(due, equity):
+            # Book the trades of the due slots (in symbol order) and free them
+            for k, end in zip(slot_trade[due].tolist(), slot_end[due].tolist()):
+                equity += records[k]['pnl']
+                equity_curve.append(equity)
+                metrics.update(records[k]['pnl'], streak=not end)
+                settled.append(k)
+            is_open[due] = False
+            return equity
+
+        signal_rows = np.flatnonzero((self.signal != 0).any(axis=1))
+        p = 0
+        while True:
+            next_signal = signal_rows[p] if p < len(signal_rows) else T
+            next_exit = exit_row[is_open].min() if is_open.any() else T
+            t = min(next_signal, next_exit)
+            if t >= T:
+                break
+
+            # Settle SL / TP exits due now, in symbol order
+            if next_exit == t:
+                equity = settle(is_open & (exit_row == t) & ~slot_end, equity)
+
+            if next_signal == t:
+                p += 1
+                row = self.signal[t]
+                for s in np.flatnonzero(row != 0).tolist():
+                    if is_open[s].all() or is_open.sum() >= self.max_positions:
+                        continue
+
+                    arrays = self.data[s]
+                    j = int(self.bar[t, s])
+                    day = arrays['day'][j]
+                    if day != trade_day[s]:
+                        trade_day[s] = day
+                        day_count[s] = 0
+                    if day_count[s] >= max_daily:
+                        continue
+                    day_count[s] += 1
+
+                    side = row[s]
+                    entry_price = float(arrays['close'][j])
+                    lot_size = position_size(equity, rp)
+                    cluster_density = float(arrays['density'][j])
+                    stop_loss, take_profit, tp_pips = trade_levels(entry_price, side, cluster_density, sl_offset)
+
+                    highs, lows, opens, both_touch = ranges[s]
+                    exit_bar, exit_code = first_touch(highs, lows, j + min_hold, stop_loss, take_profit, side,
+                                                      both_touch=both_touch, open_=opens)
+                    if exit_code == EXIT_END:
+                        exit_bar = len(arrays['close']) - 1
+                        exit_price = float(arrays['close'][-1])
+                        pnl = (exit_price - entry_price) * side * lot_size * PNL_MULTIPLIER
+                    else:
+                        level = stop_loss if exit_code == EXIT_SL else take_profit
+                        if side == 1:
+                            pnl = (level - entry_price) * lot_size * PNL_MULTIPLIER
+                        else:
+                            pnl = (entry_price - level) * lot_size * PNL_MULTIPLIER
+                        exit_price = float(arrays['close'][exit_bar]) if exit_mode == 'close' and exit_code == EXIT_TP else level
+
+                    k = int(np.argmin(is_open[s]))
+                    is_open[s, k] = True
+                    exit_row[s, k] = arrays['row'][exit_bar]
+                    slot_end[s, k] = exit_code == EXIT_END
+                    slot_trade[s, k] = len(records)
+                    records.append({
+                        'symbol': self.symbols[s],
+                        'entry_idx': j,
+                        'entry_time': pd.Timestamp(arrays['time'][j]),
+                        'direction': "BUY" if side == 1 else "SELL",
+                        'signal': side,
+                        'entry_price': entry_price,
+                        'lot_size': lot_size,
+                        'stop_loss': stop_loss,
+                        'take_profit': take_profit,
+                        'tp_pips': tp_pips,
+                        'cluster_density': cluster_density,
+                        'exit_idx': exit_bar,
+                        'exit_time': pd.Timestamp(arrays['time'][exit_bar]),
+                        'exit_price': exit_price,
+                        'exit_type': EXIT_TYPES[exit_code],
+                        'pnl': pnl,
+                        'bars_open': exit_bar - j,
+                        'days_open': int(arrays['day'][exit_bar] - day),
+                    })
+
+            # Positions closed by the end of their symbol's data hold their
+            # slot through that last bar (no new entry on it), as in run_core
+            equity = settle(is_open & (exit_row == t) & slot_end, equity)
+
+        self.trades = [records[k] for k in settled]
+        self.equity_curve = equity_curve
+        self.equity_times = [pd.Timestamp(self.times[0])] + [trade['exit_time'] for trade in self.trades]
+
+        self.online_metrics = metrics
+        self.metrics = metrics.summary()
+        self.print_results()
+        return self.trades
+
+    def symbol_summary(self):
+        """Per-symbol trades, win rate and net PnL"""
+        trades = pd.DataFrame(self.trades, columns=['symbol', 'pnl'])
+        summary = trades.groupby('symbol', sort=False)['pnl'].agg(
+            trades='count', win_rate=lambda pnl: (pnl > 0).mean() * 100, net_pnl='sum')
+        return summary.reindex(self.symbols, fill_value=0)
+
+    def print_results(self):
+        """Print portfolio and per-symbol results"""
+        metrics = self.metrics
+
+        print("\n" + "="*60)
+        print("PORTFOLIO RESULTS")
+        print("="*60)
+
+        print(f"\n📅 PERIOD:")
+        print(f"  Start:               {pd.Timestamp(self.times[0])}")
+        print(f"  End:                 {pd.Timestamp(self.times[-1])}")
+        print(f"  Symbols:             {', '.join(self.symbols)}")
+        print(f"  Position Limits:     {self.max_positions} total, {self.max_positions_per_symbol} per symbol")
+
+        print(f"\n📊 SUMMARY METRICS:")
+        print(f"  Initial Balance:     ${self.equity_curve[0]:,.2f}")
+        print(f"  Final Balance:       ${self.equity_curve[-1]:,.2f}")
+        print(f"  Net Profit/Loss:     ${metrics['net_profit']:,.2f}")
+        print(f"  ROI:                 {metrics['roi']:.2f}%")
+        print(f"  Total Trades:        {metrics['trades']}")
+        print(f"  Win Rate:            {metrics['win_rate']:.2f}%")
+        print(f"  Profit Factor:       {metrics['profit_factor']:.2f}")
+        print(f"  Max Drawdown:        {metrics['max_drawdown']:.2f}%")
+        print(f"  Sharpe Ratio:        {metrics['sharpe_ratio']:.2f}")
+
+        print(f"\n📈 PER SYMBOL:")
+        for symbol, row in self.symbol_summary().iterrows():
+            print(f"  {symbol:<10} trades {int(row['trades']):>5}  win rate {row['win_rate']:6.2f}%  "
+                  f"net ${row['net_pnl']:>14,.2f}")
+
+    def save_results(self):
+        """Save portfolio trade log and equity curve"""
+        pd.DataFrame(self.trades).to_csv('portfolio_trades.csv', index=False)
+        print("\n✓ Trade log saved: portfolio_trades.csv")
+        pd.DataFrame({'Time': self.equity_times, 'Equity': self.equity_curve}).to_csv('portfolio_equity.csv', index=False)
+        print("✓ Equity curve saved: portfolio_equity.csv")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Multi-symbol portfolio backtest with shared equity")
+    parser.add_argument('--symbol', action='append', metavar='NAME=HA_CSV,ENSEMBLE_CSV',
+                        help="Symbol and its HA data / ensemble forecast files (repeat per symbol)")
+    parser.add_argument('--start', default=None, help="Start date (YYYY-MM-DD)")
+    parser.add_argument('--end', default=None, help="End date (YYYY-MM-DD)")
+    parser.add_argument('--max-positions', type=int, default=None, help="Open positions across all symbols")
+    parser.add_argument('--per-symbol', type=int, default=1, help="Open positions per symbol")
+    args = parser.parse_args()
+
+    specs = args.symbol or ['BTCUSD=BTCUSD_15m_HA_data.csv,ensemble_ha15m_forecast.csv']
+    symbol_files = {}
+    for spec in specs:
+        name, _, files = spec.partition('=')
+        csv_file, _, ensemble_file = files.partition(',')
+        if not csv_file or not ensemble_file:
+            parser.error(f"Expected NAME=HA_CSV,ENSEMBLE_CSV, got: {spec}")
+        symbol_files[name] = (csv_file, ensemble_file)
+
+    risk_params = {
+        'stop_loss_pips': 100,
+        'take_profit_pips': 300,
+        'min_lot_size': 0.5,
+        'max_lot_size': 1.2,
+        'account_balance': 10000,
+        'risk_percent': 2.0,
+        'min_holding_bars': 10,
+        'max_daily_trades': 6
+    }
+
+    portfolio = PortfolioBacktest.from_files(symbol_files, risk_params, start_date=args.start, end_date=args.end,
+                                             max_positions=args.max_positions,
+                                             max_positions_per_symbol=args.per_symbol)
+    portfolio.run()
+    portfolio.save_results()
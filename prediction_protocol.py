@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Ensemble Prediction Wire Protocol
+Length-prefixed binary frames for persistent connections, plus the legacy text mode
+
+Binary mode (many requests per connection, little-endian):
+
+  frame     = MAGIC (4 bytes) + payload length (uint32) + payload
+  request   = request id (uint32) + N_FEATURES float32 features
+  response  = request id (uint32) + status (uint8) + signal (int8)
+              + LSTM / RF / XGB votes (3 x int8) + confidence (float32)
+
+Every read loops until the full header / payload has arrived, so a frame
+split across TCP segments is never misread. A connection whose first four
+bytes are not MAGIC is served in text mode, as the older EAs expect:
+whitespace-separated features, answered with "1" / "-1" / "0", then the
+connection is closed.
+
+LatencyStats keeps the service time of recent requests per mode for the
+p50 / p99 summary the servers print on shutdown. The servers measure both
+modes over the same interval, from the arrival of a request's first byte to
+the write of its response, so the p99 ratio compares like with like.
+
+Usage:
+    from prediction_protocol import PredictionClient
+    with PredictionClient('127.0.0.1', 9091) as client:
+        signal, confidence, votes = client.predict(features)
+
+    python prediction_protocol.py [--host 127.0.0.1] [--port 9091] [--requests 1000]   # text vs binary latency
+"""
+
+import socket
+import struct
+import time
+from collections import deque
+
+import numpy as np
+
+from ha_features import N_FEATURES
+
+MAGIC = b'HAE1'
+HEADER = struct.Struct('<4sI')
+REQUEST = struct.Struct(f'<I{N_FEATURES}f')
+RESPONSE = struct.Struct('<IBbbbbf')
+MAX_PAYLOAD = 1 << 16
+
+STATUS_OK = 0
+STATUS_BAD_REQUEST = 1
+STATUS_ERROR = 2
+
+TEXT_MAX_BYTES = 4096
+LATENCY_WINDOW = 100000
+
+
+def recv_exact(conn, n_bytes, data=b''):
+    """
+    Read until exactly n_bytes are buffered (data: bytes already read)
+
+    Returns b'' if the peer closed before sending anything, raises
+    ConnectionError if it closed part-way through
+    """
+    chunks = [data]
+    received = len(data)
+    while received < n_bytes:
+        chunk = conn.recv(n_bytes - received)
+        if not chunk:
+            if received == 0:
+                return b''
+            raise ConnectionError(f"Connection closed mid-frame ({received}/{n_bytes} bytes)")
+        chunks.append(chunk)
+        received += len(chunk)
+    return b''.join(chunks)
+
+
+def read_frame(conn, data=b''):
+    """
+    Next frame payload from a binary-mode connection (data: header bytes
+    already read); None when the peer has closed the connection
+    """
+    header = recv_exact(conn, HEADER.size, data)
+    if not header:
+        return None
+    magic, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"Bad frame magic {magic!r}")
+    if length > MAX_PAYLOAD:
+        raise ValueError(f"Frame too large ({length} bytes)")
+    payload = recv_exact(conn, length)
+    if len(payload) != length:
+        raise ConnectionError("Connection closed before frame payload")
+    return payload
+
+
+def frame(payload):
+    """payload with its frame header"""
+    return HEADER.pack(MAGIC, len(payload)) + payload
+
+
+def encode_request(request_id, features):
+    return frame(REQUEST.pack(request_id & 0xFFFFFFFF, *features))
+
+
+def request_id_of(payload):
+    """Request id of a (possibly malformed) request payload, 0 if it has none"""
+    return struct.unpack_from('<I', payload)[0] if len(payload) >= 4 else 0
+
+
+def decode_request(payload):
+    """(request id, float32 feature array); ValueError on a malformed payload"""
+    if len(payload) != REQUEST.size:
+        raise ValueError(f"Expected {N_FEATURES} features, got {max(len(payload) - 4, 0) / 4:g}")
+    return request_id_of(payload), np.frombuffer(payload, dtype='<f4', offset=4)
+
+
+def encode_response(request_id, status, signal=0, votes=(0, 0, 0), confidence=0.0):
+    return frame(RESPONSE.pack(request_id, status, signal, *votes, confidence))
+
+
+def decode_response(payload):
+    """(request id, status, signal, votes, confidence)"""
+    request_id, status, signal, lstm, rf, xgb, confidence = RESPONSE.unpack(payload)
+    return request_id, status, signal, (lstm, rf, xgb), confidence
+
+
+class LatencyStats:
+    """Service times of the most recent requests, per protocol mode"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = {}
+        self.window = window
+
+    def record(self, mode, seconds):
+        self.samples.setdefault(mode, deque(maxlen=self.window)).append(seconds)
+
+    def percentiles(self, mode, percentiles=(50, 99)):
+        """Latency percentiles in ms (None if the mode has no samples)"""
+        samples = self.samples.get(mode)
+        if not samples:
+            return None
+        return np.percentile(np.fromiter(samples, dtype=float), percentiles) * 1000
+
+    def summary_lines(self):
+        lines = []
+        for mode, samples in self.samples.items():
+            p50, p99 = self.percentiles(mode)
+            lines.append(f"  {mode:<7} {len(samples):>8,} requests  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+        text, binary = self.percentiles('text'), self.percentiles('binary')
+        if text is not None and binary is not None and binary[1] > 0:
+            ratio = text[1] / binary[1]
+            if ratio >= 1:
+                lines.append(f"  p99 binary vs text: {ratio:.1f}x faster")
+            else:
+                lines.append(f"  p99 binary vs text: {1 / ratio:.1f}x slower")
+        return lines
+
+
+class PredictionClient:
+    """Persistent binary-mode connection to the ensemble server"""
+
+    def __init__(self, host='127.0.0.1', port=9091, timeout=5.0):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.next_id = 0
+
+    def predict(self, features):
+        """(signal, confidence, (lstm, rf, xgb) votes) for one feature vector"""
+        self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+        self.sock.sendall(encode_request(self.next_id, features))
+        payload = read_frame(self.sock)
+        if payload is None:
+            raise ConnectionError("Server closed the connection")
+        request_id, status, signal, votes, confidence = decode_response(payload)
+        if request_id != self.next_id:
+            raise ValueError(f"Response for request {request_id}, expected {self.next_id}")
+        if status != STATUS_OK:
+            raise RuntimeError(f"Server returned status {status}")
+        return signal, confidence, votes
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def predict_text(features, host='127.0.0.1', port=9091, timeout=5.0):
+    """One legacy text-mode request (new connection): the signal as int"""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        # Newline-terminated, so the server does not have to wait for more values
+        sock.sendall((" ".join(f"{value:.6f}" for value in features) + "\n").encode('utf-8'))
+        return int(sock.recv(64).decode('utf-8').strip() or 0)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Text vs persistent binary latency against a running server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9091)
+    parser.add_argument('--requests', type=int, default=1000, help="Requests per mode")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    vectors = rng.normal(size=(args.requests, N_FEATURES)).astype(np.float32)
+    stats = LatencyStats()
+
+    for features in vectors:
+        start = time.perf_counter()
+        predict_text(features, args.host, args.port)
+        stats.record('text', time.perf_counter() - start)
+
+    with PredictionClient(args.host, args.port) as client:
+        for features in vectors:
+            start = time.perf_counter()
+            client.predict(features)
+            stats.record('binary', time.perf_counter() - start)
+
+    print("=" * 60)
+    print(f"ROUND-TRIP LATENCY ({args.host}:{args.port})")
+    print("=" * 60)
+    for line in stats.summary_lines():
+        print(line)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Asyncio Prediction Server
+Shared multi-client TCP server for the socket_ai*.py model services
+
+One event loop accepts any number of concurrent clients (several EAs /
+charts at once) and serves both wire modes of prediction_protocol.py:
+legacy text requests (one per connection) and persistent binary frames.
+Model inference is CPU-bound, so it runs in a thread pool executor; at most
+max_in_flight requests are inside the executor at a time, and the rest wait
+their turn instead of piling up work.
+
+A service supplies the model side as plain functions (run on executor
+threads):
+
+  predict_text(data_str)  -> (signal, confidence, votes or None)
+  predict_vector(array)   -> same, for binary frames (optional)
+
+raising ValueError for bad input and RuntimeError for a failed prediction.
+With predict_batch (list of feature arrays -> list of results) and
+parse_text (data_str -> feature array, run on the loop) concurrent
+requests of both modes are micro-batched instead (micro_batcher.py).
+
+Ctrl+C (or SIGTERM) stops accepting, closes idle connections at once, lets
+running predictions finish (up to SHUTDOWN_GRACE seconds) and prints the
+request summary (bullish / bearish / neutral counts and p50 / p99
+latency per mode).
+
+Usage:
+    from prediction_server import PredictionServer
+    PredictionServer(predict_text, predict_vector, host='127.0.0.1', port=9091).run()
+"""
+
+import os
+import asyncio
+import signal as signals
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ha_features import N_FEATURES
+from micro_batcher import MicroBatcher, BATCH_WINDOW, MAX_BATCH
+from prediction_protocol import (MAGIC, HEADER, MAX_PAYLOAD, TEXT_MAX_BYTES, LatencyStats, request_id_of,
+                                 decode_request, encode_response, STATUS_OK, STATUS_BAD_REQUEST, STATUS_ERROR)
+
+MAX_IN_FLIGHT = 32
+TIMEOUT = 5.0
+TEXT_IDLE_GAP = 0.01  # A text request that has started and then goes quiet this long is complete
+IDLE_TIMEOUT = 300.0  # Persistent binary connections may sit idle between bars
+SHUTDOWN_GRACE = 10.0
+
+SIGNAL_LABELS = {1: "BULLISH", -1: "BEARISH", 0: "NEUTRAL"}
+
+
+def default_log(request_no, label, signal, confidence, votes, mode):
+    print(f"[{request_no}] {label:7s} {signal:+d} (conf: {confidence:.0%}) {mode}")
+
+
+class PredictionServer:
+    """Concurrent text / binary prediction server around blocking model calls"""
+
+    def __init__(self, predict_text, predict_vector=None, host='127.0.0.1', port=9091,
+                 n_features=N_FEATURES, max_in_flight=MAX_IN_FLIGHT, workers=None, timeout=TIMEOUT,
+                 idle_timeout=IDLE_TIMEOUT, log=default_log, ping_replies=None, predict_batch=None,
+                 parse_text=None, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH, summary=None,
+                 text_idle_gap=TEXT_IDLE_GAP):
+        """
+        Parameters:
+        -----------
+        predict_text : callable
+            data_str -> (signal, confidence, votes); runs on an executor thread
+        predict_vector : callable (optional)
+            float32 feature array -> same; None disables binary mode
+        host, port : str, int
+            Listen address
+        n_features : int
+            Values a complete text request holds
+        max_in_flight : int
+            Predictions allowed in the executor at once
+        workers : int (optional)
+            Executor threads (default: min(4, cores))
+        timeout : float
+            Seconds to wait for the first bytes of a connection / frame payload
+        idle_timeout : float
+            Seconds a binary connection may wait between frames
+        log : callable
+            (request_no, label, signal, confidence, votes, mode) after each prediction
+        ping_replies : dict (optional)
+            Text handshakes answered without a prediction, e.g. {'PING': b'0'}
+        predict_batch : callable (optional)
+            list of feature arrays -> list of (signal, confidence, votes);
+            replaces predict_text / predict_vector when max_batch > 1
+        parse_text : callable (optional)
+            data_str -> feature array (ValueError on bad input), for batching
+        batch_window : float
+            Seconds a request may wait for others to join its batch
+        max_batch : int
+            Largest batch (1: no batching)
+        summary : callable (optional)
+            () -> extra lines for the shutdown summary
+        text_idle_gap : float
+            Seconds of silence that end a started text request without a
+            newline / trailing delimiter
+        """
+        self.predict_text = predict_text
+        self.predict_vector = predict_vector
+        self.host = host
+        self.port = port
+        self.n_features = n_features
+        self.max_in_flight = max_in_flight
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.log = log
+        self.ping_replies = ping_replies or {}
+        self.predict_batch = predict_batch if max_batch > 1 else None
+        self.parse_text = parse_text
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.summary = summary
+        self.text_idle_gap = text_idle_gap
+
+        self.counts = {'requests': 0, 'bullish': 0, 'bearish': 0, 'neutral': 0}
+        self.latency = LatencyStats()
+        self.executor = None
+        self.batcher = None
+        self.in_flight = None
+        self.connections = {}  # writer -> handler task
+        self.busy = set()      # writers with a prediction in flight
+        self.stopping = False
+        self.listening = False
+
+    # === Requests ===
+
+    async def predict(self, value, mode):
+        """Run one blocking prediction in the executor (bounded by max_in_flight)"""
+        async with self.in_flight:
+            if self.batcher is not None:
+                if mode == 'text':
+                    value = self.parse_text(value)
+                return await self.batcher.submit(value)
+            func = self.predict_text if mode == 'text' else self.predict_vector
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, value)
+
+    def next_request(self):
+        self.counts['requests'] += 1
+        return self.counts['requests']
+
+    def count(self, signal):
+        """Request number and label of a prediction, counted in the summary"""
+        label = SIGNAL_LABELS.get(signal, "NEUTRAL")
+        self.counts[label.lower()] += 1
+        return self.next_request(), label
+
+    async def read_prefix(self, reader):
+        """
+        Up to len(MAGIC) opening bytes (fewer if the client stops sending or
+        goes quiet) and the perf_counter time the first of them arrived
+        """
+        data = b''
+        start = None
+        try:
+            while len(data) < len(MAGIC):
+                wait = self.text_idle_gap if data else self.timeout
+                chunk = await asyncio.wait_for(reader.read(len(MAGIC) - len(data)), wait)
+                if not chunk:
+                    break
+                if start is None:
+                    start = time.perf_counter()
+                data += chunk
+        except asyncio.TimeoutError:
+            pass
+        return data, start or time.perf_counter()
+
+    def text_complete(self, data):
+        """
+        True once data is a whole text request: a newline, a handshake, or
+        n_features values with a delimiter after the last one (a value still
+        arriving in the next TCP segment is not counted)
+        """
+        if b'\n' in data or data.strip().decode('utf-8', 'replace') in self.ping_replies:
+            return True
+        values = len(data.split())
+        if not data[-1:].isspace():
+            values -= 1
+        return values >= self.n_features
+
+    async def read_text(self, reader, data):
+        """
+        Legacy request: read until it is complete (text_complete), the client
+        closes or goes quiet for text_idle_gap, or TEXT_MAX_BYTES; a request
+        with the wrong number of values is therefore answered at once
+        """
+        while len(data) < TEXT_MAX_BYTES and not self.text_complete(data):
+            wait = self.text_idle_gap if data.strip() else self.timeout
+            try:
+                chunk = await asyncio.wait_for(reader.read(TEXT_MAX_BYTES - len(data)), wait)
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return data.decode('utf-8', errors='replace')
+
+    async def serve_text(self, reader, writer, data, start):
+        """
+        One-shot text request: reply "1" / "-1" / "0" (the connection is
+        closed by the caller); start is the arrival time of its first byte
+        """
+        data = await self.read_text(reader, data)
+
+        if data.strip() in self.ping_replies:
+            writer.write(self.ping_replies[data.strip()])
+            await writer.drain()
+            return
+
+        if not data.strip():
+            print(f"[{self.next_request()}] Empty data received")
+            writer.write(b"0")
+            await writer.drain()
+            return
+
+        self.busy.add(writer)
+        try:
+            signal, confidence, votes = await self.predict(data, 'text')
+            request_no, label = self.count(signal)
+            writer.write(str(signal).encode('utf-8'))
+            await writer.drain()
+            self.latency.record('text', time.perf_counter() - start)
+            self.log(request_no, label, signal, confidence, votes, 'text')
+
+        except ValueError as ve:
+            print(f"[{self.next_request()}] ✗ Preprocessing error: {ve}")
+            writer.write(b"0")
+            await writer.drain()
+        except RuntimeError as re:
+            print(f"[{self.next_request()}] ✗ Prediction error: {re}")
+            writer.write(b"0")
+            await writer.drain()
+        finally:
+            self.busy.discard(writer)
+
+    async def serve_binary(self, reader, writer, data, start):
+        """
+        Persistent connection: one response frame per request frame until the
+        client closes (or the server stops); start is the arrival time of the
+        first frame's first byte
+        """
+        while True:
+            try:
+                header = data + await asyncio.wait_for(reader.readexactly(HEADER.size - len(data)),
+                                                       self.idle_timeout)
+            except asyncio.IncompleteReadError as e:
+                if e.partial:
+                    raise ConnectionError("Connection closed mid-frame")
+                return
+            if not data:
+                start = time.perf_counter()  # Header of a later frame just arrived
+            data = b''
+
+            magic, length = HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError(f"Bad frame magic {magic!r}")
+            if length > MAX_PAYLOAD:
+                raise ValueError(f"Frame too large ({length} bytes)")
+            payload = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+
+            request_id = request_id_of(payload)
+            self.busy.add(writer)
+            try:
+                request_id, features = decode_request(payload)
+                signal, confidence, votes = await self.predict(features, 'binary')
+                request_no, label = self.count(signal)
+                writer.write(encode_response(request_id, STATUS_OK, signal, votes or (0, 0, 0), confidence))
+                await writer.drain()
+                self.latency.record('binary', time.perf_counter() - start)
+                self.log(request_no, label, signal, confidence, votes, 'binary')
+
+            except ValueError as ve:
+                print(f"[{self.next_request()}] ✗ Preprocessing error: {ve}")
+                writer.write(encode_response(request_id, STATUS_BAD_REQUEST))
+                await writer.drain()
+            except RuntimeError as re:
+                print(f"[{self.next_request()}] ✗ Prediction error: {re}")
+                writer.write(encode_response(request_id, STATUS_ERROR))
+                await writer.drain()
+            finally:
+                self.busy.discard(writer)
+
+            if self.stopping:
+                return  # Shutting down: the answered request was the last one
+
+    async def handle_connection(self, reader, writer):
+        """Serve one client (binary frames if it opens with the frame magic, else text)"""
+        self.connections[writer] = asyncio.current_task()
+        peer = writer.get_extra_info('peername') or ('?', 0)
+        try:
+            # Both modes time a request from its first byte to the response write
+            data, start = await self.read_prefix(reader)
+            if data == MAGIC and (self.predict_vector is not None or self.predict_batch is not None):
+                await self.serve_binary(reader, writer, data, start)
+            else:
+                await self.serve_text(reader, writer, data, start)
+
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            print(f"Connection {peer[0]}:{peer[1]} closed: {e or type(e).__name__}")
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"Connection error: {e}")
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    # === Lifecycle ===
+
+    async def serve(self, ready=None):
+        """Accept clients until cancelled (Ctrl+C / SIGTERM); ready() is called once listening"""
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        if self.predict_batch is not None:
+            self.batcher = MicroBatcher(self.predict_batch, self.batch_window, self.max_batch, self.executor,
+                                        max_concurrent=self.workers)
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        self.listening = True
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        try:
+            loop.add_signal_handler(signals.SIGTERM, task.cancel)
+        except (NotImplementedError, AttributeError, RuntimeError):
+            pass  # Windows: Ctrl+C only
+
+        if ready:
+            ready()
+        try:
+            async with server:
+                await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            # Stop accepting and close idle connections (e.g. binary clients
+            # waiting for the next bar); connections with a prediction in
+            # flight get SHUTDOWN_GRACE seconds to send their response
+            server.close()
+            self.stopping = True
+            for writer, handler in list(self.connections.items()):
+                if writer not in self.busy:
+                    handler.cancel()
+            if self.connections:
+                await asyncio.wait(list(self.connections.values()), timeout=SHUTDOWN_GRACE)
+
+    def run(self, ready=None):
+        """Run until Ctrl+C, then print the summary (OSError if the port cannot be bound)"""
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='predict')
+        try:
+            asyncio.run(self.serve(ready))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            if self.listening:
+                self.print_summary()
+
+    def print_summary(self):
+        print("\n" + "=" * 70)
+        print("Server stopped")
+        print(f"Total requests: {self.counts['requests']}")
+        print(f"  Bullish:  {self.counts['bullish']}")
+        print(f"  Bearish:  {self.counts['bearish']}")
+        print(f"  Neutral:  {self.counts['neutral']}")
+        for line in self.latency.summary_lines():
+            print(line)
+        if self.batcher is not None:
+            print(self.batcher.summary_line())
+        if self.summary is not None:
+            for line in self.summary():
+                print(line)
+        print("=" * 70)
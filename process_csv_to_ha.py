@@ -4,23 +4,60 @@ BTCUSD M15 CSV to Heiken Ashi Processor
 Converts raw OHLC data to Heiken Ashi format compatible with the ensemble system
 
 Usage:
-    python process_csv_to_ha.py [input_file] [output_file]
+    python process_csv_to_ha.py [input_file] [output_file] [--chunksize N]
     
 Default:
     python process_csv_to_ha.py BTCUSD_M15.csv BTCUSD_15m_HA_data.csv
 
+Streaming (multi-GB exports, constant memory):
+    python process_csv_to_ha.py BTCUSD_M15.csv BTCUSD_15m_HA_data.csv --chunksize 500000
+
+Batch (directory or glob, one worker per core, skips up-to-date outputs):
+    python process_csv_to_ha.py --batch exports/ --output-dir data/
+    python process_csv_to_ha.py --batch "exports/*_M15.csv" --workers 4 --force
+    
+    SYMBOL_M15.csv -> SYMBOL_15m_HA_data.csv, SYMBOL_H1.csv -> SYMBOL_1h_HA_data.csv
+    Row counts, time ranges and timings go to <output-dir>/ha_manifest.json
+
 Input CSV Format:
     DATE, TIME, OPEN, HIGH, LOW, CLOSE, TICKVOL, VOL, SPREAD
 
+    Indicator exports (tab-delimited, newest bar first) are accepted too:
+    Time, Open, High, Low, Close, Volume[, ...] -- Time is a full datetime,
+    Volume is used as VOL and the rows are sorted oldest-first
+
+        python process_csv_to_ha.py XAGUSD_H1_data.csv XAGUSD_1h_HA_data.csv
+
 Output CSV Format:
     Time, HA_Open, HA_High, HA_Low, HA_Close, Volume
 """
 
 import pandas as pd
 import numpy as np
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import re
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
+from ha_features import heiken_ashi
+
+REQUIRED_COLS = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOL']
+MT5_DATETIME_FORMAT = '%Y.%m.%d %H:%M:%S'   # DATE + TIME as exported by MT5
+OUTPUT_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+FALLBACK_START = pd.Timestamp('2024-01-01')
+FALLBACK_FREQ = pd.Timedelta(minutes=15)
+DEFAULT_CHUNKSIZE = 500000
+OUTPUT_SUFFIX = '_HA_data.csv'
+MANIFEST_NAME = 'ha_manifest.json'
+TIMEFRAME_UNITS = {'M': 'm', 'H': 'h', 'D': 'd', 'W': 'w', 'MN': 'mn'}
+
 def calculate_heiken_ashi(df):
     """
     Calculate Heiken Ashi values from OHLC data
@@ -32,32 +69,64 @@ def calculate_heiken_ashi(df):
     - HA_Low = Min(Low, HA_Open, HA_Close)
     """
     
-    df = df.copy()
-    df_len = len(df)
-    
-    # Initialize arrays
-    ha_open = np.zeros(df_len)
-    ha_close = np.zeros(df_len)
-    ha_high = np.zeros(df_len)
-    ha_low = np.zeros(df_len)
-    
-    # Calculate HA_Close for all bars
-    ha_close = (df['OPEN'].values + df['HIGH'].values + df['LOW'].values + df['CLOSE'].values) / 4
-    
-    # Calculate HA_Open
-    # First bar: average of open and close
-    ha_open[0] = (df['OPEN'].iloc[0] + df['CLOSE'].iloc[0]) / 2
-    
-    # Subsequent bars: average of previous HA_Open and HA_Close
-    for i in range(1, df_len):
-        ha_open[i] = (ha_open[i-1] + ha_close[i-1]) / 2
-    
-    # Calculate HA_High and HA_Low
-    for i in range(df_len):
-        ha_high[i] = max(df['HIGH'].iloc[i], ha_open[i], ha_close[i])
-        ha_low[i] = min(df['LOW'].iloc[i], ha_open[i], ha_close[i])
-    
-    return ha_open, ha_high, ha_low, ha_close
+    # Vectorized kernel shared with the feature pipeline (single filter pass, no per-row loop)
+    return heiken_ashi(df['OPEN'].values, df['HIGH'].values, df['LOW'].values, df['CLOSE'].values)
+
+def detect_delimiter(input_file):
+    """Tab for MT5 exports, comma otherwise (decided from the header line)"""
+    with open(input_file, 'r', encoding='utf-8', errors='replace') as f:
+        header = f.readline()
+    return '\t' if '\t' in header else ','
+
+def normalize_columns(df):
+    """
+    Clean column names in place (angle brackets, whitespace, uppercase)
+    Returns the list of missing required columns
+    """
+    df.columns = df.columns.str.replace('<', '').str.replace('>', '').str.strip().str.upper()
+    if 'VOL' not in df.columns and 'VOLUME' in df.columns:
+        df.rename(columns={'VOLUME': 'VOL'}, inplace=True)
+    return [col for col in REQUIRED_COLS if col not in df.columns]
+
+def parse_datetime(df, offset=0):
+    """
+    Bar timestamps from DATE + TIME (or DATETIME, or a full datetime in TIME)
+
+    Returns None when the file has no date columns; callers then fall back to
+    a 15-minute index starting offset bars after FALLBACK_START.
+    """
+    if 'DATE' in df.columns and 'TIME' in df.columns:
+        text = df['DATE'].astype(str) + ' ' + df['TIME'].astype(str)
+        try:
+            return pd.to_datetime(text, format=MT5_DATETIME_FORMAT)
+        except (ValueError, TypeError):
+            return pd.to_datetime(text)
+    if 'DATETIME' in df.columns:
+        return pd.to_datetime(df['DATETIME'])
+    if 'TIME' in df.columns:
+        return pd.to_datetime(df['TIME'].astype(str))
+    return None
+
+def is_oldest_first(date_time):
+    return pd.Index(date_time).is_monotonic_increasing
+
+def fallback_datetime(n_rows, offset=0):
+    return pd.date_range(start=FALLBACK_START + offset * FALLBACK_FREQ, periods=n_rows, freq=FALLBACK_FREQ)
+
+def build_output(date_time, ha, volume):
+    ha_open, ha_high, ha_low, ha_close = ha
+    return pd.DataFrame({
+        'Time': np.asarray(date_time),
+        'HA_Open': ha_open,
+        'HA_High': ha_high,
+        'HA_Low': ha_low,
+        'HA_Close': ha_close,
+        'Volume': np.asarray(volume)
+    })
+
+def write_output(output_df, output_file, append=False):
+    output_df.to_csv(output_file, index=False, mode='a' if append else 'w',
+                     header=not append, date_format=OUTPUT_DATE_FORMAT)
 
 def process_btcusd_csv(input_file, output_file):
     """
@@ -67,89 +136,70 @@ def process_btcusd_csv(input_file, output_file):
     print(f"\n{'='*70}")
     print("BTCUSD M15 to Heiken Ashi Converter")
     print(f"{'='*70}\n")
+    start_time = time.perf_counter()
     
-    # Load CSV (try different delimiters)
+    # Load CSV (delimiter taken from the header line)
     print(f"[1/5] Loading CSV: {input_file}")
     try:
-        # Try tab-delimited first
-        df = pd.read_csv(input_file, sep='\t', skipinitialspace=True)
-        print(f"  ✓ Loaded {len(df)} rows (tab-delimited)")
-    except:
-        try:
-            # Fall back to comma-delimited
-            df = pd.read_csv(input_file, sep=',', skipinitialspace=True)
-            print(f"  ✓ Loaded {len(df)} rows (comma-delimited)")
-        except FileNotFoundError:
-            print(f"  ✗ File not found: {input_file}")
-            sys.exit(1)
-        except Exception as e:
-            print(f"  ✗ Error loading CSV: {e}")
-            sys.exit(1)
+        sep = detect_delimiter(input_file)
+        df = pd.read_csv(input_file, sep=sep, skipinitialspace=True)
+        print(f"  ✓ Loaded {len(df)} rows ({'tab' if sep == chr(9) else 'comma'}-delimited)")
+    except FileNotFoundError:
+        print(f"  ✗ File not found: {input_file}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"  ✗ Error loading CSV: {e}")
+        sys.exit(1)
     
     # Verify columns
     print(f"\n[2/5] Verifying columns")
-    required_cols = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOL']
-    
-    # Clean column names: remove angle brackets and whitespace
-    df.columns = df.columns.str.replace('<', '').str.replace('>', '').str.strip()
-    df_cols = df.columns.str.upper()
+    missing = normalize_columns(df)
+    for col in missing:
+        print(f"  ✗ Missing column: {col}")
     
-    has_required = True
-    for col in required_cols:
-        if col not in df_cols:
-            print(f"  ✗ Missing column: {col}")
-            has_required = False
-    
-    if not has_required:
+    if missing:
         print(f"\n  Available columns: {df.columns.tolist()}")
         sys.exit(1)
     
-    # Normalize column names (uppercase)
-    df.columns = df.columns.str.upper()
     print(f"  ✓ Columns verified: {df.columns.tolist()}")
     
     # Create datetime column
     print(f"\n[3/5] Creating datetime column")
     try:
-        if 'DATE' in df.columns and 'TIME' in df.columns:
-            # Combine DATE and TIME
-            df['DateTime'] = pd.to_datetime(df['DATE'].astype(str) + ' ' + df['TIME'].astype(str))
-        elif 'DATETIME' in df.columns:
-            df['DateTime'] = pd.to_datetime(df['DATETIME'])
-        else:
-            # Fallback: use index
+        date_time = parse_datetime(df)
+        if date_time is None:
             print("  ⚠ No DATE/TIME columns found, using index")
-            df['DateTime'] = pd.date_range(start='2024-01-01', periods=len(df), freq='15min')
+            date_time = fallback_datetime(len(df))
+        df['DateTime'] = date_time
+        if not is_oldest_first(df['DateTime']):
+            # Indicator exports list the newest bar first; HA runs oldest to newest
+            df = df.sort_values('DateTime', kind='stable').reset_index(drop=True)
+            print("  ✓ Sorted oldest-first")
         
         print(f"  ✓ DateTime range: {df['DateTime'].min()} to {df['DateTime'].max()}")
     except Exception as e:
         print(f"  ⚠ Error creating datetime: {e}")
-        df['DateTime'] = pd.date_range(start='2024-01-01', periods=len(df), freq='15min')
+        df['DateTime'] = fallback_datetime(len(df))
     
     # Calculate Heiken Ashi
     print(f"\n[4/5] Calculating Heiken Ashi values")
-    ha_open, ha_high, ha_low, ha_close = calculate_heiken_ashi(df)
+    ha = calculate_heiken_ashi(df)
     print(f"  ✓ HA calculation complete")
     
     # Create output dataframe
-    output_df = pd.DataFrame({
-        'Time': df['DateTime'].values,
-        'HA_Open': ha_open,
-        'HA_High': ha_high,
-        'HA_Low': ha_low,
-        'HA_Close': ha_close,
-        'Volume': df['VOL'].values
-    })
+    output_df = build_output(df['DateTime'].values, ha, df['VOL'].values)
     
     # Save CSV
     print(f"\n[5/5] Saving output: {output_file}")
     try:
-        output_df.to_csv(output_file, index=False)
+        write_output(output_df, output_file)
         print(f"  ✓ Saved {len(output_df)} rows")
     except Exception as e:
         print(f"  ✗ Error saving CSV: {e}")
         sys.exit(1)
     
+    elapsed = time.perf_counter() - start_time
+    
     # Display summary
     print(f"\n{'='*70}")
     print("SUMMARY")
@@ -157,6 +207,7 @@ def process_btcusd_csv(input_file, output_file):
     print(f"Input file:     {input_file}")
     print(f"Output file:    {output_file}")
     print(f"Rows processed: {len(output_df)}")
+    print(f"Throughput:     {len(output_df) / elapsed:,.0f} rows/s ({elapsed:.2f}s)")
     print(f"\nOutput columns:")
     print(f"  {output_df.columns.tolist()}")
     print(f"\nFirst 5 rows:")
@@ -177,17 +228,306 @@ def process_btcusd_csv(input_file, output_file):
     
     return output_df
 
-if __name__ == "__main__":
-    # Get input/output filenames from arguments or use defaults
-    if len(sys.argv) >= 2:
-        input_file = sys.argv[1]
+def process_btcusd_csv_chunked(input_file, output_file, chunksize=500000):
+    """
+    Streaming version of process_btcusd_csv for exports that do not fit in memory
+    
+    Reads `chunksize` rows at a time, carries the HA_Open recursion across
+    chunk boundaries and appends each converted chunk to the output, so memory
+    stays constant. The output file is identical to process_btcusd_csv: if a
+    chunk is out of time order (within itself or against the previous chunk)
+    the file is converted in memory instead.
+    
+    Returns a summary dict (rows, seconds, rows_per_sec, first_time, last_time)
+    """
+    
+    print(f"\n{'='*70}")
+    print(f"BTCUSD M15 to Heiken Ashi Converter (streaming, {chunksize:,} rows/chunk)")
+    print(f"{'='*70}\n")
+    print(f"Input:  {input_file}")
+    print(f"Output: {output_file}\n")
+    
+    try:
+        sep = detect_delimiter(input_file)
+        reader = pd.read_csv(input_file, sep=sep, skipinitialspace=True, chunksize=chunksize)
+    except FileNotFoundError:
+        print(f"  ✗ File not found: {input_file}")
+        sys.exit(1)
+    
+    start_time = time.perf_counter()
+    prev = None              # (HA_Open, HA_Close) of the last bar written
+    rows = 0
+    first_time = last_time = None
+    head_df = tail_df = None
+    ha_min = {}
+    ha_max = {}
+    vol_min = vol_max = None
+    vol_sum = 0.0
+    ha_cols = ['HA_Open', 'HA_High', 'HA_Low', 'HA_Close']
+    
+    for k, chunk in enumerate(reader):
+        missing = normalize_columns(chunk)
+        if missing:
+            for col in missing:
+                print(f"  ✗ Missing column: {col}")
+            print(f"\n  Available columns: {chunk.columns.tolist()}")
+            sys.exit(1)
+        
+        date_time = parse_datetime(chunk)
+        if date_time is None:
+            if k == 0:
+                print("  ⚠ No DATE/TIME columns found, using index")
+            date_time = fallback_datetime(len(chunk), offset=rows)
+        elif not is_oldest_first(date_time) or (last_time is not None and date_time.iloc[0] < last_time):
+            # Out-of-order rows (newest-first export, or unsorted within / across
+            # chunks) cannot be streamed; the whole file is sorted in memory and
+            # overwrites what was written so far
+            reader.close()
+            print(f"  ⚠ Rows are not oldest-first (chunk {k + 1}), converting in memory")
+            with contextlib.redirect_stdout(io.StringIO()):
+                output_df = process_btcusd_csv(input_file, output_file)
+            elapsed = time.perf_counter() - start_time
+            print(f"  ✓ {len(output_df):,} rows written ({len(output_df) / elapsed:,.0f} rows/s)")
+            return {
+                'rows': len(output_df),
+                'seconds': elapsed,
+                'rows_per_sec': len(output_df) / elapsed,
+                'first_time': str(output_df['Time'].iloc[0]),
+                'last_time': str(output_df['Time'].iloc[-1]),
+            }
+        
+        ha = heiken_ashi(chunk['OPEN'].values, chunk['HIGH'].values,
+                         chunk['LOW'].values, chunk['CLOSE'].values, prev=prev)
+        prev = (ha[0][-1], ha[3][-1])
+        
+        output_df = build_output(date_time, ha, chunk['VOL'].values)
+        write_output(output_df, output_file, append=k > 0)
+        
+        # Running summary statistics (nothing but the current chunk is kept)
+        rows += len(output_df)
+        if first_time is None:
+            first_time = output_df['Time'].iloc[0]
+            head_df = output_df.head()
+        last_time = output_df['Time'].iloc[-1]
+        tail_df = pd.concat([tail_df, output_df.tail()]).tail() if tail_df is not None else output_df.tail()
+        for col in ha_cols:
+            ha_min[col] = min(ha_min.get(col, np.inf), output_df[col].min())
+            ha_max[col] = max(ha_max.get(col, -np.inf), output_df[col].max())
+        vol_min = output_df['Volume'].min() if vol_min is None else min(vol_min, output_df['Volume'].min())
+        vol_max = output_df['Volume'].max() if vol_max is None else max(vol_max, output_df['Volume'].max())
+        vol_sum += float(output_df['Volume'].sum())
+        
+        elapsed = time.perf_counter() - start_time
+        print(f"  ✓ Chunk {k + 1}: {rows:,} rows written ({rows / elapsed:,.0f} rows/s)")
+    
+    if rows == 0:
+        print(f"  ✗ No rows in {input_file}")
+        sys.exit(1)
+    
+    elapsed = time.perf_counter() - start_time
+    
+    # Display summary
+    print(f"\n{'='*70}")
+    print("SUMMARY")
+    print(f"{'='*70}")
+    print(f"Input file:     {input_file}")
+    print(f"Output file:    {output_file}")
+    print(f"Rows processed: {rows}")
+    print(f"Throughput:     {rows / elapsed:,.0f} rows/s ({elapsed:.2f}s)")
+    print(f"DateTime range: {first_time} to {last_time}")
+    print(f"\nFirst 5 rows:")
+    print(head_df)
+    print(f"\nLast 5 rows:")
+    print(tail_df.reset_index(drop=True))
+    print(f"\nHeiken Ashi Statistics:")
+    for col in ha_cols:
+        print(f"  {col:<8} - Min: {ha_min[col]:.2f}, Max: {ha_max[col]:.2f}")
+    print(f"\nVolume Statistics:")
+    print(f"  Min: {vol_min:.0f}")
+    print(f"  Max: {vol_max:.0f}")
+    print(f"  Mean: {vol_sum / rows:.0f}")
+    print(f"\n✅ File processing complete!")
+    print(f"{'='*70}\n")
+    
+    return {
+        'rows': rows,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed,
+        'first_time': str(first_time),
+        'last_time': str(last_time),
+    }
+
+def output_name(input_file):
+    """MT5 export name -> HA data name (BTCUSD_M15.csv -> BTCUSD_15m_HA_data.csv)"""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    match = re.match(r'^(.+)_(MN|[MHDW])(\d+)$', stem, re.IGNORECASE)
+    if match:
+        symbol, unit, count = match.groups()
+        return f"{symbol}_{count}{TIMEFRAME_UNITS[unit.upper()]}{OUTPUT_SUFFIX}"
+    return stem + OUTPUT_SUFFIX
+
+def find_inputs(pattern):
+    """CSV exports in a directory (HA outputs excluded) or matching a glob"""
+    if os.path.isdir(pattern):
+        files = glob.glob(os.path.join(pattern, '*.csv'))
+        files = [f for f in files if not f.endswith(OUTPUT_SUFFIX)]
     else:
-        input_file = "BTCUSD_M15.csv"
+        files = glob.glob(pattern)
+    return sorted(os.path.abspath(f) for f in files)
+
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+def is_up_to_date(input_file, output_file, entry):
+    """Output exists and was built from the input as it is now"""
+    if not os.path.exists(output_file):
+        return False
+    st = os.stat(input_file)
+    if entry and entry.get('status') == 'ok' and entry.get('output') == output_file:
+        return entry.get('input_size') == st.st_size and entry.get('input_mtime_ns') == st.st_mtime_ns
+    return os.stat(output_file).st_mtime_ns >= st.st_mtime_ns
+
+def convert_file(input_file, output_file, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Batch worker: streaming conversion of one file with the console output captured
+    
+    Returns a manifest entry (status 'ok' or 'failed')
+    """
+    st = os.stat(input_file)
+    entry = {
+        'output': output_file,
+        'input_size': st.st_size,
+        'input_mtime_ns': st.st_mtime_ns,
+    }
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            summary = process_btcusd_csv_chunked(input_file, output_file, chunksize=chunksize)
+        entry.update(summary)
+        entry['status'] = 'ok'
+    except (Exception, SystemExit) as e:
+        errors = [line.replace('✗', '').strip() for line in log.getvalue().splitlines() if '✗' in line]
+        entry['status'] = 'failed'
+        entry['error'] = errors[-1] if errors else repr(e)
+    return entry
+
+def process_batch(pattern, output_dir=None, workers=None, chunksize=DEFAULT_CHUNKSIZE, force=False):
+    """
+    Convert every export matching a directory / glob in a process pool
+    
+    Parameters:
+    -----------
+    pattern : str
+        Directory of MT5 exports or a glob pattern
+    output_dir : str (optional)
+        Where HA files and the manifest go (default: next to each input)
+    workers : int (optional)
+        Worker processes (default: one per core)
+    chunksize : int
+        Rows per chunk for the streaming converter
+    force : bool
+        Rebuild outputs even if they are up to date
+    
+    Returns the manifest dict
+    """
+    inputs = find_inputs(pattern)
+    workers = workers or os.cpu_count() or 1
+    
+    print(f"\n{'='*70}")
+    print("Heiken Ashi Batch Converter")
+    print(f"{'='*70}\n")
+    print(f"Inputs:  {len(inputs)} file(s) from {pattern}")
+    print(f"Workers: {workers}")
+    
+    if not inputs:
+        print(f"  ✗ No CSV files found: {pattern}")
+        sys.exit(1)
     
-    if len(sys.argv) >= 3:
-        output_file = sys.argv[2]
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        manifest_file = os.path.join(output_dir, MANIFEST_NAME)
     else:
-        output_file = "BTCUSD_15m_HA_data.csv"
+        manifest_file = os.path.join(os.path.dirname(inputs[0]), MANIFEST_NAME)
+    manifest = load_manifest(manifest_file)
+    
+    jobs = []
+    skipped = 0
+    for input_file in inputs:
+        output_file = os.path.abspath(os.path.join(output_dir or os.path.dirname(input_file), output_name(input_file)))
+        if not force and is_up_to_date(input_file, output_file, manifest['files'].get(input_file)):
+            skipped += 1
+            continue
+        jobs.append((input_file, output_file))
+    
+    print(f"Skipped: {skipped} up to date, {len(jobs)} to convert\n")
+    
+    start_time = time.perf_counter()
+    failed = 0
+    if jobs:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = {pool.submit(convert_file, inp, out, chunksize): inp for inp, out in jobs}
+            for future in as_completed(futures):
+                input_file = futures[future]
+                entry = future.result()
+                manifest['files'][input_file] = entry
+                if entry['status'] == 'ok':
+                    print(f"  ✓ {os.path.basename(input_file)} -> {os.path.basename(entry['output'])}: "
+                          f"{entry['rows']:,} rows, {entry['first_time']} to {entry['last_time']} "
+                          f"({entry['rows_per_sec']:,.0f} rows/s)")
+                else:
+                    failed += 1
+                    print(f"  ✗ {os.path.basename(input_file)}: {entry['error']}")
+    
+    elapsed = time.perf_counter() - start_time
+    converted = [manifest['files'][inp] for inp, _ in jobs if manifest['files'][inp]['status'] == 'ok']
+    rows = sum(entry['rows'] for entry in converted)
+    
+    manifest['generated'] = datetime.now().isoformat(timespec='seconds')
+    manifest['last_run'] = {
+        'pattern': pattern,
+        'workers': workers,
+        'converted': len(converted),
+        'failed': failed,
+        'skipped': skipped,
+        'rows': rows,
+        'seconds': elapsed,
+    }
+    with open(manifest_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    print(f"\n{'='*70}")
+    print("BATCH SUMMARY")
+    print(f"{'='*70}")
+    print(f"Converted: {len(converted)}  Failed: {failed}  Skipped: {skipped}")
+    if elapsed > 0 and rows:
+        print(f"Rows:      {rows:,} in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s)")
+    print(f"Manifest:  {manifest_file}")
+    print(f"{'='*70}\n")
+    
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert MT5 OHLC exports to Heiken Ashi CSV")
+    parser.add_argument('input_file', nargs='?', default="BTCUSD_M15.csv")
+    parser.add_argument('output_file', nargs='?', default="BTCUSD_15m_HA_data.csv")
+    parser.add_argument('--chunksize', type=int, default=0,
+                        help="Stream the input N rows at a time (constant memory); 0 loads it at once")
+    parser.add_argument('--batch', metavar='DIR_OR_GLOB',
+                        help="Convert every export in a directory / matching a glob")
+    parser.add_argument('--output-dir', help="Batch output directory (default: next to each input)")
+    parser.add_argument('--workers', type=int, default=None, help="Batch worker processes (default: one per core)")
+    parser.add_argument('--force', action='store_true', help="Batch: rebuild outputs that are up to date")
+    args = parser.parse_args()
     
     # Process
-    result_df = process_btcusd_csv(input_file, output_file)
+    if args.batch:
+        process_batch(args.batch, output_dir=args.output_dir, workers=args.workers,
+                      chunksize=args.chunksize or DEFAULT_CHUNKSIZE, force=args.force)
+    elif args.chunksize > 0:
+        process_btcusd_csv_chunked(args.input_file, args.output_file, chunksize=args.chunksize)
+    else:
+        result_df = process_btcusd_csv(args.input_file, args.output_file)
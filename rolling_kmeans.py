@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Rolling 1-D K-Means Cluster Density Engine
+Incremental replacement for refitting sklearn KMeans on every 252-bar window
+
+The notebooks, test_backtest_conditions.py and the backtester all compute
+Cluster_Density the same way: fit 3 clusters on the previous 252 HA_Close
+values and report the share of the window that falls in the cluster of the
+most recent bar. In 1-D every K-Means cluster is a contiguous run of the
+sorted window, so the engine keeps the window sorted, slides it one bar at a
+time and re-solves the clustering from prefix sums:
+
+  exact - globally optimal 3-cluster partition (minimum inertia) of the
+          sorted window, searched in O(n log n) using the monotonicity of the
+          best second split. Deterministic: the result depends only on the
+          window, never on earlier bars.
+  lloyd - Lloyd iterations warm-started from the previous window's centroids
+          (usually 1-2 passes of O(k log n)). Fastest, but like sklearn it can
+          settle in a local optimum.
+
+Usage:
+    from rolling_kmeans import rolling_cluster_density
+    clusters, density = rolling_cluster_density(df['HA_Close'].values, window=252)
+
+    python rolling_kmeans.py [input_file] [exact|lloyd]
+"""
+
+import numpy as np
+from bisect import bisect_left, insort
+from collections import deque
+
+SEARCH_BRANCHING = 16  # Rows per refinement step of the exact split search
+
+
+class RollingKMeans1D:
+    """Sliding-window 1-D K-Means over a sorted window"""
+
+    def __init__(self, window=252, n_clusters=3, method='exact', max_iter=100):
+        """
+        Parameters:
+        -----------
+        window : int
+            Number of values in the rolling window
+        n_clusters : int
+            Number of clusters (method='exact' supports 3 only)
+        method : str
+            'exact' (global optimum) or 'lloyd' (warm-started Lloyd iterations)
+        max_iter : int
+            Lloyd iteration cap per window
+        """
+        if method not in ('exact', 'lloyd'):
+            raise ValueError(f"Unknown method: {method}")
+        if method == 'exact' and n_clusters != 3:
+            raise ValueError("method='exact' supports n_clusters=3 only")
+        if window < n_clusters:
+            raise ValueError(f"Window ({window}) must hold at least {n_clusters} values")
+
+        self.window = window
+        self.n_clusters = n_clusters
+        self.method = method
+        self.max_iter = max_iter
+
+        self._values = deque()
+        self._sorted = []
+        self._centroids = None
+
+    def push(self, value):
+        """
+        Add the newest value to the window
+
+        Returns (cluster, density_pct) for the window ending at this value, or
+        None while the window is still filling. Clusters are numbered in
+        ascending centroid order.
+        """
+        self.add(value)
+        return self.fit()
+
+    def add(self, value):
+        """Slide the window by one value without re-fitting (O(log n) search)"""
+        value = float(value)
+        self._values.append(value)
+        insort(self._sorted, value)
+
+        if len(self._values) > self.window:
+            oldest = self._values.popleft()
+            del self._sorted[bisect_left(self._sorted, oldest)]
+
+    def fit(self):
+        """
+        Cluster the current window
+
+        Returns (cluster, density_pct) of the newest value, or None while the
+        window is still filling. With method='exact' the result depends only on
+        the window, so callers may add() many values and fit() once.
+        """
+        if len(self._values) < self.window:
+            return None
+
+        x = np.array(self._sorted)
+        if self.method == 'exact':
+            edges = self._fit_exact(x)
+        else:
+            edges = self._fit_lloyd(x)
+
+        # Rank of the newest value within the sorted window decides its cluster
+        pos = bisect_left(self._sorted, self._values[-1])
+        cluster = int(np.searchsorted(edges[1:], pos, side='right'))
+        density = (edges[cluster + 1] - edges[cluster]) / self.window * 100
+
+        return cluster, density
+
+    def _fit_lloyd(self, x):
+        """Lloyd iterations on a sorted window, warm-started from the last fit"""
+        n = len(x)
+        k = self.n_clusters
+        csum = np.empty(n + 1)
+        csum[0] = 0.0
+        np.cumsum(x, out=csum[1:])
+
+        if self._centroids is None:
+            # Cold start: evenly spaced quantiles of the first window
+            centroids = x[((2 * np.arange(k) + 1) * n) // (2 * k)].astype(float)
+        else:
+            centroids = self._centroids
+
+        edges = np.empty(k + 1, dtype=np.int64)
+        edges[0] = 0
+        edges[-1] = n
+        prev = None
+
+        for _ in range(self.max_iter):
+            # Ties go to the lower cluster, like an argmin over distances
+            mids = (centroids[:-1] + centroids[1:]) / 2
+            edges[1:-1] = np.searchsorted(x, mids, side='right')
+
+            if prev is not None and np.array_equal(edges, prev):
+                break
+            prev = edges.copy()
+
+            counts = np.diff(edges)
+            sums = np.diff(csum[edges])
+            centroids = np.sort(np.where(counts > 0, sums / np.maximum(counts, 1), centroids))
+
+        self._centroids = centroids
+        return edges
+
+    def _fit_exact(self, x):
+        """
+        Globally optimal 3-cluster partition of a sorted window
+
+        Clusters are [0, i), [i, j), [j, n). Minimising the inertia is the same
+        as maximising the between-cluster term sum(S_c^2 / n_c) of the centered
+        data, which only needs the first prefix sum. The best (i, j) pair is
+        found with _split_row_maxima in O(n log n) instead of scoring all
+        O(n^2) pairs.
+
+        Splits only fall between distinct values, so equal values share a
+        cluster (and the rank lookup in fit() finds the right one). A window
+        with fewer than 3 distinct values gets one cluster per value.
+        """
+        n = len(x)
+        splits = np.flatnonzero(x[1:] > x[:-1]) + 1
+        if len(splits) < 2:
+            return np.array([0, *splits, *[n] * (3 - len(splits))], dtype=np.int64)
+
+        p1 = np.empty(n + 1)
+        p1[0] = 0.0
+        np.cumsum(x - x.mean(), out=p1[1:])
+
+        prefix = p1[splits]
+        pos = splits.astype(float)
+        left = prefix * prefix / pos
+        right = (p1[n] - prefix) ** 2 / (n - pos)
+
+        best, value = _split_row_maxima(left, right, prefix, pos)
+        a = int(np.argmax(value))
+        return np.array([0, splits[a], splits[best[a]], n], dtype=np.int64)
+
+
+def _split_row_maxima(left, right, prefix, pos, branching=SEARCH_BRANCHING):
+    """
+    Leftmost best second split b > a for every first split a
+
+    score(a, b) = left[a] + right[b] + (prefix[b] - prefix[a])^2 / (pos[b] - pos[a])
+
+    The 1-D K-means cost is Monge, so the best b never moves left as a
+    grows. Rows are solved coarse to fine (every branching^k-th row, then
+    every branching^(k-1)-th, ...), each row searching only between the best
+    b of the coarser rows around it: O(branching * m * log m) scores in
+    log(m) / log(branching) vectorised passes instead of all m^2 pairs.
+
+    Returns (best_b, best_score) arrays over the first splits a = 0..m-2
+    """
+    m = len(pos)
+    n_rows = m - 1
+    stride = 1
+    while stride * branching < n_rows:
+        stride *= branching
+
+    best = None
+    while stride >= 1:
+        rows = np.arange(0, n_rows, stride)
+        lo = rows + 1
+        if best is None:
+            hi = np.full(len(rows), m - 1)
+        else:
+            # Bounded by the best b of the coarser rows below and above
+            block = rows // (stride * branching)
+            lo = np.maximum(lo, best[block])
+            hi = np.maximum(np.append(best, m - 1)[block + 1], lo)
+
+        # All candidate (a, b) pairs of this pass as one flat array, row by row
+        counts = hi - lo + 1
+        starts = np.cumsum(counts) - counts
+        b = np.arange(counts.sum()) - np.repeat(starts - lo, counts)
+        a = np.repeat(rows, counts)
+
+        score = prefix[b] - prefix[a]
+        score *= score
+        score /= pos[b] - pos[a]
+        score += left[a]
+        score += right[b]
+
+        row_max = np.maximum.reduceat(score, starts)
+        hits = np.flatnonzero(score == np.repeat(row_max, counts))
+        best = b[hits[np.searchsorted(hits, starts)]]
+        stride //= branching
+
+    return best, row_max
+
+
+def rolling_cluster_density(values, window=252, n_clusters=3, method='exact'):
+    """
+    Rolling K-Means cluster and density for a whole series
+
+    Row i is computed from values[i-window:i] (the previous `window` bars,
+    same alignment as the training notebooks) and reports the cluster of
+    values[i-1] and that cluster's share of the window in percent. The first
+    `window` rows are NaN.
+
+    Returns:
+    --------
+    (clusters, densities) : tuple of float ndarrays
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    clusters = np.full(n, np.nan)
+    densities = np.full(n, np.nan)
+
+    engine = RollingKMeans1D(window=window, n_clusters=n_clusters, method=method)
+    for i, value in enumerate(values[:-1].tolist()):
+        result = engine.push(value)
+        if result is not None:
+            clusters[i + 1], densities[i + 1] = result
+
+    return clusters, densities
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import pandas as pd
+
+    input_file = sys.argv[1] if len(sys.argv) >= 2 else "BTCUSD_15m_HA_data.csv"
+    method = sys.argv[2] if len(sys.argv) >= 3 else "exact"
+
+    df = pd.read_csv(input_file)
+    start = time.perf_counter()
+    _, density = rolling_cluster_density(df['HA_Close'].values, method=method)
+    elapsed = time.perf_counter() - start
+
+    print(f"✓ {len(df)} bars clustered in {elapsed:.2f}s ({method}, {len(df) / elapsed:,.0f} bars/s)")
+    print(f"  Mean density: {np.nanmean(density):.2f}%")
+    print(f"  >=20%:        {(density >= 20).sum()} bars")
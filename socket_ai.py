@@ -1,9 +1,9 @@
-import socket
 import numpy as np
 import joblib
 import traceback
 import warnings
 import sys
+from prediction_server import PredictionServer
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -31,49 +31,26 @@ try:
     model = joblib.load("XGBoost/xgboost_trend_model.pkl")
     print("Modello caricato.")
 
-    # === Server TCP
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind((host, port))
-        s.listen(1)
-        s.settimeout(1.0)
-
-        print(f"Model Server in ascolto su {host}:{port} — premi Ctrl+C per uscire")
-
-        while True:
-            try:
-                conn, addr = s.accept()
-            except socket.timeout:
-                continue
-            except KeyboardInterrupt:
-                print("\nInterruzione da tastiera — chiusura server...")
-                break
-
-            with conn:
-                print("Connessione da:", addr)
-                try:
-                    data = conn.recv(10000)
-                    decoded = data.decode("utf-8")
-
-                    if decoded.strip() == "PING":
-                        print("Handshake ricevuto: PING")
-                        conn.send(b"0")
-                        continue
-
-                    print("📨 Messaggio ricevuto:", decoded[:100] + "..." if len(decoded) > 100 else decoded)
-
-                    x_input = preprocess_input(decoded)
-                    pred = model.predict(x_input)
-                    label = -1 if pred[0] == 0 else 1
-                    print(f"Predizione classe: {pred[0]} → tradotto: {label}")
-
-                    conn.send(str(label).encode("utf-8"))
-                    print("Risposta inviata al client\n")
-
-                except Exception as e:
-                    print("Errore nella gestione del messaggio:", e)
-                    traceback.print_exc()
-                    conn.send(b"0")
+    # === Server TCP (asyncio, più client in parallelo; vedi prediction_server.py)
+    def predict_text(decoded):
+        print("📨 Messaggio ricevuto:", decoded[:100] + "..." if len(decoded) > 100 else decoded)
+        try:
+            x_input = preprocess_input(decoded)
+            pred = model.predict(x_input)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise RuntimeError(e)
+        label = -1 if pred[0] == 0 else 1
+        print(f"Predizione classe: {pred[0]} → tradotto: {label}")
+        return label, None, None
+
+    def log_prediction(request_no, signal, label, confidence, votes, mode):
+        print(f"[{request_no}] Risposta inviata al client: {label}\n")
+
+    server = PredictionServer(predict_text, host=host, port=port, n_features=n_features,
+                              log=log_prediction, ping_replies={"PING": b"0"})
+    server.run(lambda: print(f"Model Server in ascolto su {host}:{server.port} — premi Ctrl+C per uscire"))
 
 except KeyboardInterrupt:
     print("\nServer interrotto manualmente (Ctrl+C) — uscita pulita.")
@@ -9,9 +9,10 @@ Usage:
 
 Listens on port 9091 for incoming feature vectors from MT5 EA
 Returns ±1 prediction via majority voting across 3 models
+Clients are served concurrently (prediction_server.py, asyncio), with
+inference on executor threads
 """
 
-import socket
 import numpy as np
 import joblib
 import traceback
@@ -19,6 +20,8 @@ import warnings
 import sys
 import tensorflow as tf
 from tensorflow.keras.models import load_model
+from ha_features import N_FEATURES
+from prediction_server import PredictionServer
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -29,8 +32,9 @@ print("=" * 70)
 # === Configuration ===
 HOST = '127.0.0.1'
 PORT = 9091
-N_FEATURES = 15  # Match EA feature count
+# N_FEATURES comes from ha_features.py (FEATURE_COLUMNS, same order as the EA / client)
 TIMEOUT = 5.0
+MAX_IN_FLIGHT = 32  # Predictions queued on the executor at once; further requests wait
 
 # === Load All Three Models ===
 models = {}
@@ -111,77 +115,30 @@ def make_prediction(X_scaled):
         raise RuntimeError(f"Prediction error: {e}")
 
 # === Server ===
+def predict_text(data_str):
+    """Text request -> (prediction, confidence, None); runs on a server executor thread"""
+    prediction, confidence = make_prediction(preprocess_input(data_str))
+    return prediction, confidence, None
+
+def log_prediction(request_no, signal, prediction, confidence, votes, mode):
+    print(f"[{request_no}] Prediction: {prediction:+d} (confidence: {confidence:.2%})")
+
 def start_server():
     """Start TCP socket server"""
     print("\n" + "=" * 60)
     print("Starting AI Prediction Server...")
     print("=" * 60)
     
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT))
-            s.listen(1)
-            s.settimeout(TIMEOUT)
-            
-            print(f"\n✓ Server listening on {HOST}:{PORT}")
-            print(f"✓ Ready to accept connections from HA_KMeans_Hybrid_EA.mq5")
-            print(f"\nWaiting for predictions... (Press Ctrl+C to stop)\n")
-            
-            request_count = 0
-            
-            while True:
-                try:
-                    # Accept connection
-                    conn, addr = s.accept()
-                    request_count += 1
-                    
-                    with conn:
-                        # Set connection timeout
-                        conn.settimeout(TIMEOUT)
-                        
-                        # Receive data
-                        data = conn.recv(4096).decode('utf-8')
-                        
-                        if not data:
-                            print(f"[{request_count}] Empty data received")
-                            conn.sendall(b"0")
-                            continue
-                        
-                        try:
-                            # Preprocess
-                            X_scaled = preprocess_input(data)
-                            
-                            # Predict
-                            prediction, confidence = make_prediction(X_scaled)
-                            
-                            # Send response
-                            response = str(prediction).encode('utf-8')
-                            conn.sendall(response)
-                            
-                            print(f"[{request_count}] Prediction: {prediction:+d} (confidence: {confidence:.2%})")
-                            
-                        except ValueError as ve:
-                            print(f"[{request_count}] ✗ Preprocessing error: {ve}")
-                            conn.sendall(b"0")
-                        except RuntimeError as re:
-                            print(f"[{request_count}] ✗ Prediction error: {re}")
-                            conn.sendall(b"0")
-                
-                except socket.timeout:
-                    # No connection, keep listening
-                    continue
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    print(f"[{request_count}] Connection error: {e}")
-                    continue
-        
-        print("\n" + "=" * 60)
-        print("Server stopped")
-        print(f"Total predictions made: {request_count}")
-        print("=" * 60)
+    server = PredictionServer(predict_text, host=HOST, port=PORT, max_in_flight=MAX_IN_FLIGHT,
+                              timeout=TIMEOUT, log=log_prediction)
+    
+    def ready():
+        print(f"\n✓ Server listening on {HOST}:{server.port}")
+        print(f"✓ Ready to accept connections from HA_KMeans_Hybrid_EA.mq5")
+        print(f"\nWaiting for predictions... (Press Ctrl+C to stop)\n")
     
+    try:
+        server.run(ready)
     except OSError as e:
         print(f"\n✗ SERVER ERROR:")
         print(f"  {e}")
@@ -14,16 +14,42 @@ Voting Logic:
   2+ models predict +1 → signal = +1 (BULLISH)
   2+ models predict -1 → signal = -1 (BEARISH)
   Mixed decision → signal = 0 (NEUTRAL - skip trade)
+
+Protocol (see prediction_protocol.py):
+  text    one request per connection, whitespace-separated features,
+          reply "1" / "-1" / "0" (HA_KMeans_Hybrid_EA.mq5 and older EAs)
+  binary  persistent connection, length-prefixed frames with a request id
+          and 15 float32 features; many requests per connection
+The connection's first four bytes select the mode. Clients are served
+concurrently by prediction_server.py (asyncio); model inference runs on
+its executor threads, at most MAX_IN_FLIGHT requests at a time. Requests
+arriving together are micro-batched (micro_batcher.py): one transform and
+one predict per model for up to MAX_BATCH rows. Request latency p50 / p99
+per mode is printed when the server stops.
+
+The three models are evaluated in parallel (one thread each), so a vote
+takes as long as the slowest model, capped by MODEL_DEADLINES: a model
+that has not answered by its deadline counts as a 0 vote.
+
+With COMPACT_MODE the features are parsed as float32. At startup every
+loaded model votes on COMPACT_PROBE_ROWS random vectors around the scaler
+means as float64 and as float32 (ha_features.compact_check); the server
+refuses to start if any vote differs.
 """
 
-import socket
 import numpy as np
 import joblib
 import traceback
 import warnings
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 import tensorflow as tf
 from tensorflow.keras.models import load_model
+from ha_features import N_FEATURES, COMPACT_DTYPE, compact_check
+from prediction_server import PredictionServer
+from fused_scaler import FusedScaler
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
@@ -35,8 +61,19 @@ print("=" * 70)
 # === Configuration ===
 HOST = '127.0.0.1'
 PORT = 9091
-N_FEATURES = 15  # Match EA feature count
+# N_FEATURES comes from ha_features.py (FEATURE_COLUMNS, same order as the EA / client)
+COMPACT_MODE = False  # float32 feature vectors (checked against float64 at startup)
+FEATURE_DTYPE = COMPACT_DTYPE if COMPACT_MODE else np.float64
+COMPACT_PROBE_ROWS = 512
 TIMEOUT = 5.0
+IDLE_TIMEOUT = 300.0  # Persistent binary connections may sit idle between bars
+MAX_IN_FLIGHT = 32  # Predictions queued on the executor at once; further requests wait
+WORKERS = None  # Executor threads (None: min(4, cores))
+BATCH_WINDOW = 0.001  # Seconds concurrent requests are collected into one model call
+MAX_BATCH = 64  # 1 disables micro-batching
+# Each model runs on its own thread, in parallel with the others; a model that
+# misses its deadline (seconds from the start of the vote) counts as a 0 vote
+MODEL_DEADLINES = {'lstm': 0.5, 'rf': 0.25, 'xgb': 0.25}
 
 # === Load All Three Models ===
 models = {}
@@ -87,60 +124,70 @@ if models_ready < 2:
     print("  XGBoost:      xgboost_ha15m_trend_model.pkl + scaler_xgboost_ha15m.save")
     sys.exit(1)
 
+# Scale for all models at once (one broadcast instead of a transform per scaler)
+fused_scaler = FusedScaler({name: scalers[name] for name in ('lstm', 'rf', 'xgb') if models[name] is not None})
+print(f"✓ Fused scaler: {len(fused_scaler.names)} scalers, {fused_scaler.n_unique} distinct")
+
 print(f"\n✓ Ensemble ready with {models_ready} models")
 
 # === Helper Functions ===
 
+def parse_input(data_str):
+    """Feature vector of a text request"""
+    try:
+        values = np.array(list(map(float, data_str.strip().split())), dtype=FEATURE_DTYPE)
+    except Exception as e:
+        raise ValueError(f"Input preprocessing error: {e}")
+    if len(values) != N_FEATURES:
+        raise ValueError(f"Input preprocessing error: Expected {N_FEATURES} features, got {len(values)}")
+    return values
+
 def preprocess_input(data_str):
     """Convert string input to scaled feature vectors for all models"""
+    return preprocess_vector(parse_input(data_str))
+
+def preprocess_vector(values):
+    """Scale one feature vector (sequence / float32 array) for all models"""
+    if len(values) != N_FEATURES:
+        raise ValueError(f"Input preprocessing error: Expected {N_FEATURES} features, got {len(values)}")
+    return preprocess_batch(np.asarray(values, dtype=FEATURE_DTYPE).reshape(1, -1))
+
+def preprocess_batch(X):
+    """Scale an (n, N_FEATURES) batch for all models"""
     try:
-        values = list(map(float, data_str.strip().split()))
-        
-        if len(values) != N_FEATURES:
-            raise ValueError(f"Expected {N_FEATURES} features, got {len(values)}")
-        
-        # Create single array
-        X = np.array(values).reshape(1, -1)
-        
-        # Scale for each model
-        X_scaled = {}
-        if models['lstm'] is not None:
-            X_scaled['lstm'] = scalers['lstm'].transform(X)
-        if models['rf'] is not None:
-            X_scaled['rf'] = scalers['rf'].transform(X)
-        if models['xgb'] is not None:
-            X_scaled['xgb'] = scalers['xgb'].transform(X)
+        X = np.asarray(X, dtype=FEATURE_DTYPE)
         
-        return X_scaled
+        # Scale for each loaded model in one pass
+        return fused_scaler.transform(X)
     except Exception as e:
         raise ValueError(f"Input preprocessing error: {e}")
 
 def predict_lstm(X_scaled):
-    """LSTM prediction"""
+    """LSTM prediction per row (all 0 on error)"""
     try:
         # LSTM expects sequence input, use last bar
-        # Reshape: (1, 5, 15) for sequence length 5
-        X_seq = X_scaled.reshape(1, 1, -1)  # (1, 1, 15)
-        pred = models['lstm'].predict(X_seq, verbose=0)[0][0]
-        return 1 if pred > 0 else -1
+        # Reshape: (n, 5, 15) for sequence length 5
+        X_seq = X_scaled.reshape(len(X_scaled), 1, -1)  # (n, 1, 15)
+        pred = models['lstm'].predict(X_seq, verbose=0)[:, 0]
+        return np.where(pred > 0, 1, -1)
     except:
-        return 0  # Error return
+        return np.zeros(len(X_scaled), dtype=int)  # Error return
 
 def predict_rf(X_scaled):
-    """Random Forest prediction"""
+    """Random Forest prediction per row"""
     try:
-        pred = models['rf'].predict(X_scaled)[0]
-        return 1 if pred == 1 else -1
+        pred = models['rf'].predict(X_scaled)
+        return np.where(pred == 1, 1, -1)
     except:
-        return 0
+        return np.zeros(len(X_scaled), dtype=int)
 
 def predict_xgb(X_scaled):
-    """XGBoost prediction"""
+    """XGBoost prediction per row"""
     try:
-        pred = models['xgb'].predict(X_scaled)[0]
-        return 1 if pred == 1 else -1
+        pred = models['xgb'].predict(X_scaled)
+        return np.where(pred == 1, 1, -1)
     except:
-        return 0
+        return np.zeros(len(X_scaled), dtype=int)
 
 def ensemble_voting(lstm_pred, rf_pred, xgb_pred):
     """Majority voting across 3 models"""
@@ -169,120 +216,140 @@ def ensemble_voting(lstm_pred, rf_pred, xgb_pred):
     else:
         return 0, 0.33  # No consensus
 
-def make_prediction(X_scaled):
-    """Get predictions from all models and vote"""
+MODEL_FUNCS = {'lstm': predict_lstm, 'rf': predict_rf, 'xgb': predict_xgb}
+MODEL_LABELS = {'lstm': "LSTM", 'rf': "Random Forest", 'xgb': "XGBoost"}
+
+# One thread per model: the models run in parallel (TensorFlow, sklearn and
+# XGBoost release the GIL), and a model stuck past its deadline only delays
+# its own later calls
+model_pools = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"model-{name}") for name in MODEL_FUNCS}
+model_timeouts = {name: 0 for name in MODEL_FUNCS}
+timeout_lock = threading.Lock()
+
+def run_models(X_scaled):
+    """Per-model votes for a scaled batch, evaluated in parallel (0 votes past a model's deadline)"""
+    n_rows = len(next(iter(X_scaled.values())))
+    start = time.perf_counter()
+    futures = {name: model_pools[name].submit(MODEL_FUNCS[name], X_scaled[name])
+               for name in MODEL_FUNCS if name in X_scaled}
+    
+    preds = {}
+    for name in MODEL_FUNCS:
+        if name not in futures:
+            preds[name] = np.zeros(n_rows, dtype=int)
+            continue
+        try:
+            remaining = start + MODEL_DEADLINES[name] - time.perf_counter()
+            preds[name] = futures[name].result(timeout=max(remaining, 0))
+        except FutureTimeout:
+            futures[name].cancel()  # Still queued behind a slow call: skip it
+            with timeout_lock:
+                model_timeouts[name] += 1
+            print(f"⚠ {MODEL_LABELS[name]} missed its {MODEL_DEADLINES[name] * 1000:.0f} ms deadline (vote 0)")
+            preds[name] = np.zeros(n_rows, dtype=int)
+    return preds['lstm'], preds['rf'], preds['xgb']
+
+def make_predictions(X_scaled):
+    """Vote for every row of a scaled batch: list of (signal, confidence, votes)"""
     try:
-        # Get individual predictions
-        lstm_pred = predict_lstm(X_scaled['lstm']) if 'lstm' in X_scaled else 0
-        rf_pred = predict_rf(X_scaled['rf']) if 'rf' in X_scaled else 0
-        xgb_pred = predict_xgb(X_scaled['xgb']) if 'xgb' in X_scaled else 0
+        # One call per model for the whole batch, all three in parallel
+        lstm_preds, rf_preds, xgb_preds = run_models(X_scaled)
         
         # Ensemble voting
-        ensemble_pred, confidence = ensemble_voting(lstm_pred, rf_pred, xgb_pred)
-        
-        return ensemble_pred, confidence, (lstm_pred, rf_pred, xgb_pred)
+        results = []
+        for lstm_pred, rf_pred, xgb_pred in zip(lstm_preds.tolist(), rf_preds.tolist(), xgb_preds.tolist()):
+            ensemble_pred, confidence = ensemble_voting(lstm_pred, rf_pred, xgb_pred)
+            results.append((ensemble_pred, confidence, (lstm_pred, rf_pred, xgb_pred)))
+        return results
     except Exception as e:
         raise RuntimeError(f"Prediction error: {e}")
 
+def make_prediction(X_scaled):
+    """Get predictions from all models and vote (one scaled row)"""
+    return make_predictions(X_scaled)[0]
+
 # === Server ===
+def predict_text(data_str):
+    """Text request -> (signal, confidence, votes); runs on a server executor thread"""
+    return make_prediction(preprocess_input(data_str))
+
+def predict_vector(features):
+    """Binary request features -> (signal, confidence, votes)"""
+    return make_prediction(preprocess_vector(features))
+
+def predict_batch(vectors):
+    """Feature vectors of concurrent requests -> one (signal, confidence, votes) each"""
+    return make_predictions(preprocess_batch(np.vstack(vectors)))
+
+def timeout_summary():
+    """Deadline misses per model for the shutdown summary"""
+    if not any(model_timeouts.values()):
+        return []
+    misses = ", ".join(f"{MODEL_LABELS[name]} {count}" for name, count in model_timeouts.items())
+    return [f"  deadline misses: {misses}"]
+
+def log_prediction(request_no, signal, prediction, confidence, votes, mode):
+    lstm_pred, rf_pred, xgb_pred = votes
+    vote_str = f"[LSTM:{lstm_pred:+d} RF:{rf_pred:+d} XGB:{xgb_pred:+d}]"
+    print(f"[{request_no}] {signal:7s} {vote_str} (conf: {confidence:.0%}) {mode}")
+
+def check_compact_mode(n_rows=COMPACT_PROBE_ROWS, seed=42):
+    """
+    Compare every loaded model's votes on float32 and float64 features
+    
+    Probe vectors are drawn around the fitted scaler means (mean + scale *
+    N(0, 1)) and go through the same scaling and predict path as requests.
+    Returns True if no vote differs.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n_rows, N_FEATURES))
+    if fused_scaler.mean is not None:
+        X = fused_scaler.mean[0] + fused_scaler.scale[0] * X
+    
+    ok = True
+    for name in fused_scaler.names:
+        result = compact_check(lambda X, name=name: MODEL_FUNCS[name](fused_scaler.transform(X)[name]), X)
+        if result['ok']:
+            print(f"  ✓ {MODEL_LABELS[name]}: same votes on float32 features ({result['rows']} probe rows)")
+        else:
+            print(f"  ✗ {MODEL_LABELS[name]}: {result['mismatches']} of {result['rows']} votes differ on float32 features")
+            ok = False
+    return ok
+
 def start_server():
     """Start TCP socket server"""
     print("\n" + "=" * 70)
     print("Starting Ensemble AI Prediction Server...")
     print("=" * 70)
     
-    try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT))
-            s.listen(1)
-            s.settimeout(TIMEOUT)
-            
-            print(f"\n✓ Server listening on {HOST}:{PORT}")
-            print(f"✓ Ensemble voting active ({models_ready} models)")
-            print(f"✓ Ready for HA_KMeans_Hybrid_EA.mq5 connections")
-            print(f"\nWaiting for predictions... (Press Ctrl+C to stop)\n")
-            
-            request_count = 0
-            bullish_count = 0
-            bearish_count = 0
-            neutral_count = 0
-            
-            while True:
-                try:
-                    # Accept connection
-                    conn, addr = s.accept()
-                    request_count += 1
-                    
-                    with conn:
-                        # Set connection timeout
-                        conn.settimeout(TIMEOUT)
-                        
-                        # Receive data
-                        data = conn.recv(4096).decode('utf-8')
-                        
-                        if not data:
-                            print(f"[{request_count}] Empty data received")
-                            conn.sendall(b"0")
-                            continue
-                        
-                        try:
-                            # Preprocess
-                            X_scaled_dict = preprocess_input(data)
-                            
-                            # Predict with ensemble
-                            prediction, confidence, votes = make_prediction(X_scaled_dict)
-                            
-                            # Count signals
-                            if prediction == 1:
-                                bullish_count += 1
-                                signal = "BULLISH"
-                            elif prediction == -1:
-                                bearish_count += 1
-                                signal = "BEARISH"
-                            else:
-                                neutral_count += 1
-                                signal = "NEUTRAL"
-                            
-                            # Send response
-                            response = str(prediction).encode('utf-8')
-                            conn.sendall(response)
-                            
-                            # Log
-                            lstm_pred, rf_pred, xgb_pred = votes
-                            vote_str = f"[LSTM:{lstm_pred:+d} RF:{rf_pred:+d} XGB:{xgb_pred:+d}]"
-                            print(f"[{request_count}] {signal:7s} {vote_str} (conf: {confidence:.0%})")
-                            
-                        except ValueError as ve:
-                            print(f"[{request_count}] ✗ Preprocessing error: {ve}")
-                            conn.sendall(b"0")
-                        except RuntimeError as re:
-                            print(f"[{request_count}] ✗ Prediction error: {re}")
-                            conn.sendall(b"0")
-                
-                except socket.timeout:
-                    # No connection, keep listening
-                    continue
-                except KeyboardInterrupt:
-                    break
-                except Exception as e:
-                    print(f"[{request_count}] Connection error: {e}")
-                    continue
-        
-        print("\n" + "=" * 70)
-        print("Server stopped")
-        print(f"Total requests: {request_count}")
-        print(f"  Bullish:  {bullish_count}")
-        print(f"  Bearish:  {bearish_count}")
-        print(f"  Neutral:  {neutral_count}")
-        print("=" * 70)
+    if COMPACT_MODE:
+        print("\n[COMPACT MODE CHECK]")
+        if not check_compact_mode():
+            print("\n✗ Models disagree on float32 features, not starting (set COMPACT_MODE = False)")
+            sys.exit(1)
+    
+    server = PredictionServer(predict_text, predict_vector, host=HOST, port=PORT, max_in_flight=MAX_IN_FLIGHT,
+                              workers=WORKERS, timeout=TIMEOUT, idle_timeout=IDLE_TIMEOUT, log=log_prediction,
+                              predict_batch=predict_batch, parse_text=parse_input, batch_window=BATCH_WINDOW,
+                              max_batch=MAX_BATCH, summary=timeout_summary)
     
+    def ready():
+        print(f"\n✓ Server listening on {HOST}:{server.port}")
+        print(f"✓ Ensemble voting active ({models_ready} models, {server.workers} inference threads)")
+        print(f"✓ Ready for HA_KMeans_Hybrid_EA.mq5 connections (text) and persistent binary clients")
+        print(f"\nWaiting for predictions... (Press Ctrl+C to stop)\n")
+    
+    try:
+        server.run(ready)
     except OSError as e:
         print(f"\n✗ Server error: {e}")
-        if "Address already in use" in str(e):
+        if e.errno in (48, 98, 10048):  # Address already in use (macOS / Linux / Windows)
             print(f"  Port {PORT} is already in use")
             print(f"  Try stopping other instances or using a different port")
         sys.exit(1)
+    finally:
+        for pool in model_pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
 
 if __name__ == "__main__":
     try:
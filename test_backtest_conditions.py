@@ -1,52 +1,27 @@
 import pandas as pd
 import numpy as np
-from sklearn.cluster import KMeans
+from rolling_kmeans import rolling_cluster_density
+from ha_features import consecutive_counts, PATTERN_BARS
+from data_cache import load_csv
 
 # Load data
-ha_data = pd.read_csv('BTCUSD_15m_HA_data.csv')
-ensemble = pd.read_csv('ensemble_ha15m_forecast.csv')
+ha_data = load_csv('BTCUSD_15m_HA_data.csv')
+ensemble = load_csv('ensemble_ha15m_forecast.csv')
 
 # Filter to 2025 period
-ha_data['Time'] = pd.to_datetime(ha_data['Time'])
-ensemble['Time'] = pd.to_datetime(ensemble['Time'])
 ha_data = ha_data[(ha_data['Time'] >= '2025-01-01') & (ha_data['Time'] <= '2025-12-10')]
 
 print(f"Total bars: {len(ha_data)}")
 
-# Calculate K-means clustering
+# Calculate K-means clustering (incremental rolling engine)
 window = 252
-ha_data['Cluster_Valid'] = False
-ha_data['Cluster_Density'] = 0
+_, densities = rolling_cluster_density(ha_data['HA_Close'].values, window=window)
+ha_data['Cluster_Density'] = np.nan_to_num(densities)
+ha_data['Cluster_Valid'] = ha_data['Cluster_Density'] >= 20
 
-for i in range(window, len(ha_data)):
-    close_prices = ha_data['HA_Close'].iloc[i-window:i].values.reshape(-1, 1)
-    kmeans = KMeans(n_clusters=3, n_init=10, random_state=42)
-    clusters = kmeans.fit_predict(close_prices)
-    
-    current_cluster = clusters[-1]
-    cluster_count = np.sum(clusters == current_cluster)
-    density = (cluster_count / window) * 100
-    ha_data.loc[ha_data.index[i], 'Cluster_Density'] = density
-    ha_data.loc[ha_data.index[i], 'Cluster_Valid'] = density >= 20
-
-# Detect consecutive bars
-ha_data['Pattern_Valid'] = False
-up_count = 0
-down_count = 0
-
-for i in range(1, len(ha_data)):
-    if ha_data['HA_Close'].iloc[i] > ha_data['HA_Close'].iloc[i-1]:
-        up_count += 1
-        down_count = 0
-    elif ha_data['HA_Close'].iloc[i] < ha_data['HA_Close'].iloc[i-1]:
-        down_count += 1
-        up_count = 0
-    else:
-        up_count = 0
-        down_count = 0
-    
-    if up_count >= 3 or down_count >= 3:
-        ha_data.loc[ha_data.index[i], 'Pattern_Valid'] = True
+# Detect consecutive bars (3+ in the same direction)
+up, down = consecutive_counts(ha_data['HA_Close'].values)
+ha_data['Pattern_Valid'] = (up >= PATTERN_BARS) | (down >= PATTERN_BARS)
 
 # Volume confirmation
 ha_data['Volume_Confirm'] = False
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Data Cache Tests
+The cached load must return the same frame as pd.read_csv
+
+Usage:
+    python -m pytest test_data_cache.py
+"""
+
+import pandas as pd
+
+from data_cache import load_csv
+
+CSV = """Time,Label,Value,Note
+2025-01-01 00:00,a,1.5,
+2025-01-01 00:15,,2.5,n
+2025-01-01 00:30,c,,m
+"""
+
+
+def expected_frame(path):
+    df = pd.read_csv(path)
+    df['Time'] = pd.to_datetime(df['Time']).astype('datetime64[ns]')
+    return df
+
+
+def test_missing_strings_stay_missing(tmp_path):
+    path = tmp_path / 'bars.csv'
+    path.write_text(CSV)
+    expected = expected_frame(path)
+
+    # First call builds the cache, the second reads it back
+    for _ in range(2):
+        df = load_csv(str(path))
+        pd.testing.assert_frame_equal(df, expected)
+        assert df['Label'].isna().tolist() == [False, True, False]
+        assert df['Note'].isna().tolist() == [True, False, False]
+
+
+def test_cache_matches_read_csv_without_cache(tmp_path):
+    path = tmp_path / 'bars.csv'
+    path.write_text(CSV)
+    load_csv(str(path))
+    pd.testing.assert_frame_equal(load_csv(str(path)), load_csv(str(path), use_cache=False))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Portfolio Backtest Tests
+A single-symbol portfolio must trade exactly like the engine's backtest core
+
+Usage:
+    python -m pytest test_portfolio_backtest.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest_core import run_bars, EXIT_TYPES
+from backtest_ensemble_enhanced import EnhancedBacktestEngine
+from portfolio_backtest import PortfolioBacktest
+
+RISK_PARAMS = {
+    'stop_loss_pips': 100,
+    'take_profit_pips': 300,
+    'min_lot_size': 0.5,
+    'max_lot_size': 1.2,
+    'account_balance': 10000,
+    'risk_percent': 2.0,
+    'min_holding_bars': 10,
+    'max_daily_trades': 6,
+}
+
+
+def write_synthetic(tmp_path, n_bars=1500, seed=7):
+    """HA data and ensemble forecast CSVs of a random walk"""
+    rng = np.random.default_rng(seed)
+    time = pd.date_range('2025-01-01', periods=n_bars, freq='15min')
+    close = 60000 + np.cumsum(rng.normal(0, 150, n_bars))
+    open_ = np.concatenate([[close[0]], close[:-1]])
+    spread = np.abs(rng.normal(0, 80, n_bars))
+    ha = pd.DataFrame({
+        'Time': time,
+        'HA_Open': open_,
+        'HA_High': np.maximum(open_, close) + spread,
+        'HA_Low': np.minimum(open_, close) - spread,
+        'HA_Close': close,
+        'Volume': rng.integers(100, 1000, n_bars),
+    })
+    signal = rng.choice([-1, 0, 1], size=n_bars, p=[0.1, 0.8, 0.1])
+    ensemble = pd.DataFrame({'Time': time, 'XGB_Trigger': signal, 'RF_Confirm': signal, 'Signal': signal,
+                             'Confirmed': signal != 0, 'Confidence': 0.67})
+    ha.to_csv(tmp_path / 'ha.csv', index=False)
+    ensemble.to_csv(tmp_path / 'ensemble.csv', index=False)
+    return str(tmp_path / 'ha.csv'), str(tmp_path / 'ensemble.csv')
+
+
+def test_single_symbol_matches_engine(tmp_path):
+    csv_file, ensemble_file = write_synthetic(tmp_path)
+    engine = EnhancedBacktestEngine(csv_file, ensemble_file, RISK_PARAMS, use_feature_store=False,
+                                    monte_carlo_sims=0)
+    engine.prepare_data()
+    # Signals every 7 bars (incl. the last bar, where a position is still open)
+    signal = np.zeros(len(engine.df), dtype=int)
+    signal[::7] = 1
+    signal[3::14] = -1
+    signal[-1] = 1
+    engine.df['Signal'] = signal
+
+    expected = run_bars(engine.core_arrays(), engine.core_params())
+    portfolio = PortfolioBacktest({'SYN': engine}, RISK_PARAMS)
+    trades = portfolio.run()
+
+    assert [t['entry_idx'] for t in trades] == expected['entry_idx'].tolist()
+    assert [t['exit_idx'] for t in trades] == expected['exit_idx'].tolist()
+    assert [t['exit_type'] for t in trades] == [EXIT_TYPES[code] for code in expected['exit_code'].tolist()]
+    np.testing.assert_allclose([t['pnl'] for t in trades], expected['pnl'])
+    np.testing.assert_allclose(portfolio.equity_curve, expected['equity'])
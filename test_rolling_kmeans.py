@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Rolling K-Means Tests
+Exact cluster densities against brute force, including degenerate windows
+
+Usage:
+    python -m pytest test_rolling_kmeans.py
+"""
+
+import numpy as np
+
+from rolling_kmeans import RollingKMeans1D, rolling_cluster_density
+
+WINDOW = 252
+
+
+def brute_force_density(window_values):
+    """Density of the newest value under the minimum-inertia 3-cluster split"""
+    x = np.sort(window_values)
+    n = len(x)
+    best = None
+    for i in range(1, n - 1):
+        for j in range(i + 1, n):
+            inertia = sum(((part - part.mean()) ** 2).sum() for part in (x[:i], x[i:j], x[j:]))
+            if best is None or inertia < best[0] - 1e-9:
+                best = (inertia, i, j)
+    _, i, j = best
+    newest = window_values[-1]
+    size = [len(part) for part in (x[:i], x[i:j], x[j:]) if part[0] <= newest <= part[-1]][0]
+    return size / n * 100
+
+
+def test_constant_window_is_one_cluster():
+    values = np.r_[np.linspace(1, 2, WINDOW), np.full(WINDOW + 1, 5.0)]
+    for method in ('exact', 'lloyd'):
+        _, density = rolling_cluster_density(values, window=WINDOW, method=method)
+        assert density[-1] == 100.0
+
+
+def test_two_values_are_two_clusters():
+    values = np.r_[np.full(WINDOW - 60, 5.0), np.full(60, 6.0)]
+    engine = RollingKMeans1D(window=WINDOW)
+    for value in values[:-1]:
+        engine.add(value)
+    assert np.isclose(engine.push(values[-1])[1], 60 / WINDOW * 100)
+    # The window slides (one 5.0 out, one in): the 5.0 cluster keeps its size
+    assert np.isclose(engine.push(5.0)[1], (WINDOW - 60) / WINDOW * 100)
+
+
+def test_exact_matches_brute_force():
+    rng = np.random.default_rng(3)
+    window = 40
+    # Random walk with repeated prices (ties) and a flat stretch
+    values = np.round(100 + np.cumsum(rng.normal(0, 1, 160)), 0)
+    values[100:130] = values[99]
+    _, density = rolling_cluster_density(values, window=window)
+    for i in range(window, len(values)):
+        assert np.isclose(density[i], brute_force_density(values[i - window:i])), i
+
+
+def test_split_search_matches_all_pairs():
+    rng = np.random.default_rng(11)
+    values = 60000 + np.cumsum(rng.normal(0, 50, 3 * WINDOW))
+    engine = RollingKMeans1D(window=WINDOW)
+    for i, value in enumerate(values):
+        engine.add(value)
+        if i < WINDOW or i % 25:
+            continue
+        # Every (i, j) split pair of the sorted window scored at once
+        x = np.array(engine._sorted)
+        n = len(x)
+        p1 = np.r_[0.0, np.cumsum(x - x.mean())]
+        a, b = np.triu_indices(n, 1)
+        keep = (a >= 1) & (b <= n - 1)
+        a, b = a[keep], b[keep]
+        score = p1[a] ** 2 / a + (p1[b] - p1[a]) ** 2 / (b - a) + (p1[n] - p1[b]) ** 2 / (n - b)
+        k = np.argmax(score)
+        edges = engine._fit_exact(x)
+        assert (edges[1], edges[2]) == (a[k], b[k]), i
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Compact Backtest Result Store
+Structured-array trade log and per-bar mark-to-market equity
+
+A trade is one row of a NumPy structured array (TRADE_DTYPE, about 120
+bytes with datetime64 times) instead of a dict of Python objects and pandas
+Timestamps, so a 100k-trade run stays in the low megabytes. It is built
+column by column from backtest_core's trade arrays.
+
+The equity curve is per bar: realized PnL accumulated at each exit bar
+(one cumulative sum) plus the open PnL of the position held on the bar,
+marked at the bar close. It lines up one-to-one with the bar times, so
+it can be saved and plotted against them directly.
+
+Both go to CSV (the trade log in the engine's original column layout) and
+to one uncompressed .npz file that loads back without parsing.
+
+Usage:
+    from trade_log import trade_records, mark_to_market, trades_frame, save_trade_log
+    trades = trade_records(result, times, confidence)
+    equity, balance = mark_to_market(result, close, initial_equity)
+    trades_frame(trades).to_csv('trades.csv', index=False)
+    save_trade_log('results.npz', trades, time=times, equity=equity, balance=balance)
+"""
+
+import numpy as np
+import pandas as pd
+
+from backtest_core import PNL_MULTIPLIER, EXIT_END, EXIT_TYPES
+
+TRADE_DTYPE = np.dtype([
+    ('entry_idx', np.int64),
+    ('exit_idx', np.int64),
+    ('entry_time', 'datetime64[ns]'),
+    ('exit_time', 'datetime64[ns]'),
+    ('signal', np.float64),
+    ('exit_code', np.int8),
+    ('entry_price', np.float64),
+    ('exit_price', np.float64),
+    ('stop_loss', np.float64),
+    ('take_profit', np.float64),
+    ('tp_pips', np.float64),
+    ('cluster_density', np.float64),
+    ('confidence', np.float64),
+    ('lot_size', np.float64),
+    ('pnl', np.float64),
+    ('bars_open', np.int64),
+    ('days_open', np.int64),
+])
+
+# Trade log CSV columns, in the order the engine has always written them
+CSV_COLUMNS = ('entry_idx', 'entry_price', 'entry_time', 'entry_bar_time', 'direction', 'signal',
+               'lot_size', 'stop_loss', 'take_profit', 'tp_pips', 'cluster_density', 'confidence',
+               'open_bars', 'exit_idx', 'exit_price', 'exit_type', 'exit_time', 'pnl', 'days_open',
+               'bars_open')
+
+
+def trade_records(result, times, confidence=None):
+    """
+    Structured trade log (TRADE_DTYPE) from run_core's trade arrays
+
+    Parameters:
+    -----------
+    result : dict
+        run_core / run_bars result
+    times : array
+        Bar times of the bars the run covered (datetime64)
+    confidence : array (optional)
+        Signal confidence of every bar (default 0)
+    """
+    entry_idx = result['entry_idx']
+    exit_idx = result['exit_idx']
+    times = np.asarray(times, dtype='datetime64[ns]')
+
+    trades = np.zeros(len(entry_idx), dtype=TRADE_DTYPE)
+    for name in ('entry_idx', 'exit_idx', 'exit_code', 'signal', 'entry_price', 'exit_price',
+                 'stop_loss', 'take_profit', 'tp_pips', 'cluster_density', 'lot_size', 'pnl'):
+        trades[name] = result[name]
+    trades['entry_time'] = times[entry_idx]
+    trades['exit_time'] = times[exit_idx]
+    if confidence is not None:
+        trades['confidence'] = np.asarray(confidence)[entry_idx]
+    trades['bars_open'] = exit_idx - entry_idx
+    days = times.astype('datetime64[D]').astype(np.int64)
+    trades['days_open'] = days[exit_idx] - days[entry_idx]
+    return trades
+
+
+def mark_to_market(result, close, initial_equity):
+    """
+    Per-bar equity of a single-position run: (equity, balance) arrays
+
+    balance is the realized equity (each trade's PnL booked on its exit
+    bar); equity adds the open PnL of the position held over the bar, at
+    the bar close. A position contributes from its entry bar up to the bar
+    before its exit; trades never overlap in backtest_core, so the position
+    of a bar is the last trade entered at or before it.
+    """
+    close = np.asarray(close, dtype=float)
+    n = len(close)
+    entry_idx = result['entry_idx']
+    exit_idx = result['exit_idx']
+
+    balance = np.bincount(exit_idx, weights=result['pnl'], minlength=n)
+    np.cumsum(balance, out=balance)
+    balance += initial_equity
+
+    # Trade held over each bar (-1: none entered yet)
+    bars = np.arange(n)
+    held = np.searchsorted(entry_idx, bars, side='right') - 1
+    is_open = held >= 0
+    is_open[is_open] = bars[is_open] < exit_idx[held[is_open]]
+
+    k = held[is_open]
+    side = np.where(result['signal'][k] == 1, 1.0, -1.0)
+    equity = balance.copy()
+    equity[is_open] += (close[is_open] - result['entry_price'][k]) * side * result['lot_size'][k] * PNL_MULTIPLIER
+    return equity, balance
+
+
+def trades_frame(trades):
+    """
+    Trade log DataFrame in the engine's CSV layout (direction / exit_type
+    as text; exit_idx, days_open and bars_open empty for 'END' trades)
+    """
+    closed = trades['exit_code'] != EXIT_END
+    frame = pd.DataFrame({
+        'entry_idx': trades['entry_idx'],
+        'entry_price': trades['entry_price'],
+        'entry_time': trades['entry_time'],
+        'entry_bar_time': trades['entry_time'],
+        'direction': np.where(trades['signal'] == 1, 'BUY', 'SELL'),
+        'signal': trades['signal'],
+        'lot_size': trades['lot_size'],
+        'stop_loss': trades['stop_loss'],
+        'take_profit': trades['take_profit'],
+        'tp_pips': trades['tp_pips'],
+        'cluster_density': trades['cluster_density'],
+        'confidence': trades['confidence'],
+        'open_bars': 0,
+        'exit_idx': trades['exit_idx'],
+        'exit_price': trades['exit_price'],
+        'exit_type': np.array(EXIT_TYPES)[trades['exit_code']],
+        'exit_time': trades['exit_time'],
+        'pnl': trades['pnl'],
+        'days_open': trades['days_open'],
+        'bars_open': trades['bars_open'],
+    }, columns=list(CSV_COLUMNS))
+
+    if not closed.all():
+        for name in ('exit_idx', 'days_open', 'bars_open'):
+            frame[name] = frame[name].where(closed)
+    return frame
+
+
+def save_trade_log(path, trades, **curves):
+    """Trade log and per-bar arrays (e.g. time, equity, balance) in one .npz file"""
+    np.savez(path, trades=trades, **curves)
+
+
+def load_trade_log(path):
+    """Arrays saved by save_trade_log as a dict (no pickled objects)"""
+    with np.load(path, allow_pickle=False) as data:
+        return {name: data[name] for name in data.files}